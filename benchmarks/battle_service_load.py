@@ -0,0 +1,182 @@
+"""
+Нагрузочный тест сервиса боев (см. game/service): шлет запросы с нескольких соединений, держа на каждом
+заданное число незаконченных запросов, и считает пропускную способность и задержки (p50, p99) до итога боя
+
+Запуск из корня проекта (--spawn сам поднимает сервис в отдельном процессе и гасит его в конце):
+    python -m benchmarks.battle_service_load --spawn --requests 2000 --connections 4 --in-flight 8
+    python -m benchmarks.battle_service_load --port 8765 --setup '{"units": [["pikeman", 0], ["archer", 22]]}'
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+from math import ceil
+from time import perf_counter
+from typing import Dict, List, Optional
+from game.service.battle_service import DEFAULT_HOST, DEFAULT_PORT
+
+
+DEFAULT_SETUP = {"units": [["pikeman", 0], ["archer", 22]], "width": 23}
+
+# Сколько ждать, пока поднятый сервис начнет принимать соединения
+SPAWN_TIMEOUT = 30.0
+
+
+def _get_percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # ближайший ранг: наименьшее значение, не меньше которого доля fraction всех значений
+    index = min(len(sorted_values) - 1, max(0, ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def _open_connection(arguments):
+    if arguments.unix is not None:
+        return await asyncio.open_unix_connection(arguments.unix, limit=1 << 20)
+    return await asyncio.open_connection(arguments.host, arguments.port, limit=1 << 20)
+
+
+async def _run_connection(arguments, connection: int, count: int, latencies: List[float], outcomes: Dict[str, int]):
+    """
+    Шлет count запросов по одному соединению, держа не больше in_flight незаконченных
+    :param arguments:
+    :param connection: номер соединения (часть id запросов и сидов)
+    :param count:
+    :param latencies: сюда пишутся задержки законченных боев, секунды
+    :param outcomes: счетчики итогов по событиям (result, error, timeout, cancelled)
+    :return:
+    """
+
+    reader, writer = await _open_connection(arguments)
+    in_flight = asyncio.Semaphore(arguments.in_flight)
+    sent_at: Dict[str, float] = {}
+
+    async def receive():
+        received = 0
+        while received < count:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError('Сервис закрыл соединение')
+            message = json.loads(line)
+            event = message.get('event')
+            if event == 'turn':
+                continue
+            started = sent_at.pop(message.get('id'), None)
+            if started is not None:
+                latencies.append(perf_counter() - started)
+                in_flight.release()
+            outcomes[event] = outcomes.get(event, 0) + 1
+            received += 1
+
+    receiver = asyncio.create_task(receive())
+    try:
+        for number in range(count):
+            await in_flight.acquire()
+            request_id = f'{connection}-{number}'
+            request = dict(arguments.setup, id=request_id, seed=connection * count + number, stream=arguments.stream)
+            if arguments.timeout is not None:
+                request['timeout'] = arguments.timeout
+            sent_at[request_id] = perf_counter()
+            writer.write(json.dumps(request).encode('utf-8') + b'\n')
+            await writer.drain()
+        await receiver
+    finally:
+        receiver.cancel()
+        writer.close()
+
+
+async def _wait_until_ready(arguments):
+    deadline = perf_counter() + SPAWN_TIMEOUT
+    while True:
+        try:
+            _, writer = await _open_connection(arguments)
+        except OSError:
+            if perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+        else:
+            writer.close()
+            return
+
+
+async def run(arguments) -> dict:
+    """
+    Прогоняет нагрузку и возвращает сводку
+    :param arguments:
+    :return: {"requests", "outcomes", "elapsed", "throughput", "latency_ms": {"p50", "p99", "max", "mean"}}
+    """
+
+    await _wait_until_ready(arguments)
+
+    per_connection = [
+        arguments.requests // arguments.connections + (1 if index < arguments.requests % arguments.connections else 0)
+        for index in range(arguments.connections)
+    ]
+    latencies: List[float] = []
+    outcomes: Dict[str, int] = {}
+
+    started = perf_counter()
+    await asyncio.gather(*[
+        _run_connection(arguments, connection, count, latencies, outcomes)
+        for connection, count in enumerate(per_connection) if count
+    ])
+    elapsed = perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": arguments.requests,
+        "outcomes": outcomes,
+        "elapsed": elapsed,
+        "throughput": arguments.requests / elapsed if elapsed else None,
+        "latency_ms": {
+            "p50": _get_percentile(latencies, 0.5) * 1000 if latencies else None,
+            "p99": _get_percentile(latencies, 0.99) * 1000 if latencies else None,
+            "max": latencies[-1] * 1000 if latencies else None,
+            "mean": sum(latencies) / len(latencies) * 1000 if latencies else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=DEFAULT_HOST, help='адрес TCP сервиса')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='порт TCP сервиса')
+    parser.add_argument('--unix', default=None, help='путь Unix-сокета сервиса (вместо TCP)')
+    parser.add_argument('--spawn', action='store_true', help='поднять сервис в отдельном процессе на время теста')
+    parser.add_argument('--workers', type=int, default=None, help='процессов поднятого сервиса (по умолчанию по числу ядер)')
+    parser.add_argument('--requests', type=int, default=1000, help='всего запросов')
+    parser.add_argument('--connections', type=int, default=4, help='число соединений')
+    parser.add_argument('--in-flight', type=int, default=8, help='незаконченных запросов на соединение')
+    parser.add_argument('--setup', type=json.loads, default=DEFAULT_SETUP, help='JSON раскладки боя (без id и seed)')
+    parser.add_argument('--stream', action='store_true', help='запрашивать события каждого хода')
+    parser.add_argument('--timeout', type=float, default=None, help='срок боя в запросе, секунды')
+    arguments = parser.parse_args()
+
+    server = None
+    if arguments.spawn:
+        command = [sys.executable, '-m', 'game.service']
+        if arguments.workers is not None:
+            command += ['--workers', str(arguments.workers)]
+        command += ['--unix', arguments.unix] if arguments.unix else ['--host', arguments.host, '--port', str(arguments.port)]
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+
+    try:
+        summary = asyncio.run(run(arguments))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps(summary, indent=2))
+    latency = summary["latency_ms"]
+    if latency["p50"] is not None:
+        print(
+            f"{summary['throughput']:.1f} battles/s, p50 {latency['p50']:.2f} ms, p99 {latency['p99']:.2f} ms",
+            file=sys.stderr
+        )
+
+
+if __name__ == '__main__':
+    main()
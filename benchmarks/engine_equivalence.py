@@ -0,0 +1,277 @@
+"""
+Статистическая проверка равенства движков: VectorizedBattleEngine и BatchSimulator (объектный BattleManager)
+играют одни и те же раскладки с фиксированными сидами и сравниваются между собой и с точным решением боя
+(CombatSolver, все раскладки - бои 1 на 1):
+    - доли побед и ничьих - в пределах z стандартных ошибок (биномиальных)
+    - распределение длины боя - критерием хи-квадрат по гистограмме ходов (двухвыборочным между движками
+      и согласия с точным распределением), на уровне значимости, равном двустороннему хвосту z
+
+Движки берут броски из разных генераторов, поэтому совпадать должны распределения, а не отдельные бои.
+Проверка падает (код выхода 1), если хоть одна метрика разошлась больше допуска.
+
+Запуск из корня проекта:
+    python -m benchmarks.engine_equivalence --battles 20000 --z 4
+"""
+
+import argparse
+import json
+import sys
+from math import erfc, exp, lgamma, log, sqrt
+from typing import Dict, List, Optional, Tuple
+from game.manager.batch_simulator import BatchSimulator, UnitSetup
+from game.manager.combat_solver import CombatSolver
+from game.manager.vectorized_battle_engine import VectorizedBattleEngine
+
+
+# Раскладки: (юниты, размер поля, ограничение ходов)
+SETUPS: List[Tuple[List[UnitSetup], int, Optional[int]]] = [
+    ([('pikeman', 0), ('archer', 22)], 23, None),
+    ([('archer', 0), ('pikeman', 22)], 23, None),
+    ([('pikeman', 3), ('archer', 8)], 12, None),
+    ([('pikeman', 0), ('pikeman', 1)], 2, None),
+    ([('archer', 0), ('archer', 30)], 31, None),
+    ([('pikeman', 0), ('archer', 22)], 23, 6),
+]
+
+# Ограничение ходов точного решения для раскладок без ограничения (бои этих раскладок намного короче)
+SOLVER_MAX_TURNS = 1000
+
+# Минимальное ожидаемое число боев в корзине гистограммы для критерия хи-квадрат
+MIN_EXPECTED = 5
+
+
+def _compare_rates(name: str, rate_a: float, rate_b: float, battles_a: int, battles_b: int, z: float) -> dict:
+    # стандартная ошибка разницы долей по общей доле (при нулевой разнице допуск нулевой: доли должны совпасть)
+    pooled = (rate_a * battles_a + rate_b * battles_b) / (battles_a + battles_b)
+    error = sqrt(pooled * (1 - pooled) * (1 / battles_a + 1 / battles_b))
+    return _verdict(name, rate_a, rate_b, error, z)
+
+
+def _compare_rate_to_exact(name: str, rate: float, exact: float, battles: int, z: float) -> dict:
+    # биномиальная ошибка доли при точной вероятности (исход с вероятностью 0 или 1 должен совпасть точно)
+    error = sqrt(exact * (1 - exact) / battles)
+    return _verdict(name, rate, exact, error, z)
+
+
+def _verdict(name: str, value_a: float, value_b: float, error: float, z: float) -> dict:
+    difference = abs(value_a - value_b)
+    return {
+        "metric": name,
+        "a": value_a,
+        "b": value_b,
+        "difference": difference,
+        "tolerance": z * error,
+        "ok": difference <= z * error + 1e-12,
+    }
+
+
+def _compare_histograms(name: str, counts_a: Dict[int, int], counts_b: Dict[int, int], z: float) -> dict:
+    # двухвыборочный хи-квадрат: соседние ходы сливаются в корзины, пока в корзине не наберется
+    # MIN_EXPECTED ожидаемых боев каждой выборки
+    battles_a, battles_b = sum(counts_a.values()), sum(counts_b.values())
+    share_a = battles_a / (battles_a + battles_b)
+    minimum = MIN_EXPECTED / min(share_a, 1 - share_a)
+
+    bins: List[List[int]] = []
+    pending = [0, 0]
+    for turns in sorted(set(counts_a) | set(counts_b)):
+        pending[0] += counts_a.get(turns, 0)
+        pending[1] += counts_b.get(turns, 0)
+        if sum(pending) >= minimum:
+            bins.append(pending)
+            pending = [0, 0]
+    if sum(pending):
+        if bins:
+            bins[-1] = [bins[-1][0] + pending[0], bins[-1][1] + pending[1]]
+        else:
+            bins.append(pending)
+
+    ratio_a, ratio_b = sqrt(battles_b / battles_a), sqrt(battles_a / battles_b)
+    statistic = sum((count_a * ratio_a - count_b * ratio_b) ** 2 / (count_a + count_b) for count_a, count_b in bins)
+    return _chi_square_verdict(name, statistic, len(bins) - 1, z)
+
+
+def _compare_histogram_to_exact(name: str, counts: Dict[int, int], distribution: Dict[int, float], z: float) -> dict:
+    # хи-квадрат согласия с точным распределением; бой на ходу, невозможном по точному решению, - сразу расхождение
+    battles = sum(counts.values())
+    if any(turns not in distribution for turns in counts):
+        return _chi_square_verdict(name, float('inf'), 0, z)
+
+    bins: List[List[float]] = []
+    pending = [0.0, 0.0]
+    for turns in sorted(distribution):
+        pending[0] += counts.get(turns, 0)
+        pending[1] += battles * distribution[turns]
+        if pending[1] >= MIN_EXPECTED:
+            bins.append(pending)
+            pending = [0.0, 0.0]
+    if pending[1]:
+        if bins:
+            bins[-1] = [bins[-1][0] + pending[0], bins[-1][1] + pending[1]]
+        else:
+            bins.append(pending)
+
+    statistic = sum((observed - expected) ** 2 / expected for observed, expected in bins)
+    return _chi_square_verdict(name, statistic, len(bins) - 1, z)
+
+
+def _chi_square_verdict(name: str, statistic: float, degrees: int, z: float) -> dict:
+    p_value = _chi_square_survival(statistic, degrees)
+    alpha = erfc(z / sqrt(2))
+    return {
+        "metric": name,
+        "chi_square": statistic,
+        "degrees": degrees,
+        "p_value": p_value,
+        "alpha": alpha,
+        "ok": p_value >= alpha,
+    }
+
+
+def _chi_square_survival(statistic: float, degrees: int) -> float:
+    """
+    Вероятность того, что хи-квадрат с degrees степенями свободы не меньше statistic
+    (регуляризованная верхняя неполная гамма-функция Q(degrees / 2, statistic / 2))
+    :param statistic:
+    :param degrees:
+    :return:
+    """
+
+    if statistic == float('inf'):
+        return 0.0
+    if degrees <= 0 or statistic <= 0:
+        return 1.0
+
+    a, x = degrees / 2, statistic / 2
+    scale = exp(a * log(x) - x - lgamma(a))
+
+    if x < a + 1:
+        # ряд для нижней функции P(a, x)
+        term = total = 1 / a
+        index = a
+        while term > total * 1e-15:
+            index += 1
+            term *= x / index
+            total += term
+        return max(0.0, 1 - total * scale)
+
+    # цепная дробь для Q(a, x) (метод Лентца)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    result = d
+    for index in range(1, 1000):
+        term = -index * (index - a)
+        b += 2
+        d = term * d + b
+        d = 1 / (d if abs(d) > tiny else tiny)
+        c = b + term / c
+        c = c if abs(c) > tiny else tiny
+        result *= d * c
+        if abs(d * c - 1) < 1e-15:
+            break
+    return min(1.0, result * scale)
+
+
+def check_setup(unit_setups: List[UnitSetup], field_size: int, max_turns: Optional[int], battles: int, seed: int,
+                processes: Optional[int], z: float) -> List[dict]:
+    """
+    Играет раскладку в обоих движках и сравнивает их метрики между собой и с точным решением боя
+    :param unit_setups:
+    :param field_size:
+    :param max_turns:
+    :param battles: боев в каждом движке
+    :param seed:
+    :param processes: процессов BatchSimulator
+    :param z: допуск в стандартных ошибках
+    :return: сравнения метрик (см. _verdict и _chi_square_verdict), в поле "pair" - что с чем сравнивалось
+    """
+
+    results = {
+        "object": BatchSimulator(
+            unit_setups, field_size, processes=processes, max_turns=max_turns, seed=seed
+        ).run(battles),
+        "vectorized": VectorizedBattleEngine(unit_setups, field_size, battles, max_turns=max_turns, seed=seed).run(),
+    }
+    (unit_a, position_a), (unit_b, position_b) = unit_setups
+    exact = CombatSolver(field_size, max_turns=max_turns or SOLVER_MAX_TURNS).solve(
+        unit_a, unit_b, position_a, position_b
+    )
+
+    object_result, vectorized_result = results["object"], results["vectorized"]
+    comparisons = [
+        _compare_rates(f"win_rate[{index}]", object_result["win_rates"][index], vectorized_result["win_rates"][index],
+                       battles, battles, z)
+        for index in range(len(unit_setups))
+    ]
+    comparisons.append(
+        _compare_rates("draw_rate", object_result["draw_rate"], vectorized_result["draw_rate"], battles, battles, z)
+    )
+    comparisons.append(_compare_histograms(
+        "turns_histogram", object_result["turns_histogram"], vectorized_result["turns_histogram"], z
+    ))
+    for comparison in comparisons:
+        comparison["pair"] = "object/vectorized"
+
+    for engine, result in results.items():
+        engine_comparisons = [
+            _compare_rate_to_exact(f"win_rate[{index}]", result["win_rates"][index], exact["win_rates"][index],
+                                   battles, z)
+            for index in range(len(unit_setups))
+        ]
+        engine_comparisons.append(_compare_rate_to_exact("draw_rate", result["draw_rate"], exact["draw_rate"], battles, z))
+        engine_comparisons.append(_compare_histogram_to_exact(
+            "turns_histogram", result["turns_histogram"], exact["turns_distribution"], z
+        ))
+        for comparison in engine_comparisons:
+            comparison["pair"] = f"{engine}/exact"
+        comparisons.extend(engine_comparisons)
+
+    return comparisons
+
+
+def _format(comparison: dict) -> str:
+    if "chi_square" in comparison:
+        return (
+            f"chi2 {comparison['chi_square']:10.2f} df {comparison['degrees']:3}"
+            f"  p {comparison['p_value']:.2g} >= {comparison['alpha']:.2g}"
+        )
+    return (
+        f"{comparison['a']:10.4f} {comparison['b']:10.4f}"
+        f"  diff {comparison['difference']:.4f} <= {comparison['tolerance']:.4f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--battles', type=int, default=20000, help='боев на раскладку в каждом движке')
+    parser.add_argument('--seed', type=int, default=0, help='сид серий')
+    parser.add_argument('--processes', type=int, default=None, help='процессов объектного движка')
+    parser.add_argument('--z', type=float, default=4.0, help='допуск в стандартных ошибках разницы')
+    arguments = parser.parse_args()
+
+    report = []
+    failures = 0
+    for unit_setups, field_size, max_turns in SETUPS:
+        comparisons = check_setup(
+            unit_setups, field_size, max_turns, arguments.battles, arguments.seed, arguments.processes, arguments.z
+        )
+        label = f"{unit_setups} field={field_size} max_turns={max_turns}"
+        for comparison in comparisons:
+            verdict = 'ok' if comparison["ok"] else 'MISMATCH'
+            failures += not comparison["ok"]
+            print(
+                f"{label:60} {comparison['pair']:18} {comparison['metric']:15} {_format(comparison)}  {verdict}",
+                file=sys.stderr
+            )
+        report.append({"setup": unit_setups, "field_size": field_size, "max_turns": max_turns, "metrics": comparisons})
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if failures:
+        print(f"Mismatches: {failures}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
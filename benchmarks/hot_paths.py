@@ -0,0 +1,334 @@
+"""
+Микробенчмарки горячих путей: поле, поиск позиции атаки, ход боя, создание юнитов, рендер и целые бои
+
+Все замеры идут с фиксированным сидом и раскладками, результат - JSON (время на операцию в микросекундах).
+Каждый бенчмарк меряется не меньше трех раз, сравниваются медианы замеров.
+Режим сравнения падает (код выхода 1), если какая-то метрика стала медленнее базовой больше чем на порог.
+Долгие бенчмарки (целый бой 1000 на 1000) запускаются только с флагом --slow.
+
+Запуск из корня проекта:
+    python -m benchmarks.hot_paths --output baseline.json
+    python -m benchmarks.hot_paths --compare baseline.json --threshold 0.2
+    python -m benchmarks.hot_paths --slow --filter battle. --output battles.json
+"""
+
+import argparse
+import io
+import json
+import platform
+import sys
+from contextlib import redirect_stdout
+from statistics import median
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# Бенчмарк: имя -> (функция подготовки, число вызовов в замере, число замеров, собственный порог или None, долгий ли).
+# Функция подготовки получает сид и возвращает функцию без аргументов, время вызова которой меряется
+BENCHMARKS: Dict[str, Tuple[Callable[[int], Callable[[], object]], int, int, Optional[float], bool]] = {}
+
+# Меньше трех замеров медиана не отличает выброс от регрессии
+MIN_REPEAT = 3
+
+
+def benchmark(name: str, number: int, repeat: int = 7, threshold: Optional[float] = None, slow: bool = False):
+    """
+    Регистрирует функцию подготовки бенчмарка
+
+    ValueError: если замеров меньше MIN_REPEAT
+    :param name:
+    :param number: вызовов в одном замере
+    :param repeat: сколько замеров делать
+    :param threshold: свой порог регрессии (для шумных бенчмарков), None - общий
+    :param slow: долгий бенчмарк, запускается только по запросу (--slow)
+    :return:
+    """
+
+    if repeat < MIN_REPEAT:
+        raise ValueError(f'Бенчмарку {name} нужно не меньше {MIN_REPEAT} замеров, подано {repeat}')
+
+    def register(setup: Callable[[int], Callable[[], object]]):
+        BENCHMARKS[name] = (setup, number, repeat, threshold, slow)
+        return setup
+
+    return register
+
+
+def _create_armies(count: int, width: int, height: int) -> Tuple['BattleField', list]:
+    """
+    Две армии по count юнитов (пикинеры и лучники через одного) в блоках у левого и правого края поля
+    :param count:
+    :param width:
+    :param height:
+    :return:
+    """
+
+    from game.field.battlefield import BattleField
+    from game.field.position import Position
+    from game.units.unit_factory import UnitFactory
+
+    battlefield = BattleField(width, height)
+    units = []
+    for team in (0, 1):
+        for index in range(count):
+            column, row = divmod(index, height)
+            x = column if team == 0 else width - 1 - column
+            unit = UnitFactory.create('pikeman' if index % 2 == 0 else 'archer', Position(x, row))
+            unit.team = team
+            units.append(unit)
+    battlefield.add_units(units)
+    return battlefield, units
+
+
+@benchmark('battlefield.move_unit', number=20000)
+def _setup_move_unit(seed: int):
+    from game.field.position import Position
+
+    battlefield, units = _create_armies(100, 40, 20)
+    unit = units[0]
+    # ходит туда-обратно между своей клеткой и свободной серединой поля
+    positions = (unit.position, Position(20, 10))
+    state = [0]
+
+    def run():
+        state[0] ^= 1
+        battlefield.move_unit(unit, positions[state[0]])
+
+    return run
+
+
+@benchmark('battlefield.is_position_available', number=50000)
+def _setup_is_position_available(seed: int):
+    from game.field.position import Position
+
+    battlefield, _ = _create_armies(100, 40, 20)
+    positions = [Position(x, y) for y in range(-1, 21) for x in range(-1, 41)]
+    state = [0]
+
+    def run():
+        index = state[0]
+        battlefield.is_position_available(positions[index])
+        state[0] = index + 1 if index + 1 < len(positions) else 0
+
+    return run
+
+
+@benchmark('unit.find_attack_position', number=5000)
+def _setup_find_attack_position(seed: int):
+    from game.field.position import Position
+
+    battlefield, units = _create_armies(100, 40, 20)
+    pikeman, archer = units[0], units[1]
+    targets = [units[100 + index] for index in range(0, 100, 7)]
+    battlefield.move_unit(pikeman, Position(20, 5))
+    battlefield.move_unit(archer, Position(22, 12))
+    state = [0]
+
+    def run():
+        index = state[0]
+        pikeman.find_attack_position(targets[index], battlefield)
+        archer.find_attack_position(targets[index], battlefield)
+        state[0] = index + 1 if index + 1 < len(targets) else 0
+
+    return run
+
+
+@benchmark('battle_manager.process_full_turn_100v100', number=2, repeat=5, threshold=0.25)
+def _setup_process_full_turn(seed: int):
+    from game.manager.battle_manager import BattleManager
+    from utils.random_stream import RandomStream
+
+    battlefield, units = _create_armies(100, 40, 20)
+    battle = BattleManager(battlefield, headless=True, rng=RandomStream(seed))
+    battle._add_units(units)
+    # армии сводятся на несколько ходов, чтобы мерить ход с боем, а не только с маршем
+    for _ in range(12):
+        battle.current_turn += 1
+        battle._process_full_turn()
+    state = battle.get_game_state()
+
+    def run():
+        battle.restore_game_state(state)
+        battle._process_full_turn()
+
+    return run
+
+
+@benchmark('unit_factory.create', number=20000)
+def _setup_unit_factory_create(seed: int):
+    from game.field.position import Position
+    from game.units.unit_factory import UnitFactory
+
+    UnitFactory.create('archer', Position(0))
+    position = Position(3, 4)
+    names = ('pikeman', 'archer')
+    state = [0]
+
+    def run():
+        state[0] ^= 1
+        UnitFactory.create(names[state[0]], position)
+
+    return run
+
+
+@benchmark('renderer.render_battlefield_40x20', number=500)
+def _setup_render_battlefield(seed: int):
+    from core.rendering.renderer import Renderer
+
+    battlefield, _ = _create_armies(100, 40, 20)
+    renderer = Renderer(battlefield)
+    output = io.StringIO()
+
+    def run():
+        with redirect_stdout(output):
+            renderer.render_battlefield()
+        output.seek(0)
+        output.truncate()
+
+    return run
+
+
+def _setup_battle(count: int, width: int, height: int, max_turns: Optional[int]):
+    def setup(seed: int):
+        from game.manager.battle_manager import BattleManager
+        from utils.random_stream import RandomStream
+
+        def run():
+            battlefield, units = _create_armies(count, width, height)
+            battle = BattleManager(battlefield, headless=True, max_turns=max_turns, rng=RandomStream(seed))
+            battle.run(*units)
+
+        return run
+
+    return setup
+
+
+@benchmark('battle.1v1', number=200, threshold=0.25)
+def _setup_battle_1v1(seed: int):
+    from game.field.battlefield import BattleField
+    from game.field.position import Position
+    from game.manager.battle_manager import BattleManager
+    from game.units.unit_factory import UnitFactory
+    from utils.random_stream import RandomStream
+
+    stream = RandomStream(seed)
+
+    def run():
+        units = [UnitFactory.create('pikeman', Position(0)), UnitFactory.create('archer', Position(22))]
+        battle = BattleManager(BattleField(23), headless=True, rng=RandomStream(stream.randint(0, 2 ** 31)))
+        battle.run(*units)
+
+    return run
+
+
+# Целые бои: первые ходы (марш) и последние (добивание одиночек) нагружают движок совсем иначе, чем середина боя.
+# Целый бой 1000v1000 идет около минуты на замер, поэтому он в долгой группе
+benchmark('battle.100v100', number=1, repeat=3, threshold=0.25)(_setup_battle(100, 40, 20, max_turns=None))
+benchmark('battle.300v300', number=1, repeat=3, threshold=0.25)(_setup_battle(300, 80, 30, max_turns=None))
+benchmark('battle.1000v1000', number=1, repeat=3, threshold=0.25, slow=True)(
+    _setup_battle(1000, 120, 50, max_turns=None)
+)
+
+
+def run(seed: int = 0, name_filter: Optional[str] = None, slow: bool = False) -> dict:
+    """
+    Прогоняет бенчмарки (с подстрокой name_filter в имени, если она подана)
+    :param seed:
+    :param name_filter:
+    :param slow: запускать ли и долгие бенчмарки
+    :return: {"meta": {...}, "results": {имя: {"min_us", "median_us", "number", "repeat"}}}
+    """
+
+    from core.logging.logger import set_logging_enabled
+    from game.units.unit_factory import UnitFactory
+
+    set_logging_enabled(False)
+    UnitFactory.preload_data()
+
+    results = {}
+    for name, (setup, number, repeat, _, is_slow) in BENCHMARKS.items():
+        if name_filter and name_filter not in name or is_slow and not slow:
+            continue
+        function = setup(seed)
+        if number > 1:
+            function()  # прогрев: ленивые кэши, таблица урона, поля расстояний (целые бои греть незачем)
+        timings = []
+        for _ in range(repeat):
+            started = perf_counter()
+            for _ in range(number):
+                function()
+            timings.append((perf_counter() - started) / number * 1e6)
+        results[name] = {
+            "min_us": min(timings),
+            "median_us": median(timings),
+            "number": number,
+            "repeat": repeat,
+        }
+        print(f"{name:45} {median(timings):14.2f} us", file=sys.stderr)
+
+    return {
+        "meta": {
+            "seed": seed,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Сравнивает результаты с базовыми по медиане замеров (median_us) и возвращает список регрессий
+    :param current:
+    :param baseline:
+    :param threshold: допустимое замедление (0.2 - на 20%), у шумных бенчмарков может быть свой порог
+    :return:
+    """
+
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        limit = BENCHMARKS[name][3] if name in BENCHMARKS and BENCHMARKS[name][3] is not None else threshold
+        ratio = result["median_us"] / base["median_us"]
+        verdict = 'REGRESSION' if ratio > 1 + limit else 'ok'
+        print(
+            f"{name:45} {base['median_us']:14.2f} -> {result['median_us']:14.2f} us  x{ratio:.2f}  {verdict}",
+            file=sys.stderr
+        )
+        if ratio > 1 + limit:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help='сид боев')
+    parser.add_argument('--filter', default=None, help='запускать только бенчмарки с этой подстрокой в имени')
+    parser.add_argument('--output', default=None, help='куда записать JSON (по умолчанию - в stdout)')
+    parser.add_argument('--compare', default=None, help='JSON с базовыми результатами для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.15, help='допустимое замедление (доля)')
+    parser.add_argument('--slow', action='store_true', help='запускать и долгие бенчмарки (целый бой 1000v1000)')
+    arguments = parser.parse_args()
+
+    results = run(arguments.seed, arguments.filter, arguments.slow)
+    text = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+    else:
+        print(text)
+
+    if arguments.compare:
+        with open(arguments.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, arguments.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Бенчмарк памяти: обычные юниты (UnitFactory.create) против юнитов из UnitPool
+
+Запуск из корня проекта:
+    python -m benchmarks.unit_memory --count 100000
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+from time import perf_counter
+from typing import Callable, List
+
+
+def _measure(create_units: Callable[[], list]) -> dict:
+    """
+    Память, выделенная на создание юнитов (без учета общих объектов, созданных заранее), и время создания
+    :param create_units:
+    :return:
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    started = perf_counter()
+    units = create_units()
+    elapsed = perf_counter() - started
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = perf_counter()
+    total = 0
+    for unit in units:
+        total += unit.health + unit.speed + unit.position.x
+    access_time = perf_counter() - started
+
+    return {
+        "bytes_total": allocated,
+        "bytes_per_unit": allocated / len(units),
+        "create_seconds": elapsed,
+        "access_seconds": access_time,
+    }
+
+
+def run(count: int, unit_names: List[str]) -> dict:
+    from core.logging.logger import set_logging_enabled
+    from game.field.position import Position
+    from game.units.unit_factory import UnitFactory
+    from game.units.unit_pool import UnitPool
+
+    set_logging_enabled(False)
+
+    # общие объекты (каталог, позиции, классы описателей) создаются до замеров
+    positions = [Position(index % 1000, index // 1000) for index in range(count)]
+    warmup_pool = UnitPool()
+    for unit_name in unit_names:
+        UnitFactory.create(unit_name, positions[0])
+        warmup_pool.create(unit_name, positions[0])
+
+    def create_objects():
+        return [UnitFactory.create(unit_names[index % len(unit_names)], positions[index]) for index in range(count)]
+
+    def create_pooled():
+        pool = UnitPool()
+        return [pool.create(unit_names[index % len(unit_names)], positions[index]) for index in range(count)]
+
+    objects = _measure(create_objects)
+    pooled = _measure(create_pooled)
+    return {
+        "count": count,
+        "units": unit_names,
+        "objects": objects,
+        "pool": pooled,
+        "memory_ratio": objects["bytes_total"] / pooled["bytes_total"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000, help='сколько юнитов создавать')
+    parser.add_argument('--units', nargs='+', default=['pikeman', 'archer'], help='ключи юнитов в JSON')
+    arguments = parser.parse_args()
+    print(json.dumps(run(arguments.count, arguments.units), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+from .instrumentation import Instrumentation, Histogram, SamplingProfiler, PHASES, LATENCY_BUCKETS
@@ -0,0 +1,308 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from core.logging.logger import Logger
+from utils.data_functions import write_file_atomically
+
+
+logger = Logger(__name__)
+
+
+# Фазы боя, по которым копится время
+PHASES = ('target_selection', 'attack', 'movement', 'rendering', 'logging')
+
+# Границы корзин гистограмм задержек в секундах (как у клиентов Prometheus, с запасом вниз для быстрых ходов)
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0
+)
+
+
+class Histogram:
+    """
+    Класс гистограммы с фиксированными корзинами (накопленная сумма и число наблюдений тоже хранятся)
+    """
+
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя корзина - больше всех границ (+Inf)
+        self.total = 0.0
+        self.count = 0
+
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+    def merge(self, other: 'Histogram'):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.count += other.count
+
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """
+        Накопленные счетчики по верхним границам корзин (последняя граница - бесконечность)
+        :return:
+        """
+
+        result = []
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+
+class SamplingProfiler:
+    """
+    Класс семплирующего профайлера
+
+    Фоновый поток раз в interval секунд смотрит стек наблюдаемого потока и считает, сколько раз встретился
+    каждый стек. Накладные расходы не зависят от числа вызовов функций, в отличие от cProfile.
+    Результат - стеки в свернутом виде ("файл:функция;...;файл:функция" -> число попаданий), его понимают flamegraph-утилиты
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='SamplingProfiler', daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+
+class Instrumentation:
+    """
+    Класс инструментирования боя: таймеры фаз, счетчики, гистограммы задержек и профилирование
+
+    BattleManager (и его поле) сообщают сюда, если им подан объект инструментирования, иначе в горячих путях
+    остается только проверка на None, поэтому хуки можно не выключать в продакшене.
+
+    Фазы (PHASES): выбор цели (решение политики без поиска пути), разрешение атаки, перемещение вместе с поиском
+    пути (BattleField.find_path_towards), рендер и запись логов.
+    Время логов считается внутри остальных фаз тоже, то есть фазы могут пересекаться.
+    Счетчики: атаки, перемещения, неудачные проверки BattleField.is_position_available, созданные юниты
+    (если объект подан в UnitFactory.instrumentation), сыгранные бои и ходы.
+    Гистограммы: задержка полного хода и хода одного юнита.
+
+    profile='cprofile' или 'sampling' включает профилирование каждого боя (см. get_profile_report).
+    Объект не потокобезопасен: параллельным боям стоит давать по своему объекту и складывать их через merge()
+    """
+
+    def __init__(self, profile: Optional[str] = None, sampling_interval: float = 0.005):
+        if profile not in (None, 'cprofile', 'sampling'):
+            raise ValueError(f'Неизвестный режим профилирования: {profile}')
+
+        self.profile = profile
+        self.sampling_interval = sampling_interval
+        self.timers: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._profiler: Optional[Union[cProfile.Profile, SamplingProfiler]] = None
+        self._cprofile_stats: Optional[pstats.Stats] = None
+        self._samples: Counter = Counter()
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def add_time(self, phase: str, seconds: float):
+        self.timers[phase] = self.timers.get(phase, 0.0) + seconds
+
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def observe(self, name: str, value: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+
+    def start_battle(self):
+        """
+        Начало боя: включает профайлер и подключает таймер логов (вызывает BattleManager.run)
+        :return:
+        """
+
+        self.count('battles')
+        Logger.timer = self._add_logging_time
+        if self.profile == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == 'sampling':
+            self._profiler = SamplingProfiler(self.sampling_interval)
+            self._profiler.start()
+
+
+    def finish_battle(self):
+        """
+        Конец боя: выключает профайлер и копит его результаты
+        :return:
+        """
+
+        if Logger.timer == self._add_logging_time:
+            Logger.timer = None
+        profiler, self._profiler = self._profiler, None
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            if self._cprofile_stats is None:
+                self._cprofile_stats = pstats.Stats(profiler)
+            else:
+                self._cprofile_stats.add(profiler)
+        elif isinstance(profiler, SamplingProfiler):
+            profiler.stop()
+            self._samples.update(profiler.samples)
+
+
+    def _add_logging_time(self, seconds: float):
+        self.timers['logging'] += seconds
+
+
+    def merge(self, other: 'Instrumentation'):
+        """
+        Складывает с текущими показателями показатели другого объекта (например, из другого потока или процесса)
+        :param other:
+        :return:
+        """
+
+        for phase, seconds in other.timers.items():
+            self.add_time(phase, seconds)
+        for name, value in other.counters.items():
+            self.count(name, value)
+        for name, histogram in other.histograms.items():
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(histogram.buckets)
+            self.histograms[name].merge(histogram)
+        self._samples.update(other._samples)
+
+
+    def reset(self):
+        self.timers = dict.fromkeys(PHASES, 0.0)
+        self.counters = {}
+        self.histograms = {}
+        self._cprofile_stats = None
+        self._samples = Counter()
+
+
+    def snapshot(self) -> dict:
+        """
+        Текущие показатели в виде словаря, пригодного для JSON
+        :return:
+        """
+
+        return {
+            "timers": dict(self.timers),
+            "counters": dict(self.counters),
+            "histograms": {
+                name: {
+                    "buckets": [[bound if bound != float('inf') else "+Inf", count]
+                                for bound, count in histogram.cumulative()],
+                    "sum": histogram.total,
+                    "count": histogram.count,
+                }
+                for name, histogram in self.histograms.items()
+            },
+        }
+
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+
+    def to_prometheus(self, prefix: str = 'battlehex') -> str:
+        """
+        Показатели в текстовом формате Prometheus
+        :param prefix: префикс имен метрик
+        :return:
+        """
+
+        lines = [
+            f"# HELP {prefix}_phase_seconds_total Wall-clock time spent in battle phases",
+            f"# TYPE {prefix}_phase_seconds_total counter",
+        ]
+        for phase, seconds in self.timers.items():
+            lines.append(f'{prefix}_phase_seconds_total{{phase="{phase}"}} {seconds!r}')
+
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for bound, count in histogram.cumulative():
+                label = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{prefix}_{name}_bucket{{le="{label}"}} {count}')
+            lines.append(f"{prefix}_{name}_sum {histogram.total!r}")
+            lines.append(f"{prefix}_{name}_count {histogram.count}")
+
+        return '\n'.join(lines) + '\n'
+
+
+    def write_prometheus(self, path: Union[str, Path], prefix: str = 'battlehex'):
+        """
+        Атомарно пишет показатели в файл (формат textfile-коллектора node_exporter)
+        :param path:
+        :param prefix:
+        :return:
+        """
+
+        write_file_atomically(path, self.to_prometheus(prefix))
+
+
+    def get_profile_report(self, limit: int = 30) -> str:
+        """
+        Отчет профайлера по всем боям: таблица pstats (cprofile) или свернутые стеки (sampling)
+        :param limit: сколько строк таблицы pstats выводить
+        :return:
+        """
+
+        if self.profile == 'cprofile':
+            if self._cprofile_stats is None:
+                return ''
+            output = io.StringIO()
+            self._cprofile_stats.stream = output
+            self._cprofile_stats.sort_stats('cumulative').print_stats(limit)
+            return output.getvalue()
+        if self.profile == 'sampling':
+            return '\n'.join(f"{stack} {count}" for stack, count in self._samples.most_common())
+        return ''
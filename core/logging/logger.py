@@ -1,14 +1,35 @@
+import atexit
 import logging
 import os
+import queue
+import threading
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from time import perf_counter
+from typing import Callable, Iterator, Optional
 
 
 class Logger:
     """
     Класс логгера
 
-    На данный момент в зачаточном состоянии, умеет приблизительно ничего интересного (и не используется)
+    Обертка над logging.Logger, которая пишет в единый на процесс конвейер логов (см. LoggingPipeline).
+
+    Сообщения ленивые: принимается строка в %-стиле с аргументами или функция без аргументов, возвращающая строку.
+    Уровень проверяется до форматирования, поэтому отсеянные сообщения не форматируются вовсе. Аргументы
+    подставляются в сообщение в вызывающем потоке (как в обычном QueueHandler), чтобы в лог попало их состояние
+    на момент вызова, а оформление строки и запись в файл происходят в фоновом потоке.
+    Пока логирование выключено (set_logging_enabled(False)), методы логгера подменяются на пустую функцию
     """
 
+    # Все созданные логгеры, чтобы включать и выключать их разом
+    _instances: 'weakref.WeakSet[Logger]' = weakref.WeakSet()
+
+    # Получает время каждой записи в лог, пока идет инструментированный бой (см. Instrumentation)
+    timer: Optional[Callable[[float], None]] = None
+
     def __init__(
             self,
             name=__name__,
@@ -21,46 +42,264 @@ class Logger:
         self.logger = logging.getLogger(name)
         self.logger.setLevel(level)
 
-        if clear_log and log_file and os.path.exists(log_file):
-            with open(log_file, 'w', encoding='utf-8') as f:
-                f.write('')
+        pipeline = LoggingPipeline.get_instance(
+            log_file=log_file,
+            add_console_logs=add_console_logs,
+            clear_log=clear_log
+        )
+        pipeline.attach(self.logger)
+
+        Logger._instances.add(self)
+        if not LoggingPipeline.enabled:
+            self._mute()
+
+
+    def _mute(self):
+        """
+        Подменяет методы логирования на пустую функцию
+        :return:
+        """
+
+        self.info = self.warning = self.error = self.debug = _noop
+
+
+    def _unmute(self):
+        """
+        Возвращает методы логирования класса
+        :return:
+        """
+
+        for method_name in ('info', 'warning', 'error', 'debug'):
+            self.__dict__.pop(method_name, None)
+
+
+    def _log(self, level, message, args):
+        timer = Logger.timer
+        started = perf_counter() if timer is not None else 0.0
+        if self.logger.isEnabledFor(level):
+            if callable(message):
+                message = message()
+            self.logger.log(level, message, *args)
+        if timer is not None:
+            timer(perf_counter() - started)
+
+
+    def info(self, message, *args):
+        self._log(logging.INFO, message, args)
+
+
+    def warning(self, message, *args):
+        self._log(logging.WARNING, message, args)
+
+
+    def error(self, message, *args):
+        self._log(logging.ERROR, message, args)
+
+
+    def debug(self, message, *args):
+        self._log(logging.DEBUG, message, args)
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+def set_logging_enabled(enabled: bool):
+    """
+    Включает или выключает логирование всех логгеров пакета (Logger) в процессе.
+    Остальные логгеры процесса (asyncio, multiprocessing и т.п.) не трогаются.
+
+    Выключенные логгеры не проверяют уровень и не трогают аргументы, каждый вызов - пустая функция
+    :param enabled:
+    :return:
+    """
+
+    LoggingPipeline.enabled = enabled
+    for instance in list(Logger._instances):
+        if enabled:
+            instance._unmute()
+        else:
+            instance._mute()
+
+
+def is_logging_enabled() -> bool:
+    return LoggingPipeline.enabled
+
+
+@contextmanager
+def logging_disabled(disabled: bool = True) -> Iterator[None]:
+    """
+    Глушит логгеры пакета на время блока и возвращает прежнее состояние при выходе (даже по исключению)
+
+    Блоки считаются: логи глушит первый вошедший блок, а прежнее состояние возвращает последний вышедший,
+    поэтому блоки, которые пересекаются в разных потоках, не оставляют логирование выключенным
+    :param disabled: False - блок выполняется без изменения логирования
+    :return:
+    """
+
+    global _muted_blocks, _enabled_before_mute
+
+    if not disabled:
+        yield
+        return
+
+    with _mute_lock:
+        if not _muted_blocks:
+            _enabled_before_mute = is_logging_enabled()
+            set_logging_enabled(False)
+        _muted_blocks += 1
+    try:
+        yield
+    finally:
+        with _mute_lock:
+            _muted_blocks -= 1
+            if not _muted_blocks:
+                set_logging_enabled(_enabled_before_mute)
+
+
+# Число открытых блоков logging_disabled и состояние логирования до первого из них
+_mute_lock = threading.Lock()
+_muted_blocks = 0
+_enabled_before_mute = True
+
+
+class RingBufferQueue(queue.Queue):
+    """
+    Очередь с ограниченной емкостью, которая при переполнении выбрасывает самые старые записи
+
+    Запись в лог никогда не блокирует симуляцию, даже если фоновый поток не успевает писать
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.dropped = 0
+        super().__init__()
+
+
+    def _init(self, maxsize):
+        self.queue = deque(maxlen=self.capacity)
+
+
+    def _put(self, item):
+        if len(self.queue) == self.capacity:
+            self.dropped += 1
+        self.queue.append(item)
+
+
+class LoggingPipeline:
+    """
+    Класс единого на процесс конвейера логов
+
+    Логгеры кладут записи в кольцевой буфер (RingBufferQueue) через QueueHandler,
+    а фоновый QueueListener форматирует их кастомным Formatter и пишет в файл и, при необходимости, в консоль.
+
+    Файл лога очищается один раз при создании конвейера, а не при создании каждого логгера.
+    После fork в дочернем процессе конвейер перезапускается с пустым буфером
+    """
+
+    _instance: Optional['LoggingPipeline'] = None
+    enabled = True
+
+    def __init__(self, log_file='logs/app.log', add_console_logs=False, clear_log=True, buffer_size=65536):
+        self.buffer_size = buffer_size
+        self.handlers = []
+        formatter = Formatter()
+
+        # Консольный обработчик
+        if add_console_logs:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+            self.handlers.append(console_handler)
+
+        # Файловый обработчик
+        if log_file:
+            log_dir = os.path.dirname(log_file)
+            if log_dir and not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+
+            file_handler = logging.FileHandler(log_file, mode='w' if clear_log else 'a', encoding='utf-8')
+            file_handler.setFormatter(formatter)
+            self.handlers.append(file_handler)
+
+        self.queue_handler = QueueHandler(RingBufferQueue(buffer_size))
+        self.listener: Optional[QueueListener] = None
+        self._start()
+
+
+    @classmethod
+    def get_instance(cls, **kwargs) -> 'LoggingPipeline':
+        """
+        Возвращает конвейер процесса, создавая его при первом обращении (параметры учитываются только тогда)
+        :param kwargs:
+        :return:
+        """
+
+        if cls._instance is None:
+            cls._instance = cls(**kwargs)
+        return cls._instance
+
+
+    def attach(self, logger: logging.Logger):
+        """
+        Подключает logging.Logger к конвейеру
+        :param logger:
+        :return:
+        """
+
+        if self.queue_handler not in logger.handlers:
+            logger.addHandler(self.queue_handler)
+
+
+    def flush(self):
+        """
+        Дожидается записи всех накопленных сообщений
+        :return:
+        """
+
+        self.stop()
+        self._start()
+
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        for handler in self.handlers:
+            handler.flush()
 
-        if not self.logger.handlers:
-            formatter = Formatter()
 
-            # Консольный обработчик
-            if add_console_logs:
-                console_handler = logging.StreamHandler()
-                console_handler.setLevel(level)
-                console_handler.setFormatter(formatter)
-                self.logger.addHandler(console_handler)
+    def _start(self):
+        self.listener = QueueListener(self.queue_handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
 
-            # Файловый обработчик
-            if log_file:
-                log_dir = os.path.dirname(log_file)
-                if log_dir and not os.path.exists(log_dir):
-                    os.makedirs(log_dir)
 
-                file_handler = logging.FileHandler(log_file, encoding='utf-8')
-                file_handler.setLevel(level)
-                file_handler.setFormatter(formatter)
-                self.logger.addHandler(file_handler)
+    def _restart_in_child(self):
+        """
+        Поток-писатель не переживает fork, поэтому в дочернем процессе поднимается новый с пустым буфером
+        :return:
+        """
 
+        self.queue_handler.queue = RingBufferQueue(self.buffer_size)
+        self._start()
 
-    def info(self, message):
-        self.logger.info(message)
 
+def _stop_pipeline():
+    if LoggingPipeline._instance is not None:
+        LoggingPipeline._instance.stop()
 
-    def warning(self, message):
-        self.logger.warning(message)
 
+def _restart_pipeline_in_child():
+    global _mute_lock, _muted_blocks
 
-    def error(self, message):
-        self.logger.error(message)
+    # блоки logging_disabled остались в родителе, а состояние логирования дочерний процесс наследует как есть
+    _mute_lock = threading.Lock()
+    _muted_blocks = 0
+    if LoggingPipeline._instance is not None:
+        LoggingPipeline._instance._restart_in_child()
 
 
-    def debug(self, message):
-        self.logger.debug(message)
+atexit.register(_stop_pipeline)
+os.register_at_fork(after_in_child=_restart_pipeline_in_child)
 
 
 class Formatter(logging.Formatter):
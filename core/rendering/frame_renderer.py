@@ -0,0 +1,264 @@
+import sys
+from time import perf_counter
+from typing import TYPE_CHECKING, List, Optional, TextIO
+from core.logging.logger import Logger
+
+
+logger = Logger(__name__)
+
+if TYPE_CHECKING:
+    from game.field.battlefield import BattleField
+    from game.units.base_units import Unit
+
+
+# Управляющие последовательности ANSI
+_CLEAR_LINE = '\x1b[2K'
+_CLEAR_BELOW = '\x1b[J'
+_NEXT_LINE = '\x1b[E'
+
+
+class FrameRenderer:
+    """
+    Класс покадрового консольного рендерера
+
+    Реализует тот же интерфейс, что и Renderer, но ничего не печатает сразу: весь вывод хода собирается в кадр
+    (номер хода, поле, полоски здоровья, действия юнитов) и пишется в поток одним вызовом write.
+
+    Режимы:
+        - in_place: кадр перерисовывается на месте предыдущего при помощи ANSI-последовательностей,
+          переписываются только изменившиеся строки, а в строках поля - только изменившиеся клетки
+        - render_every: рисуется только каждый N-й ход
+        - max_fps: кадры, пришедшие раньше 1 / max_fps после предыдущего, пропускаются (симуляция их не ждет)
+
+    Последний ход боя рисуется всегда, даже если его кадр был пропущен.
+    Ширина иконки клетки в консоли считается равной cell_width колонкам (эмодзи занимают две)
+    """
+
+    def __init__(
+            self,
+            battlefield: 'BattleField',
+            stream: Optional[TextIO] = None,
+            in_place: bool = True,
+            render_every: int = 1,
+            max_fps: Optional[float] = None,
+            cell_width: int = 2
+    ):
+        self.battlefield = battlefield
+        self.stream = stream or sys.stdout
+        self.in_place = in_place
+        self.render_every = render_every
+        self.min_frame_interval = 1 / max_fps if max_fps else 0
+        self.cell_width = cell_width
+
+        self._turn = 0
+        self._hp_lines: List[str] = []
+        self._action_lines: List[str] = []
+        self._field_rows: Optional[List[List[str]]] = None
+
+        self._previous_lines: List[str] = []
+        self._previous_field_rows: List[List[str]] = []
+        self._pending_frame = None
+        self._last_frame_time: Optional[float] = None
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def render_start_info(self, unit_left: 'Unit', unit_right: 'Unit'):
+        """
+        Выводит стартовую информацию о бое (без перерисовки на месте, она остается над кадрами)
+        :return:
+        """
+
+        lines = [
+            '================== НАЧАЛО БИТВЫ ==================',
+            f"В левом углу полоски: {unit_left.name}",
+            f"В правом углу полоски: {unit_right.name}",
+        ]
+        lines.extend(self._build_field_line(y, row) for y, row in enumerate(self._collect_field_rows()))
+        lines.append("=" * 50)
+        self._write('\n'.join(lines) + '\n')
+        logger.info('Start message rendered')
+
+
+    def render_end_info(self, winner: Optional['Unit']):
+        """
+        Дорисовывает последний кадр, если он был пропущен, и выводит результат боя
+        :return:
+        """
+
+        buffer = []
+        if self._pending_frame is not None:
+            buffer.append(self._compose(*self._pending_frame))
+            self._pending_frame = None
+
+        buffer.append('================= БИТВА ОКОНЧЕНА =================\n')
+        buffer.append("Ничья\n" if winner is None else f"Победитель: {winner.name}\n")
+        buffer.append("=" * 50 + '\n')
+        self._write(''.join(buffer))
+
+        # после итогов кадр больше не перерисовывается на месте
+        self._previous_lines = []
+        self._previous_field_rows = []
+        logger.info('End message rendered')
+
+
+    def render_turn_number(self, turn_number: int):
+        """
+        Начинает новый кадр
+        :param turn_number:
+        :return:
+        """
+
+        self._turn = turn_number
+        self._hp_lines = []
+        self._action_lines = []
+        self._field_rows = None
+
+
+    def render_battlefield(self):
+        """
+        Запоминает содержимое клеток поля для текущего кадра
+        :return:
+        """
+
+        self._field_rows = self._collect_field_rows()
+
+
+    def render_unit_action(self, action: str, unit: 'Unit', target: 'Unit'=None, damage: int=None, distance: int=None):
+        """
+        Добавляет в кадр строку о действии юнита
+        :return:
+        """
+
+        if action == 'move':
+            self._action_lines.append(f"Юнит {unit.name} двигается на {distance}")
+        elif action == 'attack':
+            self._action_lines.append(f"Юнит {unit.name} атакует юнита {target.name} и наносит {damage} урона")
+
+
+    def render_hp_bars(self, unit: 'Unit', length=10):
+        """
+        Добавляет в кадр полоску здоровья юнита
+        :return:
+        """
+
+        ratio = unit.health / unit.max_health
+        filled = int(length * ratio)
+        bar = '▮' * filled + '▯' * (length - filled)
+        self._hp_lines.append(f"{unit.name}: {bar} ({unit.health}/{unit.max_health})")
+
+
+    def render_turns_separator(self):
+        """
+        Завершает кадр хода и выводит его, если он не попал под пропуск
+        :return:
+        """
+
+        if self._field_rows is None:
+            self._field_rows = self._collect_field_rows()
+
+        frame = ([f"ХОД {self._turn}"], self._field_rows, self._hp_lines + self._action_lines + ['-' * 50])
+
+        now = perf_counter()
+        too_early = self._last_frame_time is not None and now - self._last_frame_time < self.min_frame_interval
+        if self._turn % self.render_every != 0 or too_early:
+            self._pending_frame = frame
+            return
+
+        self._pending_frame = None
+        self._last_frame_time = now
+        self._write(self._compose(*frame))
+        logger.debug("Frame for turn %d rendered", self._turn)
+
+
+    def _collect_field_rows(self) -> List[List[str]]:
+        """
+        Иконки клеток поля по рядам
+        :return:
+        """
+
+        battlefield = self.battlefield
+        width = battlefield.width
+        icon = battlefield.icon
+        cells = battlefield.cells
+        return [
+            [icon if unit is None else unit.icon for unit in cells[y * width:(y + 1) * width]]
+            for y in range(battlefield.height)
+        ]
+
+
+    @staticmethod
+    def _build_field_line(y: int, row: List[str]) -> str:
+        return ' ' * (3 * y // 2) + "|" + "|".join(row) + "|"
+
+
+    def _compose(self, header: List[str], field_rows: List[List[str]], footer: List[str]) -> str:
+        """
+        Собирает текст кадра. В режиме in_place - только изменения относительно предыдущего кадра
+        :param header:
+        :param field_rows:
+        :param footer:
+        :return:
+        """
+
+        lines = header + [self._build_field_line(y, row) for y, row in enumerate(field_rows)] + footer
+
+        if not self.in_place or not self._previous_lines:
+            self._previous_lines = lines
+            self._previous_field_rows = field_rows
+            return '\n'.join(lines) + '\n'
+
+        previous_lines = self._previous_lines
+        field_start = len(header)
+        field_end = field_start + len(field_rows)
+
+        # курсор стоит под предыдущим кадром: поднимаемся в его первую строку
+        buffer = [f'\x1b[{len(previous_lines)}F']
+        for index, line in enumerate(lines):
+            if index >= len(previous_lines):
+                buffer.append(line + '\n')
+            elif line == previous_lines[index]:
+                buffer.append(_NEXT_LINE)
+            elif field_start <= index < field_end and len(self._previous_field_rows) == len(field_rows):
+                buffer.append(self._diff_field_row(
+                    index - field_start, self._previous_field_rows[index - field_start], field_rows[index - field_start]
+                ))
+                buffer.append(_NEXT_LINE)
+            else:
+                buffer.append(_CLEAR_LINE + line + '\n')
+
+        if len(lines) < len(previous_lines):
+            buffer.append(_CLEAR_BELOW)
+
+        self._previous_lines = lines
+        self._previous_field_rows = field_rows
+        return ''.join(buffer)
+
+
+    def _diff_field_row(self, y: int, previous_row: List[str], row: List[str]) -> str:
+        """
+        Переписывает в строке поля только изменившиеся клетки (курсор в начале строки и там же остается)
+        :param y:
+        :param previous_row:
+        :param row:
+        :return:
+        """
+
+        buffer = []
+        # колонка клетки x (с единицы): отступ ряда, "|" и по cell_width + 1 колонок на каждую предыдущую клетку
+        row_offset = 3 * y // 2 + 2
+        for x, (previous_icon, icon) in enumerate(zip(previous_row, row)):
+            if icon != previous_icon:
+                buffer.append(f'\x1b[{row_offset + x * (self.cell_width + 1)}G{icon}')
+        buffer.append('\r')
+        return ''.join(buffer)
+
+
+    def _write(self, text: str):
+        """
+        Пишет текст в поток одним вызовом
+        :param text:
+        :return:
+        """
+
+        self.stream.write(text)
+        self.stream.flush()
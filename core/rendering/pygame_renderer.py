@@ -0,0 +1,354 @@
+import os
+import queue
+import threading
+from math import sqrt
+from time import perf_counter, sleep
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from zlib import crc32
+from core.logging.logger import Logger
+
+
+logger = Logger(__name__)
+
+if TYPE_CHECKING:
+    from game.field.battlefield import BattleField
+    from game.units.base_units import Unit
+
+
+_BACKGROUND_COLOR = (30, 30, 36)
+_TILE_COLOR = (214, 190, 92)
+_TILE_BORDER_COLOR = (120, 100, 40)
+_TEXT_COLOR = (235, 235, 235)
+_HP_BACK_COLOR = (70, 20, 20)
+_HP_COLOR = (60, 200, 80)
+_STATUS_LINES = 4
+
+
+class PygameRenderer:
+    """
+    Класс графического рендерера на pygame
+
+    Реализует тот же интерфейс, что и Renderer. Вызовы из BattleManager ничего не рисуют: в конце каждого хода
+    рендерер снимает слепок состояния поля и кладет его в ограниченную очередь, не блокируясь
+    (если очередь полна, выбрасывается самый старый слепок). Отдельный цикл рисования забирает из очереди
+    самый свежий слепок и перерисовывает только изменившиеся клетки (dirty rects).
+
+    Симуляция идет со своей частотой tick_rate (ходов в секунду, None - без ограничения),
+    а цикл рисования - со своей частотой fps, поэтому медленный кадр никогда не тормозит бой.
+
+    Гексы и значки юнитов рисуются один раз и дальше берутся из кэша поверхностей.
+    Для работы без дисплея (CI, бенчмарки) нужно подать video_driver='dummy'.
+
+    Цикл рисования запускается в отдельном потоке через start() или в текущем потоке через run_loop()
+    (на macOS окно можно создавать только из главного потока, тогда бой нужно запускать в другом)
+    """
+
+    def __init__(
+            self,
+            battlefield: 'BattleField',
+            fps: int = 60,
+            tick_rate: Optional[float] = None,
+            hex_size: int = 24,
+            queue_size: int = 8,
+            video_driver: Optional[str] = None
+    ):
+        self.battlefield = battlefield
+        self.fps = fps
+        self.tick_interval = 1 / tick_rate if tick_rate else 0
+        self.hex_size = hex_size
+        self.video_driver = video_driver
+
+        self._snapshots: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._title = ''
+        self._turn = 0
+        self._actions: List[str] = []
+        self._result: Optional[str] = None
+        self._last_tick: Optional[float] = None
+
+        self._stop_requested = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.frames_rendered = 0
+        self.snapshots_dropped = 0
+
+        # геометрия: гексы с острой вершиной вверх, осевые координаты
+        self._hex_width = int(sqrt(3) * hex_size)
+        self._hex_height = 2 * hex_size
+        self._cell_origins = [
+            self._cell_origin(x, y) for y in range(battlefield.height) for x in range(battlefield.width)
+        ]
+        field_width = max(origin[0] for origin in self._cell_origins) + self._hex_width + hex_size
+        field_height = max(origin[1] for origin in self._cell_origins) + self._hex_height + hex_size
+        self._font_size = max(14, hex_size * 2 // 3)
+        self._status_top = field_height
+        self._screen_size = (max(field_width, 480), field_height + _STATUS_LINES * (self._font_size + 4) + 8)
+
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def _cell_origin(self, x: int, y: int) -> Tuple[int, int]:
+        return (
+            int(self.hex_size / 2 + self._hex_width * (x + y / 2)),
+            int(self.hex_size / 2 + self.hex_size * 1.5 * y)
+        )
+
+
+    # ------------------------------------------------------------------ интерфейс Renderer (поток симуляции)
+
+    def render_start_info(self, unit_left: 'Unit', unit_right: 'Unit'):
+        self._title = f"{unit_left.name} vs {unit_right.name}"
+        self._publish()
+        logger.info('Start message rendered')
+
+
+    def render_end_info(self, winner: Optional['Unit']):
+        self._result = "Ничья" if winner is None else f"Победитель: {winner.name}"
+        self._publish()
+        logger.info('End message rendered')
+
+
+    def render_turn_number(self, turn_number: int):
+        self._turn = turn_number
+        self._actions = []
+
+
+    def render_battlefield(self):
+        pass
+
+
+    def render_unit_action(self, action: str, unit: 'Unit', target: 'Unit'=None, damage: int=None, distance: int=None):
+        if action == 'move':
+            self._actions.append(f"{unit.name} двигается на {distance}")
+        elif action == 'attack':
+            self._actions.append(f"{unit.name} атакует {target.name}: {damage} урона")
+
+
+    def render_hp_bars(self, unit: 'Unit', length=10):
+        # здоровье рисуется прямо на клетке юнита из слепка хода
+        pass
+
+
+    def render_turns_separator(self):
+        self._publish()
+        self._wait_for_tick()
+
+
+    def _publish(self):
+        """
+        Кладет слепок текущего состояния в очередь, не блокируя симуляцию
+        :return:
+        """
+
+        cells = tuple(
+            None if unit is None else (unit.icon, unit.name, unit.health, unit.max_health)
+            for unit in self.battlefield.cells
+        )
+        snapshot = (cells, self._title, self._turn, tuple(self._actions), self._result)
+
+        while True:
+            try:
+                self._snapshots.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self._snapshots.get_nowait()
+                    self.snapshots_dropped += 1
+                except queue.Empty:
+                    pass
+
+
+    def _wait_for_tick(self):
+        """
+        Выдерживает частоту симуляции tick_rate
+        :return:
+        """
+
+        if not self.tick_interval:
+            return
+        now = perf_counter()
+        if self._last_tick is not None:
+            delay = self._last_tick + self.tick_interval - now
+            if delay > 0:
+                sleep(delay)
+                now += delay
+        self._last_tick = now
+
+
+    # ------------------------------------------------------------------ цикл рисования
+
+    def start(self):
+        """
+        Запускает цикл рисования в отдельном потоке
+        :return:
+        """
+
+        self._stop_requested.clear()
+        self._thread = threading.Thread(target=self.run_loop, name='PygameRenderer', daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        """
+        Просит цикл рисования дорисовать оставшиеся слепки и завершиться, дожидается его окончания
+        :return:
+        """
+
+        self._stop_requested.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+    def run_loop(self):
+        """
+        Цикл рисования: забирает самый свежий слепок и перерисовывает изменившиеся клетки.
+        Завершается после stop() (дорисовав очередь) или при закрытии окна
+        :return:
+        """
+
+        if self.video_driver:
+            os.environ['SDL_VIDEODRIVER'] = self.video_driver
+
+        import pygame
+
+        pygame.display.init()
+        pygame.font.init()
+        try:
+            screen = pygame.display.set_mode(self._screen_size)
+            pygame.display.set_caption('BattleHex')
+            clock = pygame.time.Clock()
+            cache = _SurfaceCache(pygame, self.hex_size, self._hex_width, self._hex_height, self._font_size)
+
+            screen.fill(_BACKGROUND_COLOR)
+            pygame.display.flip()
+            drawn_cells: Optional[tuple] = None
+            drawn_status = None
+
+            while True:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        self._stop_requested.set()
+
+                snapshot = None
+                while True:
+                    try:
+                        snapshot = self._snapshots.get_nowait()
+                    except queue.Empty:
+                        break
+
+                if snapshot is not None:
+                    cells, status = snapshot[0], snapshot[1:]
+                    dirty = self._draw_cells(pygame, screen, cache, drawn_cells, cells)
+                    if status != drawn_status:
+                        dirty.append(self._draw_status(pygame, screen, cache, status))
+                    if dirty:
+                        pygame.display.update(dirty)
+                        self.frames_rendered += 1
+                    drawn_cells, drawn_status = cells, status
+                elif self._stop_requested.is_set():
+                    break
+
+                clock.tick(self.fps)
+        finally:
+            pygame.display.quit()
+            logger.info("Render loop finished after %d frames", self.frames_rendered)
+
+
+    def _draw_cells(self, pygame, screen, cache: '_SurfaceCache', drawn_cells: Optional[tuple], cells: tuple):
+        """
+        Перерисовывает клетки, которые изменились с прошлого кадра, и возвращает их прямоугольники
+        :return:
+        """
+
+        dirty = []
+        for index, cell in enumerate(cells):
+            if drawn_cells is not None and drawn_cells[index] == cell:
+                continue
+            origin = self._cell_origins[index]
+            rect = screen.blit(cache.tile, origin)
+            if cell is not None:
+                icon, name, health, max_health = cell
+                screen.blit(cache.unit(icon, name), origin)
+                bar_width = self._hex_width // 2
+                bar_rect = pygame.Rect(
+                    origin[0] + (self._hex_width - bar_width) // 2, origin[1] + self._hex_height * 3 // 4, bar_width, 4
+                )
+                screen.fill(_HP_BACK_COLOR, bar_rect)
+                bar_rect.width = max(0, int(bar_width * health / max_health))
+                screen.fill(_HP_COLOR, bar_rect)
+            dirty.append(rect)
+        return dirty
+
+
+    def _draw_status(self, pygame, screen, cache: '_SurfaceCache', status: tuple):
+        """
+        Перерисовывает строку состояния под полем (заголовок, номер хода, действия, итог)
+        :return:
+        """
+
+        title, turn, actions, result = status
+        rect = pygame.Rect(0, self._status_top, self._screen_size[0], self._screen_size[1] - self._status_top)
+        screen.fill(_BACKGROUND_COLOR, rect)
+
+        lines = [f"{title}   ХОД {turn}"] + list(actions[-(_STATUS_LINES - 2):])
+        if result:
+            lines.append(result)
+        for number, line in enumerate(lines[:_STATUS_LINES]):
+            screen.blit(cache.text(line), (8, self._status_top + 4 + number * (self._font_size + 4)))
+        return rect
+
+
+class _SurfaceCache:
+    """
+    Кэш заранее отрисованных поверхностей: гекс клетки, значки юнитов и строки текста
+    """
+
+    def __init__(self, pygame, hex_size: int, hex_width: int, hex_height: int, font_size: int):
+        self._pygame = pygame
+        self._hex_width = hex_width
+        self._hex_height = hex_height
+        self._font = pygame.font.Font(None, font_size)
+        self._icon_font = pygame.font.Font(None, hex_size)
+        self._units: Dict[Tuple[str, str], object] = {}
+        self._texts: Dict[str, object] = {}
+
+        center_x, center_y = hex_width / 2, hex_height / 2
+        corners = [
+            (center_x + hex_width / 2 * dx, center_y + hex_size * dy)
+            for dx, dy in ((0, -1), (1, -0.5), (1, 0.5), (0, 1), (-1, 0.5), (-1, -0.5))
+        ]
+        self.tile = pygame.Surface((hex_width, hex_height), pygame.SRCALPHA)
+        pygame.draw.polygon(self.tile, _TILE_COLOR, corners)
+        pygame.draw.polygon(self.tile, _TILE_BORDER_COLOR, corners, 1)
+
+
+    def unit(self, icon: str, name: str):
+        """
+        Значок юнита: цветной круг (цвет зависит от иконки юнита) с первой буквой имени
+        :param icon:
+        :param name:
+        :return:
+        """
+
+        surface = self._units.get((icon, name))
+        if surface is None:
+            pygame = self._pygame
+            checksum = crc32(icon.encode('utf-8'))
+            color = (64 + checksum % 160, 64 + (checksum >> 8) % 160, 64 + (checksum >> 16) % 160)
+            surface = pygame.Surface((self._hex_width, self._hex_height), pygame.SRCALPHA)
+            center = (self._hex_width // 2, self._hex_height // 2)
+            pygame.draw.circle(surface, color, center, self._hex_width // 3)
+            letter = self._icon_font.render(name[:1], True, _TEXT_COLOR)
+            surface.blit(letter, letter.get_rect(center=center))
+            self._units[(icon, name)] = surface
+        return surface
+
+
+    def text(self, line: str):
+        surface = self._texts.get(line)
+        if surface is None:
+            if len(self._texts) > 256:
+                self._texts.clear()
+            surface = self._font.render(line, True, _TEXT_COLOR)
+            self._texts[line] = surface
+        return surface
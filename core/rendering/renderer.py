@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 from core.logging.logger import Logger
 
 
@@ -17,7 +17,7 @@ class Renderer:
 
     def __init__(self, battlefield: 'BattleField'):
         self.battlefield = battlefield
-        logger.info(f"{self.__class__.__name__} initiated")
+        logger.info("%s initiated", self.__class__.__name__)
 
 
     def render_start_info(self, unit_left: 'Unit', unit_right: 'Unit'):
@@ -37,14 +37,17 @@ class Renderer:
 
 
     @staticmethod
-    def render_end_info(winner: 'Unit'):
+    def render_end_info(winner: Optional['Unit']):
         """
-        Выводит финальную информацию о результате боя
+        Выводит финальную информацию о результате боя (winner=None означает ничью)
         :return:
         """
 
         print('================= БИТВА ОКОНЧЕНА =================')
-        print(f"Победитель: {winner.name}")
+        if winner is None:
+            print("Ничья")
+        else:
+            print(f"Победитель: {winner.name}")
         print("=" * 50)
         logger.info('End message rendered')
 
@@ -62,14 +65,14 @@ class Renderer:
         :return:
         """
 
-        string_field = "|"
-        for i in range(self.battlefield.size):
-            unit = self.battlefield.cells[i]
-            if unit is None:
-                string_field += (self.battlefield.icon + "|")
-            else:
-                string_field += (unit.icon + "|")
-        print(string_field)
+        # ряды гексагонального поля сдвигаются вправо, чтобы соседние клетки стояли рядом
+        width = self.battlefield.width
+        rows = []
+        for y in range(self.battlefield.height):
+            row_cells = self.battlefield.cells[y * width:(y + 1) * width]
+            icons = [self.battlefield.icon if unit is None else unit.icon for unit in row_cells]
+            rows.append(' ' * (3 * y // 2) + "|" + "|".join(icons) + "|")
+        print("\n".join(rows))
         logger.info('Battlefield rendered')
 
     @staticmethod
@@ -103,7 +106,7 @@ class Renderer:
         bar = '▮' * filled + '▯' * emptied
 
         print(str(f"{unit.name}: {bar} ({current_health}/{max_health})"))
-        logger.info(f"HP bar rendered for unit {unit}")
+        logger.info("HP bar rendered for unit %s", unit)
 
 
     @staticmethod
@@ -1,3 +1,4 @@
 from .field import *
 from .manager import *
-from .units import *
\ No newline at end of file
+from .units import *
+from .ai import *
\ No newline at end of file
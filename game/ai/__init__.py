@@ -0,0 +1,2 @@
+from .policy import Action, DecisionPolicy, GreedyPolicy, ATTACK, MOVE, WAIT
+from .monte_carlo import MonteCarloPolicy, create_rollout_pool
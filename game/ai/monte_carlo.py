@@ -0,0 +1,511 @@
+import gc
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+from core.logging.logger import Logger, set_logging_enabled, is_logging_enabled, logging_disabled
+from game.ai.policy import Action, DecisionPolicy, GreedyPolicy
+from utils.random_stream import RandomStream
+
+
+logger = Logger(__name__)
+
+
+if TYPE_CHECKING:
+    from game.field.battlefield import BattleField
+    from game.field.position import Position
+    from game.manager.battle_manager import BattleManager
+    from game.units.base_units import Unit
+
+
+# Раскладка боя для теневой копии: (ширина поля, высота поля, ((ключ юнита, команда), ...), класс планировщика ходов)
+BattleLayout = Tuple[int, int, Tuple[Tuple[str, Optional[int]], ...], type]
+
+# Кандидат в переданном между процессами виде: (вид действия, индекс цели или -1, позиция или None)
+EncodedAction = Tuple[str, int, object]
+
+
+class MonteCarloPolicy(DecisionPolicy):
+    """
+    Политика Монте-Карло (плоские rollout'ы) с жестким бюджетом времени на одно решение
+
+    На ходу юнита собирает несколько кандидатов (атаки доступных врагов, жадный ход, позиции для атаки ближайших
+    врагов, отход стрелка на дистанцию, пропуск хода) и оценивает каждый случайными доигрываниями:
+    снимок боя (BattleManager.get_game_state) восстанавливается в теневую копию боя, кандидат выполняется,
+    дальше все юниты играют жадно до конца боя или горизонта rollout_horizon ходов.
+    Победа стоит 1, поражение 0, незаконченный бой - 0.5 плюс половина разницы долей здоровья сторон.
+    Выбирается кандидат с лучшей средней оценкой, при равенстве - более ранний (жадный ход идет первым).
+
+    Бюджет time_budget (в секундах) считается от начала решения, подготовка (кандидаты и снимок боя) тоже идет
+    в счет бюджета. Rollout'ы считаются до доли (1 - reserve) времени, оставшегося после подготовки, остаток
+    оставлен на сбор результатов; все, что не успело к концу бюджета, отбрасывается. Если результаты приходят
+    позже (пересылка из пула, пробуждение потока на занятом процессоре), запас растягивается до замеренной
+    задержки сбора (collect_latency). Шаги rollout'ов не прерываются, поэтому задача не начинает шаг, который
+    по самому долгому из недавних шагов не успеет до срока.
+    Если не успел ни один rollout, выполняется жадный ход, поэтому решение не выходит за бюджет и под нагрузкой.
+    Упавшие задачи rollout'ов пишутся в лог и считаются (failed_tasks); если упали все законченные задачи,
+    решение падает с ошибкой первой из них, а не подменяется жадным ходом.
+
+    Rollout'ы можно раскидать по пулу (executor из concurrent.futures, см. create_rollout_pool):
+    в пул отдается workers задач, каждая крутит кандидатов по кругу со своим сидом до срока.
+    Теневая копия боя строится один раз на раскладку в каждом потоке (процессе) пула и дальше только
+    восстанавливается из снимков. Без executor rollout'ы считаются в текущем потоке.
+    На время rollout'ов в текущем процессе глушатся логи (иначе каждый rollout пишет в лог весь свой бой),
+    а на время решения откладывается сборщик мусора. И то и другое - считаемые блоки (logging_disabled, _gc_paused),
+    поэтому решения, которые пересекаются в разных потоках, не оставляют их выключенными
+    """
+
+    def __init__(
+            self,
+            time_budget: float = 0.05,
+            rollout_horizon: int = 10,
+            executor: Optional[Executor] = None,
+            workers: Optional[int] = None,
+            max_targets: int = 3,
+            reserve: float = 0.2,
+            seed: Optional[int] = None
+    ):
+        if time_budget <= 0:
+            raise ValueError('Бюджет времени на решение должен быть положительным')
+        if not 0 <= reserve < 1:
+            raise ValueError('Запас бюджета reserve должен быть в [0, 1)')
+
+        self.time_budget = time_budget
+        self.rollout_horizon = rollout_horizon
+        self.executor = executor
+        self.workers = workers or ((os.cpu_count() or 1) if executor is not None else 1)
+        self.max_targets = max_targets
+        self.reserve = reserve
+        self.seed = seed if seed is not None else RandomStream().seed
+        self.greedy = GreedyPolicy()
+
+        # статистика для мониторинга: число решений, всего rollout'ов, rollout'ов в последнем решении,
+        # решений без единого rollout'а (сыграно жадно), упавших задач rollout'ов и время последнего решения
+        self.decisions = 0
+        self.rollouts = 0
+        self.last_rollouts = 0
+        self.fallbacks = 0
+        self.failed_tasks = 0
+        self.last_decision_time = 0.0
+        # сколько после срока rollout'ов приходят их результаты (пересылка и пробуждение потока), в секундах
+        self.collect_latency = 0.0
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def decide(self, battle: 'BattleManager', unit: 'Unit') -> Action:
+        """
+        Выбирает ход юнита по результатам rollout'ов, уложенных в бюджет времени
+        :param battle:
+        :param unit:
+        :return:
+        """
+
+        started = time.monotonic()
+        deadline = started + self.time_budget
+        results = []
+        errors = []
+
+        # сборщик мусора откладывается до конца rollout'ов: его проход по куче занимает миллисекунды и срывает срок
+        with _gc_paused():
+            candidates = self._get_candidates(battle, unit)
+            if len(candidates) == 1:
+                self.last_decision_time = time.monotonic() - started
+                return candidates[0]
+
+            units = battle.units_in_game
+            indices = {battle_unit: index for index, battle_unit in enumerate(units)}
+            layout: BattleLayout = (
+                battle.battlefield.width,
+                battle.battlefield.height,
+                tuple([(battle_unit.stats.key, battle_unit.team) for battle_unit in units]),
+                type(battle.scheduler)
+            )
+            encoded = tuple([self._encode(action, indices) for action in candidates])
+            state = battle.get_game_state()
+
+            # срок rollout'ов считается от конца подготовки, чтобы долгая подготовка не съедала запас на сбор.
+            # Запас - не меньше замеренной задержки сбора (но не больше половины остатка)
+            prepared = time.monotonic()
+            time_left = deadline - prepared
+            reserve = min(max(time_left * self.reserve, self.collect_latency), time_left / 2)
+            work_deadline = prepared + time_left - reserve
+            tasks = [
+                (
+                    layout, state, battle.max_turns, indices[unit], encoded, self.rollout_horizon,
+                    RandomStream.derive_seed(self.seed, self.decisions * self.workers + worker),
+                    worker, work_deadline, os.getpid()
+                )
+                for worker in range(self.workers)
+            ]
+            self.decisions += 1
+
+            # если подготовка съела весь бюджет, rollout'ы не запускаются и решение уходит в жадный ход
+            if time_left > 0:
+                with logging_disabled():
+                    if self.executor is None:
+                        results = [_run_rollouts(task) for task in tasks]
+                    else:
+                        futures = [self.executor.submit(_run_rollouts, task) for task in tasks]
+                        done, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+                        for future in not_done:
+                            future.cancel()
+                        for future in done:
+                            error = future.exception()
+                            if error is None:
+                                results.append(future.result())
+                            else:
+                                errors.append(error)
+                # задержка растет сразу, а спадает медленно, чтобы один быстрый сбор не сорвал следующие сроки
+                self.collect_latency = max(time.monotonic() - work_deadline, self.collect_latency * 0.95)
+
+        # ошибки пишутся в лог уже после решения: пока идут rollout'ы, логи заглушены
+        if errors:
+            self.failed_tasks += len(errors)
+            for error in errors:
+                logger.error("Rollout task for unit %s failed: %r", unit, error)
+            if not results:
+                raise errors[0]
+
+        totals = [0.0] * len(candidates)
+        counts = [0] * len(candidates)
+        for task_totals, task_counts in results:
+            for index in range(len(candidates)):
+                totals[index] += task_totals[index]
+                counts[index] += task_counts[index]
+
+        rollouts = sum(counts)
+        self.rollouts += rollouts
+        self.last_rollouts = rollouts
+
+        best_action, best_value = None, -1.0
+        for action, total, count in zip(candidates, totals, counts):
+            if count and total / count > best_value:
+                best_action, best_value = action, total / count
+
+        if best_action is None:
+            self.fallbacks += 1
+            best_action = candidates[0]
+
+        self.last_decision_time = time.monotonic() - started
+        logger.info(
+            "Unit %s decided %s after %d rollouts in %.1f ms",
+            unit, best_action, rollouts, self.last_decision_time * 1000
+        )
+
+        return best_action
+
+
+    def _get_candidates(self, battle: 'BattleManager', unit: 'Unit') -> List[Action]:
+        """
+        Собирает различающиеся кандидаты на ход юнита, жадный ход всегда первый
+        :param battle:
+        :param unit:
+        :return:
+        """
+
+        battlefield = battle.battlefield
+        candidates = [self.greedy.decide(battle, unit)]
+
+        # атаки всех врагов, до которых юнит достает с текущей позиции
+        for enemy in battlefield.get_enemies_within(unit, max(unit.range, 1)):
+            if unit.can_attack(enemy, battlefield):
+                candidates.append(Action.attack(enemy))
+
+        # позиции для атаки нескольких ближайших врагов
+        position = unit.position
+        enemies = [
+            enemy for enemy in battle.units_in_game
+            if enemy.alive and enemy is not unit and unit.is_enemy_of(enemy)
+        ]
+        nearest = heapq.nsmallest(self.max_targets, enemies, key=lambda enemy: position.distance_to(enemy.position))
+        for enemy in nearest:
+            attack_position = unit.find_attack_position(enemy, battlefield)
+            if attack_position:
+                candidates.append(Action.move(attack_position))
+
+        # стрелок с боезапасом может отойти на самую дальнюю клетку, с которой еще достает до ближайшего врага
+        if getattr(unit, 'ammo', 0) > 0 and nearest:
+            kiting_position = self._find_kiting_position(unit, nearest, battlefield)
+            if kiting_position is not None:
+                candidates.append(Action.move(kiting_position))
+
+        candidates.append(Action.wait())
+
+        return list(dict.fromkeys(candidates))
+
+
+    @staticmethod
+    def _find_kiting_position(unit: 'Unit', enemies: List['Unit'], battlefield: 'BattleField') -> Optional['Position']:
+        """
+        Находит клетку в пределах хода, на которой юнит дальше всего от ближайшего врага,
+        но все еще может по нему стрелять
+        :param unit:
+        :param enemies:
+        :param battlefield:
+        :return:
+        """
+
+        current_distance = min(unit.position.distance_to(enemy.position) for enemy in enemies)
+        best_position, best_distance = None, current_distance
+        for radius in range(1, unit.speed + 1):
+            for test_position in unit.position.ring(radius):
+                if not battlefield.is_position_available(test_position):
+                    continue
+                distance = min(test_position.distance_to(enemy.position) for enemy in enemies)
+                if best_distance < distance <= unit.range:
+                    best_position, best_distance = test_position, distance
+
+        return best_position
+
+
+    @staticmethod
+    def _encode(action: Action, indices: Dict['Unit', int]) -> EncodedAction:
+        return action.kind, indices[action.target] if action.target is not None else -1, action.position
+
+
+def create_rollout_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Создает пул процессов для rollout'ов MonteCarloPolicy с заглушенными логами.
+    Пул стоит создавать один раз на сервер и отдавать всем политикам
+    :param workers:
+    :return:
+    """
+
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(workers, initializer=set_logging_enabled, initargs=(False,))
+    # процессы пула запускаются и грузят каталог юнитов сразу, а не на первых решениях (иначе те уйдут в жадный ход)
+    for future in [pool.submit(_warm_up) for _ in range(workers)]:
+        future.result()
+
+    return pool
+
+
+def _warm_up():
+    from game.units.unit_factory import UnitFactory
+
+    UnitFactory.preload_data()
+
+
+@contextmanager
+def _gc_paused(paused: bool = True) -> Iterator[None]:
+    """
+    Откладывает сборщик мусора на время блока. Блоки считаются, как в logging_disabled: сборщик выключает
+    первый вошедший блок, а включает (если он был включен) последний вышедший
+    :param paused: False - блок выполняется без изменения сборщика
+    :return:
+    """
+
+    global _paused_blocks, _gc_enabled_before_pause
+
+    if not paused:
+        yield
+        return
+
+    with _gc_lock:
+        if not _paused_blocks:
+            _gc_enabled_before_pause = gc.isenabled()
+            gc.disable()
+        _paused_blocks += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _paused_blocks -= 1
+            if not _paused_blocks and _gc_enabled_before_pause:
+                gc.enable()
+
+
+def _reset_gc_pause_in_child():
+    global _gc_lock, _paused_blocks
+
+    # процесс пула может запуститься посреди решения: блоки остались в родителе, сборщик возвращается как был до них
+    _gc_lock = threading.Lock()
+    if _paused_blocks and _gc_enabled_before_pause:
+        gc.enable()
+    _paused_blocks = 0
+
+
+# Число открытых блоков _gc_paused и состояние сборщика мусора до первого из них
+_gc_lock = threading.Lock()
+_paused_blocks = 0
+_gc_enabled_before_pause = True
+os.register_at_fork(after_in_child=_reset_gc_pause_in_child)
+
+
+# Теневые копии боев по раскладкам, свои в каждом потоке
+_shadow_battles = threading.local()
+
+# Сколько раскладок держать в кэше одного потока
+_SHADOW_CACHE_SIZE = 16
+
+# Во сколько раз забывается самый долгий шаг rollout'ов потока к началу следующей задачи
+_STEP_TIME_DECAY = 0.9
+
+
+def _get_shadow_battle(layout: BattleLayout) -> 'BattleManager':
+    """
+    Возвращает теневую копию боя с поданной раскладкой (headless, без рендера и записи реплея).
+    Юниты создаются один раз, их состояние и поле потом восстанавливаются из снимков
+    :param layout:
+    :return:
+    """
+
+    from game.units.unit_factory import UnitFactory
+    from game.field.battlefield import BattleField
+    from game.field.position import Position
+    from game.manager.battle_manager import BattleManager
+
+    cache = getattr(_shadow_battles, 'cache', None)
+    if cache is None:
+        cache = _shadow_battles.cache = {}
+
+    shadow = cache.get(layout)
+    if shadow is None:
+        if len(cache) >= _SHADOW_CACHE_SIZE:
+            cache.clear()
+        width, height, unit_layout, scheduler_class = layout
+        units = []
+        for unit_name, team in unit_layout:
+            unit = UnitFactory.create(unit_name, Position(0))
+            unit.team = team
+            units.append(unit)
+        battlefield = BattleField(width, height)
+        shadow = BattleManager(battlefield, headless=True, rng=RandomStream(0, 1), scheduler=scheduler_class())
+        # юниты встают на поле и в очередь планировщика при восстановлении первого снимка
+        shadow.units_in_game = units
+        cache[layout] = shadow
+
+    return shadow
+
+
+def _run_rollouts(task: tuple) -> Tuple[List[float], List[int]]:
+    """
+    Крутит rollout'ы по кандидатам до срока и возвращает суммы оценок и число rollout'ов каждого кандидата
+    :param task: (раскладка, снимок, ограничение ходов боя, индекс юнита, кандидаты, горизонт, сид, номер задачи,
+        срок по time.monotonic, pid процесса боя)
+    :return:
+    """
+
+    (
+        layout, state, max_turns, unit_index, candidates, horizon, seed, worker, deadline, parent_pid
+    ) = task
+
+    # в процессе пула логи глушатся (если пул создан не через create_rollout_pool), а сборщик мусора откладывается
+    # до конца задачи, как и в decide
+    in_pool_process = os.getpid() != parent_pid
+    if in_pool_process and is_logging_enabled():
+        set_logging_enabled(False)
+
+    totals = [0.0] * len(candidates)
+    counts = [0] * len(candidates)
+
+    with _gc_paused(in_pool_process):
+        shadow = _get_shadow_battle(layout)
+        snapshot_rng = shadow.rng
+        rollout_rng = RandomStream(seed, 256)
+        units = shadow.units_in_game
+        sides = [unit.team if unit.team is not None else -1 - index for index, unit in enumerate(units)]
+        own_side = sides[unit_index]
+        shadow.max_turns = max_turns
+
+        # шаг (восстановление снимка или ход юнита) не прерывается, поэтому шаг не начинается, если самый долгий
+        # из недавних шагов потока не успел бы до срока: иначе задача уходит за срок и занимает процессор при сборе
+        step_time = getattr(_shadow_battles, 'step_time', 0.0) * _STEP_TIME_DECAY
+
+        # задачи начинают обход кандидатов с разных мест, чтобы при коротком сроке были оценены все
+        candidate_index = worker % len(candidates)
+        while True:
+            started = time.monotonic()
+            if started + step_time >= deadline:
+                break
+            shadow.rng = snapshot_rng
+            shadow.restore_game_state(state)
+            shadow.rng = rollout_rng
+            step_time = max(step_time, time.monotonic() - started)
+
+            finished, step_time = _rollout(
+                shadow, unit_index, candidates[candidate_index], horizon, deadline, step_time
+            )
+            if not finished:
+                break
+            totals[candidate_index] += _score(shadow, units, sides, own_side)
+            counts[candidate_index] += 1
+            candidate_index = (candidate_index + 1) % len(candidates)
+
+        shadow.rng = snapshot_rng
+        _shadow_battles.step_time = step_time
+
+    return totals, counts
+
+
+def _rollout(
+        shadow: 'BattleManager',
+        unit_index: int,
+        candidate: EncodedAction,
+        horizon: int,
+        deadline: float,
+        step_time: float
+) -> Tuple[bool, float]:
+    """
+    Доигрывает бой из восстановленного снимка: ход кандидата, остаток текущего хода (юниты, ждущие хода
+    в восстановленной очереди планировщика) и полные ходы до горизонта
+    :param step_time: самый долгий шаг потока: ход юнита не начинается, если он не успеет до срока
+    :return: (уложился ли rollout в срок, самый долгий шаг с учетом ходов этого rollout'а)
+    """
+
+    units = shadow.units_in_game
+    kind, target_index, position = candidate
+    target = units[target_index] if target_index >= 0 else None
+    started = time.monotonic()
+    shadow._apply_action(units[unit_index], Action(kind, target=target, position=position))
+    step_time = max(step_time, time.monotonic() - started)
+    if shadow._check_victory():
+        return True, step_time
+
+    # ходы считаются как в BattleManager._process_full_turn, но срок проверяется перед ходом каждого юнита
+    scheduler = shadow.scheduler
+    played = 0
+    max_turns = shadow.max_turns
+    while True:
+        for unit in iter(scheduler.next_unit, None):
+            started = time.monotonic()
+            if started + step_time >= deadline:
+                return False, step_time
+            shadow._process_unit_turn(unit)
+            step_time = max(step_time, time.monotonic() - started)
+            if shadow._check_victory():
+                return True, step_time
+        if played >= horizon or (max_turns is not None and shadow.current_turn >= max_turns):
+            return True, step_time
+        shadow.current_turn += 1
+        played += 1
+        scheduler.begin_turn()
+
+
+def _score(shadow: 'BattleManager', units: List['Unit'], sides: List[int], own_side: int) -> float:
+    """
+    Оценка итога rollout'а для стороны юнита: победа 1, поражение 0,
+    незаконченный бой (или ничья) - 0.5 + половина разницы долей оставшегося здоровья своей стороны и врагов
+    :return:
+    """
+
+    if shadow.winner is not None:
+        return 1.0 if sides[units.index(shadow.winner)] == own_side else 0.0
+
+    own_health = own_max = enemy_health = enemy_max = 0
+    for unit, side in zip(units, sides):
+        health = unit.health if unit.alive else 0
+        if side == own_side:
+            own_health += health
+            own_max += unit.max_health
+        else:
+            enemy_health += health
+            enemy_max += unit.max_health
+
+    own_fraction = own_health / own_max if own_max else 0.0
+    enemy_fraction = enemy_health / enemy_max if enemy_max else 0.0
+
+    return 0.5 + 0.5 * (own_fraction - enemy_fraction)
@@ -0,0 +1,107 @@
+from abc import ABC, abstractmethod
+from typing import Optional, TYPE_CHECKING
+from game.field.position import Position
+
+
+if TYPE_CHECKING:
+    from game.manager.battle_manager import BattleManager
+    from game.units.base_units import Unit
+
+
+ATTACK = 'attack'
+MOVE = 'move'
+WAIT = 'wait'
+
+
+class Action:
+    """
+    Класс решения юнита на ход: атаковать цель, перейти на позицию или пропустить ход
+    """
+
+    __slots__ = ('kind', 'target', 'position')
+
+    def __init__(self, kind: str, target: Optional['Unit'] = None, position: Optional[Position] = None):
+        self.kind = kind
+        self.target = target
+        self.position = position
+
+
+    @classmethod
+    def attack(cls, target: 'Unit') -> 'Action':
+        return cls(ATTACK, target=target)
+
+
+    @classmethod
+    def move(cls, position: Position) -> 'Action':
+        return cls(MOVE, position=position)
+
+
+    @classmethod
+    def wait(cls) -> 'Action':
+        return cls(WAIT)
+
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Action) and self.kind == other.kind
+            and self.target is other.target and self.position is other.position
+        )
+
+
+    def __hash__(self):
+        return hash((self.kind, id(self.target), self.position))
+
+
+    def __repr__(self):
+        if self.kind == ATTACK:
+            return f"Action.attack({self.target})"
+        if self.kind == MOVE:
+            return f"Action.move({self.position})"
+        return "Action.wait()"
+
+
+class DecisionPolicy(ABC):
+    """
+    Базовый класс политики принятия решений (мозга) юнитов
+
+    BattleManager на ходу юнита спрашивает у политики решение (decide) и сам его выполняет
+    """
+
+    @abstractmethod
+    def decide(self, battle: 'BattleManager', unit: 'Unit') -> Action:
+        """
+        Решение юнита на его ход
+        :param battle:
+        :param unit:
+        :return:
+        """
+
+
+class GreedyPolicy(DecisionPolicy):
+    """
+    Жадная политика (исходный ИИ боя): бить ближайшего врага, если можно, иначе встать на позицию для атаки,
+    иначе идти к нему (на одномерном поле - по линии, на двумерном - по кратчайшему пути в обход занятых клеток)
+    """
+
+    def decide(self, battle: 'BattleManager', unit: 'Unit') -> Action:
+        battlefield = battle.battlefield
+
+        # находим ближайшего врага через пространственный индекс поля (мертвые юниты с поля уже убраны)
+        nearest_enemy = battlefield.get_nearest_enemy(unit)
+        if nearest_enemy is None:
+            return Action.wait()
+
+        # атакуем врага, если можем с текущей позиции
+        if unit.can_attack(nearest_enemy, battlefield):
+            return Action.attack(nearest_enemy)
+
+        # если есть позиция, с которой можно атаковать, двигаемся на нее
+        attack_position = unit.find_attack_position(nearest_enemy, battlefield)
+        if attack_position:
+            return Action.move(attack_position)
+
+        # иначе просто двигаемся в сторону врага
+        new_position = battlefield.find_path_towards(unit.position, nearest_enemy, unit.speed)
+        if new_position is None:
+            return Action.wait()
+        return Action.move(new_position)
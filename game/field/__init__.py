@@ -1,2 +1,3 @@
 from .battlefield import *
-from .position import *
\ No newline at end of file
+from .position import *
+from .formations import Formation, Line, Column, Wedge, Scatter, FORMATIONS, get_formation
\ No newline at end of file
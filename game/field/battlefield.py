@@ -1,5 +1,8 @@
-from typing import List, Optional, Dict, TYPE_CHECKING
-from game.field.position import Position
+from time import perf_counter
+from typing import List, Optional, Dict, Tuple, TYPE_CHECKING
+from game.field.position import Position, HEX_DIRECTIONS
+from game.field.pathfinding import PathFinder
+from game.field.spatial_index import SpatialIndex
 from utils.data_functions import load_field_data
 from core.logging.logger import Logger
 
@@ -9,26 +12,73 @@ logger = Logger(__name__)
 
 if TYPE_CHECKING:
     from game.units.base_units import Unit
+    from core.instrumentation import Instrumentation
+    from game.manager.scheduler import TurnScheduler
 
 
 class BattleField:
     """
     Класс поля битвы, который создает поле и хранит информацию о нем.
 
+    Поле гексагональное, в осевых координатах имеет форму параллелограмма width x height.
+    Одномерное поле (height = 1) - частный случай, на нем все работает так же, как раньше.
+
     Может делать следующее:
-        - Добавлять юнитов на поле
+        - Добавлять юнитов на поле (по одному или пачкой за один проверенный проход)
         - Убирать юнитов с поля
         - Передвигать юнитов по полю в рамках возможного
-        - Рассчитывать дистанцию между двумя ячейками TODO (возможно, имеет смысл перенести это в класс Position)
+        - Искать первую свободную клетку в заданном направлении
+        - Рассчитывать гексагональную дистанцию между двумя ячейками
+        - Отдавать соседей клетки (таблица соседей считается один раз при первом обращении)
+        - Прокладывать путь к цели по закэшированным полям расстояний (см. PathFinder)
+        - Искать ближайшего врага и врагов в радиусе через пространственный индекс (см. SpatialIndex)
+
+    Клетки хранятся в плоском списке по индексу y * width + x.
+    Занятость клеток дублируется в bytearray (1 - клетка занята), а позиции юнитов хранятся в словаре,
+    поэтому проверки принадлежности юнита полю, свободы клетки и перемещение работают за O(1)
     """
 
 
-    def __init__(self, size: int):
+    def __init__(self, width: int, height: int = 1):
         self.icon = load_field_data("icon")
-        self.size = size
-        self.cells: List[Optional['Unit']] = [None] * size
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.cells: List[Optional['Unit']] = [None] * self.size
+        self._occupied = bytearray(self.size)
         self._unit_positions: Dict['Unit', Position] = {}
-        logger.info(f"{self.__class__.__name__} initiated")
+        self._neighbour_indices: Optional[List[Tuple[int, ...]]] = None
+        self.pathfinder: Optional[PathFinder] = None
+        self.spatial_index = SpatialIndex(width, height)
+        self.instrumentation: Optional['Instrumentation'] = None  # подключает BattleManager
+        self.scheduler: Optional['TurnScheduler'] = None  # планировщик ходов боя, ему сообщает о смертях Unit.die
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def _index(self, position: Position) -> int:
+        """
+        Возвращает индекс клетки в плоских массивах поля
+
+        :param position:
+        :return:
+        """
+
+        return position.y * self.width + position.x
+
+
+    def _set_cell(self, index: int, unit: Optional['Unit']):
+        """
+        Ставит юнита в клетку (или освобождает ее) и сообщает об изменении занятости поиску пути
+
+        :param index:
+        :param unit:
+        :return:
+        """
+
+        self.cells[index] = unit
+        self._occupied[index] = 0 if unit is None else 1
+        if self.pathfinder is not None:
+            self.pathfinder.on_cell_changed(index)
 
 
     def _is_cell_free(self, position: Position):
@@ -40,9 +90,9 @@ class BattleField:
         """
 
         if self._is_valid_position(position):
-            return self.cells[position.x] is None
+            return not self._occupied[position.y * self.width + position.x]
         else:
-            logger.warning(f"Position {position} is occupied")
+            logger.warning("Position %s is out of field", position)
             raise ValueError('позиция за пределами поля')
 
 
@@ -54,7 +104,7 @@ class BattleField:
         :return:
         """
 
-        return 0 <= position.x < self.size
+        return 0 <= position.x < self.width and 0 <= position.y < self.height
 
 
     def _unit_on_field(self, unit: 'Unit'):
@@ -65,7 +115,7 @@ class BattleField:
         :return:
         """
 
-        return unit in self.cells and unit in self._unit_positions
+        return unit in self._unit_positions
 
 
     def is_position_available(self, position: Position):
@@ -76,13 +126,139 @@ class BattleField:
         :return:
         """
 
-        return self._is_valid_position(position) and self._is_cell_free(position)
+        x, y = position.x, position.y
+        if 0 <= x < self.width and 0 <= y < self.height and not self._occupied[y * self.width + x]:
+            return True
+        if self.instrumentation is not None:
+            self.instrumentation.count('failed_position_probes')
+        return False
+
+
+    def get_neighbours(self, position: Position) -> Tuple[Position, ...]:
+        """
+        Возвращает соседние клетки поданной позиции, которые лежат в пределах поля
+
+        :param position:
+        :return:
+        """
+
+        width = self.width
+        return tuple(
+            Position(index % width, index // width)
+            for index in self._get_neighbour_index_table()[self._index(position)]
+        )
+
+
+    def _get_neighbour_index_table(self) -> List[Tuple[int, ...]]:
+        """
+        Возвращает таблицу индексов соседей для каждой клетки (строится при первом обращении)
+
+        :return:
+        """
+
+        if self._neighbour_indices is None:
+            width, height = self.width, self.height
+            self._neighbour_indices = [
+                tuple(
+                    (y + dy) * width + x + dx for dx, dy in HEX_DIRECTIONS
+                    if 0 <= x + dx < width and 0 <= y + dy < height
+                )
+                for y in range(height) for x in range(width)
+            ]
+        return self._neighbour_indices
+
+
+    def find_free_cell(self, position: Position, direction: int, max_steps: int) -> Optional[Position]:
+        """
+        Ищет первую свободную клетку в ряду поданной позиции, начиная с нее самой и двигаясь в направлении direction
+        не более чем на max_steps клеток. Клетки за пределами поля считаются недоступными.
+
+        Поиск идет по bytearray занятости средствами find/rfind, без проверки каждой клетки в Python
+        :param position:
+        :param direction: 1 - вправо, -1 - влево
+        :param max_steps:
+        :return: найденная позиция или None
+        """
+
+        if not 0 <= position.y < self.height:
+            return None
+
+        row_start = position.y * self.width
+        start = position.x
+        end = start + direction * max_steps
+
+        if direction > 0:
+            low, high = max(start, 0), min(end, self.width - 1)
+            if low > high:
+                return None
+            index = self._occupied.find(0, row_start + low, row_start + high + 1)
+        else:
+            low, high = max(end, 0), min(start, self.width - 1)
+            if low > high:
+                return None
+            index = self._occupied.rfind(0, row_start + low, row_start + high + 1)
+
+        return Position(index - row_start, position.y) if index >= 0 else None
+
+
+    def find_free_cell_towards(self, position: Position, target: Position, max_steps: int) -> Optional[Position]:
+        """
+        Ищет самую дальнюю свободную клетку на линии от позиции к цели не дальше max_steps шагов
+        (линия может продолжаться за цель). Промежуточные клетки не проверяются.
+
+        На одномерном поле поиск идет через find_free_cell
+        :param position:
+        :param target:
+        :param max_steps:
+        :return: найденная позиция или None
+        """
+
+        if self.height == 1:
+            direction = position.direction_to(target)
+            return self.find_free_cell(position + (direction * max_steps), -direction, max_steps - 1)
+
+        for steps in range(max_steps, 0, -1):
+            candidate = position.step_towards(target, steps)
+            if self.is_position_available(candidate):
+                return candidate
+        return None
+
+
+    def find_path_towards(self, position: Position, target: 'Unit', max_steps: int) -> Optional[Position]:
+        """
+        Находит, куда юнит дойдет к юниту-цели за max_steps шагов.
+
+        На двумерном поле юнит идет по кратчайшему пути в обход занятых клеток (см. PathFinder): юнит команды -
+        к ближайшему по пути врагу своей стороны, юнит без команды - к цели; на одномерном - по линии к цели,
+        как раньше (см. find_free_cell_towards)
+        :param position: позиция идущего юнита
+        :param target: юнит на поле, к которому идем
+        :param max_steps:
+        :return: найденная позиция или None
+        """
+
+        if self.instrumentation is not None:
+            started = perf_counter()
+            new_position = self._find_path_towards(position, target, max_steps)
+            self.instrumentation.add_time('movement', perf_counter() - started)
+            return new_position
+        return self._find_path_towards(position, target, max_steps)
+
+
+    def _find_path_towards(self, position: Position, target: 'Unit', max_steps: int) -> Optional[Position]:
+        if self.height == 1:
+            return self.find_free_cell_towards(position, target.position, max_steps)
+
+        if self.pathfinder is None:
+            self.pathfinder = PathFinder(self)
+        return self.pathfinder.next_position(position, target, max_steps)
 
 
     def add_unit(self, unit: 'Unit') -> None:
         """
         Добавляет поданного юнита на поле, если это возможно
 
+        ValueError: если позиция юнита за пределами поля
         :param unit:
         :return:
         """
@@ -92,16 +268,105 @@ class BattleField:
             return
             # raise ValueError('Этот юнит уже есть на поле')
         if self._is_cell_free(unit.position):
-            if self._is_valid_position(unit.position):
-                self.cells[unit.position.x] = unit
-                self._unit_positions[unit] = unit.position
-                logger.info(f"Unit {unit} added to field")
-            else:
-                logger.warning('Position is not available for field')
+            self._set_cell(self._index(unit.position), unit)
+            self._unit_positions[unit] = unit.position
+            self.spatial_index.add(unit, unit.position)
+            logger.info("Unit %s added to field", unit)
         else:
             logger.warning('AN attempt to add a unit to occupied cell')
 
 
+    def add_units(self, units: List['Unit']) -> None:
+        """
+        Добавляет на поле сразу много юнитов за один проход
+
+        Сначала проверяет все позиции разом (границы поля, занятость, совпадения позиций внутри самой пачки)
+        и только потом расставляет юнитов, поэтому при ошибке поле остается нетронутым.
+        Закэшированные поля расстояний не чинятся по клетке, а сбрасываются целиком. В лог пишется одна строка
+
+        ValueError: если хоть одна позиция за пределами поля, занята или повторяется, с перечнем таких позиций
+        :param units:
+        :return:
+        """
+
+        width, height = self.width, self.height
+        occupied = self._occupied
+        unit_positions = self._unit_positions
+        indices = []
+        taken = set()
+        out_of_field, collisions = [], []
+
+        for unit in units:
+            position = unit.position
+            x, y = position.x, position.y
+            if unit in unit_positions:
+                collisions.append(f"{position} (юнит уже на поле)")
+            elif not (0 <= x < width and 0 <= y < height):
+                out_of_field.append(str(position))
+            else:
+                index = y * width + x
+                if occupied[index] or index in taken:
+                    collisions.append(str(position))
+                else:
+                    taken.add(index)
+                    indices.append(index)
+
+        if out_of_field or collisions:
+            logger.warning(
+                "Bulk placement of %d units rejected: %d out of field, %d collisions",
+                len(units), len(out_of_field), len(collisions)
+            )
+            problems = []
+            if out_of_field:
+                problems.append(f"за пределами поля: {', '.join(out_of_field[:10])}")
+            if collisions:
+                problems.append(f"клетки заняты: {', '.join(collisions[:10])}")
+            raise ValueError(f'Нельзя расставить {len(units)} юнитов, ' + '; '.join(problems))
+
+        cells = self.cells
+        for unit, index in zip(units, indices):
+            cells[index] = unit
+            occupied[index] = 1
+            unit_positions[unit] = unit.position
+        self.spatial_index.add_many(units)
+
+        if self.pathfinder is not None:
+            self.pathfinder.clear()
+
+        logger.info("%d units added to field", len(units))
+
+
+    def _restore_units(self, units: List['Unit']):
+        """
+        Приводит поле в соответствие с текущими позициями юнитов: живые стоят на своих позициях, мертвых на поле нет.
+        Нужно для восстановления снимка боя, позиции не проверяются.
+
+        Клетки, в которых остался тот же юнит, поиску пути не сообщаются, поэтому поля расстояний чинятся
+        только по действительно изменившимся клеткам (поле стороны зависит и от того, чей юнит стоит в клетке)
+        :param units: юниты в порядке их добавления на поле
+        :return:
+        """
+
+        width = self.width
+        alive_units = [unit for unit in units if unit.alive]
+        new_cells = {unit.position.y * width + unit.position.x: unit for unit in alive_units}
+
+        spatial_index = self.spatial_index
+        for unit, position in self._unit_positions.items():
+            spatial_index.remove(unit, position)
+            index = position.y * width + position.x
+            if index not in new_cells:
+                self._set_cell(index, None)
+
+        cells = self.cells
+        for index, unit in new_cells.items():
+            if cells[index] is not unit:
+                self._set_cell(index, unit)
+
+        self._unit_positions = {unit: unit.position for unit in alive_units}
+        spatial_index.add_many(alive_units)
+
+
     def remove_unit(self, unit: 'Unit'):
         """
         Убирает юнита с поля, если это возможно
@@ -110,11 +375,34 @@ class BattleField:
         :return:
         """
 
-        if self._unit_on_field(unit):
-            unit_position = self._unit_positions[unit]
-            self.cells[unit_position.x] = None
-            self._unit_positions.pop(unit)
-            logger.info(f"Unit {unit} removed from field")
+        unit_position = self._unit_positions.pop(unit, None)
+        if unit_position is not None:
+            self._set_cell(self._index(unit_position), None)
+            self.spatial_index.remove(unit, unit_position)
+            logger.info("Unit %s removed from field", unit)
+
+
+    def get_nearest_enemy(self, unit: 'Unit') -> Optional['Unit']:
+        """
+        Возвращает ближайшего к юниту врага на поле (при равном расстоянии - добавленного на поле раньше)
+
+        :param unit:
+        :return:
+        """
+
+        return self.spatial_index.nearest_enemy(unit, unit.position)
+
+
+    def get_enemies_within(self, unit: 'Unit', radius: int) -> List['Unit']:
+        """
+        Возвращает всех врагов юнита на поле на расстоянии не больше radius
+
+        :param unit:
+        :param radius:
+        :return:
+        """
+
+        return self.spatial_index.enemies_within(unit, unit.position, radius)
 
 
     def get_unit_at(self, position: Position) -> Optional['Unit']:
@@ -126,7 +414,7 @@ class BattleField:
         """
 
         if self._is_valid_position(position):
-            return self.cells[position.x]
+            return self.cells[self._index(position)]
         else:
             return None
 
@@ -146,11 +434,12 @@ class BattleField:
         if self._unit_on_field(unit):
             if self.is_position_available(new_position):
                 old_position: Position = self._unit_positions[unit]
-                self.cells[old_position.x] = None
-                self.cells[new_position.x] = unit
+                self._set_cell(self._index(old_position), None)
+                self._set_cell(self._index(new_position), unit)
                 self._unit_positions[unit] = new_position
+                self.spatial_index.move(unit, old_position, new_position)
                 unit.position = new_position
-                logger.info(f"Unit {unit} moved from {old_position} to {new_position}")
+                logger.info("Unit %s moved from %s to %s", unit, old_position, new_position)
                 return self.get_distance(old_position, new_position)
         return None
 
@@ -158,12 +447,13 @@ class BattleField:
     @staticmethod
     def get_distance(position1: Position, position2: Position):
         """
-        Рассчитывает расстояние между двумя ячейками поля
-        TODO возможно, тоже стоит переместить в класс Position
+        Рассчитывает гексагональное расстояние между двумя ячейками поля (см. Position.distance_to)
 
         :param position1:
         :param position2:
         :return:
         """
 
-        return abs(position1.x - position2.x)
+        dx = position1.x - position2.x
+        dy = position1.y - position2.y
+        return (abs(dx) + abs(dy) + abs(dx + dy)) // 2
@@ -0,0 +1,163 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Type, Union, TYPE_CHECKING
+from game.field.position import Position
+from utils.random_stream import RandomStream
+
+
+if TYPE_CHECKING:
+    from game.field.battlefield import BattleField
+
+
+class Formation(ABC):
+    """
+    Базовый класс построения отряда
+
+    Построение только считает позиции для заданного числа юнитов от точки origin,
+    проверку границ поля и занятости клеток делает BattleField.add_units
+    """
+
+    def __init__(self, origin: Position = Position(0)):
+        self.origin = origin
+
+
+    @abstractmethod
+    def positions(self, count: int, battlefield: Optional['BattleField'] = None) -> List[Position]:
+        """
+        Позиции для count юнитов построения
+        :param count:
+        :param battlefield: поле, если построению нужны его размеры
+        :return:
+        """
+
+
+class Line(Formation):
+    """
+    Шеренга: юниты в ряд вдоль оси x через spacing клеток
+    """
+
+    def __init__(self, origin: Position = Position(0), spacing: int = 1):
+        super().__init__(origin)
+        self.spacing = spacing
+
+
+    def positions(self, count: int, battlefield: Optional['BattleField'] = None) -> List[Position]:
+        x, y = self.origin.x, self.origin.y
+        return [Position(x + index * self.spacing, y) for index in range(count)]
+
+
+class Column(Formation):
+    """
+    Колонна: юниты друг под другом через spacing рядов. Координата x сдвигается так,
+    чтобы на экране колонна шла ровно вниз, а не по диагонали осевых координат
+    """
+
+    def __init__(self, origin: Position = Position(0), spacing: int = 1):
+        super().__init__(origin)
+        self.spacing = spacing
+
+
+    def positions(self, count: int, battlefield: Optional['BattleField'] = None) -> List[Position]:
+        x, y = self.origin.x, self.origin.y
+        result = []
+        for index in range(count):
+            row = y + index * self.spacing
+            result.append(Position(x - (row // 2 - y // 2), row))
+        return result
+
+
+class Wedge(Formation):
+    """
+    Клин: острие в origin, за ним слои по 2, 3, 4, ... юнита, расходящиеся назад.
+    facing - куда смотрит острие: 1 - вправо, -1 - влево
+    """
+
+    def __init__(self, origin: Position = Position(0), facing: int = 1):
+        super().__init__(origin)
+        self.facing = facing
+
+
+    def positions(self, count: int, battlefield: Optional['BattleField'] = None) -> List[Position]:
+        x, y = self.origin.x, self.origin.y
+        result = []
+        layer = 0
+        while len(result) < count:
+            # клетки слоя: layer шагов назад по двум задним диагоналям в разных пропорциях
+            for down in range(layer + 1):
+                if len(result) == count:
+                    break
+                up = layer - down
+                if self.facing > 0:
+                    result.append(Position(x - down, y - up + down))
+                else:
+                    result.append(Position(x + up, y - up + down))
+            layer += 1
+        return result
+
+
+class Scatter(Formation):
+    """
+    Случайная россыпь по свободным клеткам прямоугольника (в осевых координатах) width x height от origin.
+    Если размеры не поданы, прямоугольник тянется до края поля.
+    Клетки выбираются из потока rng без повторов, занятые клетки поля пропускаются
+    """
+
+    def __init__(
+            self,
+            origin: Position = Position(0),
+            width: Optional[int] = None,
+            height: Optional[int] = None,
+            rng: Optional[RandomStream] = None
+    ):
+        super().__init__(origin)
+        self.width = width
+        self.height = height
+        self.rng = rng if rng is not None else RandomStream()
+
+
+    def positions(self, count: int, battlefield: Optional['BattleField'] = None) -> List[Position]:
+        x, y = self.origin.x, self.origin.y
+        if battlefield is None and (self.width is None or self.height is None):
+            raise ValueError('Для случайной расстановки без поля нужно задать ширину и высоту области')
+
+        width = self.width if self.width is not None else battlefield.width - x
+        height = self.height if self.height is not None else battlefield.height - y
+
+        candidates = [
+            (column, row) for row in range(y, y + height) for column in range(x, x + width)
+            if battlefield is None or battlefield.is_position_available(Position(column, row))
+        ]
+        if len(candidates) < count:
+            raise ValueError(
+                f'В области {width}x{height} от {self.origin} только {len(candidates)} свободных клеток, '
+                f'а юнитов {count}'
+            )
+
+        # частичная перетасовка Фишера-Йетса: первые count клеток - случайная выборка без повторов
+        rng = self.rng
+        for index in range(count):
+            chosen = rng.randint(index, len(candidates) - 1)
+            candidates[index], candidates[chosen] = candidates[chosen], candidates[index]
+        return [Position(column, row) for column, row in candidates[:count]]
+
+
+FORMATIONS: Dict[str, Type[Formation]] = {
+    'line': Line,
+    'column': Column,
+    'wedge': Wedge,
+    'random': Scatter,
+}
+
+
+def get_formation(formation: Union[str, Formation], origin: Position = Position(0)) -> Formation:
+    """
+    Возвращает построение по имени ('line', 'column', 'wedge', 'random') или само поданное построение
+    :param formation:
+    :param origin:
+    :return:
+    """
+
+    if isinstance(formation, Formation):
+        return formation
+    if formation not in FORMATIONS:
+        raise ValueError(f'Неизвестное построение {formation}. Доступные построения: {list(FORMATIONS)}')
+    return FORMATIONS[formation](origin)
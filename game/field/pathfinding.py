@@ -0,0 +1,400 @@
+from collections import OrderedDict
+from heapq import heapify, heappush, heappop
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple, TYPE_CHECKING
+from game.field.position import Position
+from core.logging.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+if TYPE_CHECKING:
+    from game.field.battlefield import BattleField
+    from game.units.base_units import Unit
+
+
+# Стоимость прохода через занятую клетку. Занятые клетки не запрещены для поля расстояний, а просто дороги,
+# поэтому юнит за спиной союзника ждет, пока путь освободится, а не стоит столбом из-за недостижимости цели
+OCCUPIED_CELL_COST = 5
+
+_UNREACHABLE = 1 << 30
+
+# Стоимость входа в клетку по ее занятости (таблица для bytearray.translate)
+_CELL_COSTS = bytes([1, OCCUPIED_CELL_COST]) + bytes(254)
+
+
+class DistanceField:
+    """
+    Класс поля расстояний (flow field) до множества клеток-целей
+
+    Цели - клетки юнитов, подходящих под is_goal (например, все враги стороны или один юнит), поле находит путь
+    к ближайшей из них (многоисточниковый алгоритм Дейкстры). Для каждой клетки поля хранит стоимость пути
+    до ближайшей цели: вход в свободную клетку стоит 1, в занятую - OCCUPIED_CELL_COST, в клетку цели - 1.
+    Стоимость клетки не зависит от ее собственной занятости, поэтому одно поле подходит всем юнитам, идущим к целям.
+
+    Поле хранит стоимости клеток и отметки целей, по которым оно посчитано.
+    Поле считается один раз, а при изменении клетки чинится инкрементально (см. sync_cell):
+        - клетка подешевела или стала целью: расстояния только уменьшаются, уменьшения распространяются от нее
+        - клетка подорожала или перестала быть целью: находятся клетки, чей кратчайший путь опирался на нее,
+          и пересчитываются только они
+    """
+
+    def __init__(self, battlefield: 'BattleField', is_goal: Callable[['Unit'], bool]):
+        self.battlefield = battlefield
+        self.is_goal = is_goal
+        self.distances: List[int] = []
+        self.costs = bytearray()
+        self.goals = bytearray()
+        self._build()
+
+
+    def _build(self):
+        """
+        Считает поле расстояний с нуля по текущей занятости поля битвы
+        :return:
+        """
+
+        battlefield = self.battlefield
+        width = battlefield.width
+        self.costs = costs = battlefield._occupied.translate(_CELL_COSTS)
+        self.goals = goals = bytearray(battlefield.size)
+        self.distances = distances = [_UNREACHABLE] * battlefield.size
+        heap = []
+        is_goal = self.is_goal
+        for unit, position in battlefield._unit_positions.items():
+            if is_goal(unit):
+                index = position.y * width + position.x
+                costs[index] = 1
+                goals[index] = 1
+                distances[index] = 0
+                heap.append((0, index))
+        self._propagate(heap)
+
+
+    def _propagate(self, heap: List[Tuple[int, int]]):
+        """
+        Распространяет уменьшения расстояний от клеток из кучи (алгоритм Дейкстры)
+        :param heap:
+        :return:
+        """
+
+        distances = self.distances
+        costs = self.costs
+        neighbour_table = self.battlefield._get_neighbour_index_table()
+
+        while heap:
+            distance, index = heappop(heap)
+            if distance > distances[index]:
+                continue
+            next_distance = distance + costs[index]
+            for neighbour in neighbour_table[index]:
+                if next_distance < distances[neighbour]:
+                    distances[neighbour] = next_distance
+                    heappush(heap, (next_distance, neighbour))
+
+
+    def _get_cell_state(self, index: int) -> Tuple[bool, int]:
+        """
+        Отметка цели и стоимость клетки по текущему юниту в ней
+        :param index:
+        :return: (цель ли клетка, стоимость входа в нее)
+        """
+
+        unit = self.battlefield.cells[index]
+        if unit is None:
+            return False, 1
+        if self.is_goal(unit):
+            return True, 1
+        return False, OCCUPIED_CELL_COST
+
+
+    def sync_cells(self, indices: Iterable[int]):
+        """
+        Синхронизирует клетки с полем битвы. Сначала клетки, которые подешевели или стали целями: тогда клеткам,
+        потерявшим опору, чаще находится новая, и цель, шагнувшая на соседнюю клетку, почти не трогает поле
+        :param indices:
+        :return:
+        """
+
+        cheaper, dearer = [], []
+        for index in indices:
+            goal, cost = self._get_cell_state(index)
+            if goal != self.goals[index] or cost != self.costs[index]:
+                (cheaper if goal or cost < self.costs[index] else dearer).append(index)
+        for index in cheaper:
+            self.sync_cell(index)
+        for index in dearer:
+            self.sync_cell(index)
+
+
+    def sync_cell(self, index: int):
+        """
+        Приводит стоимость клетки и отметку цели в поле к клетке поля битвы и, если они изменились, чинит расстояния.
+        Каждое изменение чинится точно относительно текущего состояния поля, поэтому клетки можно синхронизировать
+        в любом порядке
+        :param index:
+        :return:
+        """
+
+        goal, cost = self._get_cell_state(index)
+
+        if self.goals[index] and not goal:
+            self.goals[index] = 0
+            self._on_support_lost([(0, index)])
+
+        old_cost = self.costs[index]
+        if cost != old_cost:
+            self.costs[index] = cost
+            if cost > old_cost:
+                old_via_cell = self.distances[index] + old_cost
+                self._on_support_lost([
+                    (self.distances[neighbour], neighbour)
+                    for neighbour in self.battlefield._get_neighbour_index_table()[index]
+                    if self.distances[neighbour] == old_via_cell
+                ])
+            else:
+                self._on_cost_decreased(index)
+
+        if goal and not self.goals[index]:
+            self.goals[index] = 1
+            self.distances[index] = 0
+            self._propagate([(0, index)])
+
+
+    def _on_cost_decreased(self, index: int):
+        """
+        Клетка подешевела: соседи могут получить более короткий путь через нее
+        :param index:
+        :return:
+        """
+
+        distances = self.distances
+        via_cell = distances[index] + self.costs[index]
+        heap = []
+        for neighbour in self.battlefield._get_neighbour_index_table()[index]:
+            if via_cell < distances[neighbour]:
+                distances[neighbour] = via_cell
+                heappush(heap, (via_cell, neighbour))
+        self._propagate(heap)
+
+
+    def _on_support_lost(self, heap: List[Tuple[int, int]]):
+        """
+        Клетки из кучи могли потерять опору (подорожала клетка на их кратчайшем пути или перестала быть целью
+        она сама): клетки, у которых не осталось другого кратчайшего пути, пересчитываются от границы
+        :param heap: (расстояние, клетка) кандидатов
+        :return:
+        """
+
+        distances = self.distances
+        costs = self.costs
+        goals = self.goals
+        neighbour_table = self.battlefield._get_neighbour_index_table()
+
+        # Ищем клетки, потерявшие опору, в порядке возрастания расстояния
+        heapify(heap)
+        affected = set()
+
+        while heap:
+            distance, cell = heappop(heap)
+            if cell in affected or goals[cell]:
+                continue
+            supported = False
+            for neighbour in neighbour_table[cell]:
+                if distances[neighbour] + costs[neighbour] == distance and neighbour not in affected:
+                    supported = True
+                    break
+            if supported:
+                continue
+            affected.add(cell)
+            next_distance = distance + costs[cell]
+            for neighbour in neighbour_table[cell]:
+                if distances[neighbour] == next_distance and neighbour not in affected:
+                    heappush(heap, (next_distance, neighbour))
+
+        if not affected:
+            return
+
+        for cell in affected:
+            distances[cell] = _UNREACHABLE
+
+        # Заново засеваем затронутые клетки от соседей с верными расстояниями
+        heap = []
+        for cell in affected:
+            best = _UNREACHABLE
+            for neighbour in neighbour_table[cell]:
+                via_neighbour = distances[neighbour] + costs[neighbour]
+                if via_neighbour < best:
+                    best = via_neighbour
+            if best < _UNREACHABLE:
+                distances[cell] = best
+                heappush(heap, (best, cell))
+        self._propagate(heap)
+
+
+    def get_distance(self, position: Position) -> int:
+        """
+        Стоимость пути от позиции до ближайшей цели
+        :param position:
+        :return:
+        """
+
+        return self.distances[self.battlefield._index(position)]
+
+
+    def next_position(self, position: Position, max_steps: int) -> Optional[Position]:
+        """
+        Ведет юнита вниз по полю расстояний не более чем на max_steps шагов, наступая только на свободные клетки
+        :param position:
+        :param max_steps:
+        :return: конечная позиция или None, если сделать шаг не получилось
+        """
+
+        distances = self.distances
+        occupied = self.battlefield._occupied
+        neighbour_table = self.battlefield._get_neighbour_index_table()
+
+        index = self.battlefield._index(position)
+        current = distances[index]
+        moved = False
+
+        for _ in range(max_steps):
+            best_index, best_distance = index, current
+            for neighbour in neighbour_table[index]:
+                if not occupied[neighbour] and distances[neighbour] < best_distance:
+                    best_index, best_distance = neighbour, distances[neighbour]
+            if best_index == index:
+                break
+            index, current = best_index, best_distance
+            moved = True
+
+        if not moved:
+            return None
+        return Position(index % self.battlefield.width, index // self.battlefield.width)
+
+
+class PathFinder:
+    """
+    Класс поиска пути на поле битвы
+
+    Хранит кэш полей расстояний (не больше max_fields, вытесняются давно не использованные):
+        - юнит команды идет по полю своей стороны, целями которого служат все ее враги, так что вся сторона
+          пользуется одним полем и идет к ближайшему по пути врагу
+        - юнит без команды идет по полю своего юнита-цели; поле цели, которая ушла с поля (погибла), выбрасывается
+    Перемещения и гибель целей, как и любые изменения занятости, чинятся инкрементально.
+
+    Поле битвы сообщает об изменениях занятости клеток, а поиск пути только записывает их в журнал.
+    Поле чинится лениво, когда его запрашивают: по клеткам из журнала, которые изменились с его прошлого запроса.
+    Если таких клеток больше max_pending (или журнал уже обрезан), поле дешевле построить заново
+    """
+
+    def __init__(self, battlefield: 'BattleField', max_fields: int = 64, max_pending: int = 64):
+        self.battlefield = battlefield
+        self.max_fields = max_fields
+        self.max_pending = max_pending
+        # ключ поля - команда стороны или юнит-цель для юнитов без команды
+        self._fields: 'OrderedDict[Hashable, DistanceField]' = OrderedDict()
+        # до какого номера изменения в журнале поле уже починено
+        self._synced: Dict[Hashable, int] = {}
+        self._changes: List[int] = []
+        self._changes_start = 0  # номер первого изменения, которое еще хранится в журнале
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def get_field(self, unit: Optional['Unit'], target: 'Unit') -> DistanceField:
+        """
+        Возвращает поле расстояний, по которому юнит идет к цели, при необходимости строя или чиня его
+        :param unit: идущий юнит (None - неизвестен, тогда используется поле юнита-цели)
+        :param target:
+        :return:
+        """
+
+        team = unit.team if unit is not None else None
+        key = target if team is None else team
+        fields = self._fields
+        changes_end = self._changes_start + len(self._changes)
+        field = fields.get(key)
+
+        if field is None:
+            self._evict()
+            if team is None:
+                field = DistanceField(self.battlefield, lambda other: other is target)
+            else:
+                field = DistanceField(self.battlefield, lambda other: other.team != team)
+            fields[key] = field
+            logger.debug("Distance field built for %s", key)
+        else:
+            synced = self._synced[key]
+            if synced != changes_end:
+                if synced < self._changes_start or changes_end - synced > self.max_pending:
+                    field._build()
+                else:
+                    field.sync_cells(set(self._changes[synced - self._changes_start:]))
+            fields.move_to_end(key)
+
+        self._synced[key] = changes_end
+        return field
+
+
+    def _evict(self):
+        """
+        Освобождает в кэше место под новое поле: выбрасывает поля юнитов-целей, которых уже нет на поле битвы,
+        а если кэш все равно полон - давно не использованные
+        :return:
+        """
+
+        fields = self._fields
+        unit_positions = self.battlefield._unit_positions
+        for key in [key for key in fields if not isinstance(key, int) and key not in unit_positions]:
+            del fields[key]
+            del self._synced[key]
+        while len(fields) >= self.max_fields:
+            key, _ = fields.popitem(last=False)
+            del self._synced[key]
+
+
+    def next_position(self, position: Position, target: 'Unit', max_steps: int) -> Optional[Position]:
+        """
+        Позиция, в которую юнит дойдет за max_steps шагов по кратчайшему пути к цели
+        (для юнита команды - к ближайшему по пути врагу его стороны)
+        :param position: позиция идущего юнита
+        :param target:
+        :param max_steps:
+        :return:
+        """
+
+        unit = self.battlefield.cells[self.battlefield._index(position)]
+        return self.get_field(unit, target).next_position(position, max_steps)
+
+
+    def on_cell_changed(self, index: int):
+        """
+        Записывает изменение занятости клетки в журнал (поля чинятся по нему при следующем запросе).
+        Журнал обрезается по самому отставшему полю, а поля, отставшие больше чем на max_pending изменений,
+        в этот момент больше не учитываются: они все равно будут построены заново
+        :param index:
+        :return:
+        """
+
+        changes = self._changes
+        changes.append(index)
+        if len(changes) > 4 * self.max_pending:
+            changes_end = self._changes_start + len(changes)
+            oldest = min(
+                (synced for synced in self._synced.values() if changes_end - synced <= self.max_pending),
+                default=changes_end
+            )
+            del changes[:oldest - self._changes_start]
+            self._changes_start = oldest
+
+
+    def clear(self):
+        """
+        Сбрасывает все закэшированные поля (после массовых изменений поля дешевле построить их заново)
+        :return:
+        """
+
+        self._fields.clear()
+        self._synced.clear()
+        self._changes_start += len(self._changes)
+        self._changes.clear()
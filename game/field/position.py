@@ -1,19 +1,137 @@
+from typing import Dict, Iterator, Tuple
+
+
+# Шесть направлений на гексагональной сетке в осевых координатах (x, y) в порядке обхода кольца в Position.ring
+HEX_DIRECTIONS: Tuple[Tuple[int, int], ...] = ((1, -1), (1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1))
+
+
 class Position:
     """
-    Класс позиции (в будущем для более удобной работы с гексами)
+    Класс позиции на гексагональном поле
+
+    Хранит осевые координаты ячейки (x, y), отсчет начинается с НУЛЯ, чтобы не ебаться с этим пока.
+    Одномерное поле - частный случай с y = 0, там расстояние между клетками равно разнице x.
 
-    Хранит координаты ячейки поля, отсчет начинается с НУЛЯ, чтобы не ебаться с этим пока
+    Позиции неизменяемы и интернированы: для каждой пары координат существует ровно один объект,
+    поэтому сравнение и хэширование работают по идентичности, а повторные позиции не создаются заново
     """
 
-    def __init__(self, x: int, y: int = 0):
-        self.x = x
-        self.y = y
+    __slots__ = ('x', 'y')
+
+    # Все созданные позиции по координатам
+    _cache: Dict[Tuple[int, int], 'Position'] = {}
+
+
+    def __new__(cls, x: int, y: int = 0):
+        position = cls._cache.get((x, y))
+        if position is None:
+            candidate = object.__new__(cls)
+            object.__setattr__(candidate, 'x', x)
+            object.__setattr__(candidate, 'y', y)
+            # setdefault атомарен: если другой поток успел интернировать позицию раньше, берем его объект
+            position = cls._cache.setdefault((x, y), candidate)
+        return position
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError('позиция неизменяема')
+
+
+    def __reduce__(self):
+        # при распаковке (например, в другом процессе) позиция снова интернируется
+        return Position, (self.x, self.y)
 
 
     def direction_to(self, target_position: 'Position'):
         return 1 if target_position.x > self.x else -1
 
 
+    def distance_to(self, other: 'Position') -> int:
+        """
+        Гексагональное расстояние до другой позиции (в осевых координатах)
+        :param other:
+        :return:
+        """
+
+        dx = self.x - other.x
+        dy = self.y - other.y
+        return (abs(dx) + abs(dy) + abs(dx + dy)) // 2
+
+
+    def neighbour(self, direction: int) -> 'Position':
+        """
+        Соседняя позиция в направлении HEX_DIRECTIONS[direction]
+        :param direction:
+        :return:
+        """
+
+        dx, dy = HEX_DIRECTIONS[direction]
+        return Position(self.x + dx, self.y + dy)
+
+
+    def ring(self, radius: int) -> Iterator['Position']:
+        """
+        Перебирает позиции на расстоянии ровно radius (без учета границ поля).
+
+        Обход начинается с клетки слева (x - radius, y), поэтому на одномерном поле левая клетка всегда идет раньше правой
+        :param radius:
+        :return:
+        """
+
+        if radius == 0:
+            yield self
+            return
+
+        x, y = self.x - radius, self.y
+        for dx, dy in HEX_DIRECTIONS:
+            for _ in range(radius):
+                yield Position(x, y)
+                x += dx
+                y += dy
+
+
+    def step_towards(self, target: 'Position', steps: int) -> 'Position':
+        """
+        Позиция на прямой (гексагональной линии) от текущей позиции к цели через steps шагов.
+
+        Если шагов больше, чем расстояние до цели, линия продолжается за цель
+        :param target:
+        :param steps:
+        :return:
+        """
+
+        distance = self.distance_to(target)
+        if distance == 0:
+            return self
+
+        ratio = steps / distance
+        # небольшой сдвиг убирает неоднозначность округления на границе двух клеток
+        x = self.x + (target.x - self.x) * ratio + 1e-6
+        y = self.y + (target.y - self.y) * ratio + 2e-6
+        return self._round(x, y)
+
+
+    @staticmethod
+    def _round(x: float, y: float) -> 'Position':
+        """
+        Округляет дробные осевые координаты до ближайшей клетки (через кубические координаты)
+        :param x:
+        :param y:
+        :return:
+        """
+
+        z = -x - y
+        rounded_x, rounded_y, rounded_z = round(x), round(y), round(z)
+        x_diff, y_diff, z_diff = abs(rounded_x - x), abs(rounded_y - y), abs(rounded_z - z)
+
+        if x_diff > y_diff and x_diff > z_diff:
+            rounded_x = -rounded_y - rounded_z
+        elif y_diff > z_diff:
+            rounded_y = -rounded_x - rounded_z
+
+        return Position(rounded_x, rounded_y)
+
+
     def __add__(self, other: int):
         return Position(self.x + other, self.y)
 
@@ -23,8 +141,12 @@ class Position:
 
 
     def __lt__(self, other: 'Position'):
-        return self.x < other.x
+        return (self.x, self.y) < (other.x, other.y)
 
 
     def __str__(self):
         return f"({self.x}, {self.y})"
+
+
+    def __repr__(self):
+        return f"Position({self.x}, {self.y})"
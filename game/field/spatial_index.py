@@ -0,0 +1,310 @@
+from typing import Dict, List, Optional, TYPE_CHECKING
+from game.field.position import Position
+
+
+if TYPE_CHECKING:
+    from game.units.base_units import Unit
+
+
+class SpatialIndex:
+    """
+    Класс пространственного индекса юнитов на поле
+
+    Делит поле на квадратные (в осевых координатах) корзины bucket_size x bucket_size и хранит юнитов по корзинам,
+    отдельная сетка корзин на каждую команду (юниты без команды - в общей сетке команды None). Поиск врагов
+    обходит только сетки чужих команд (юнит без команды - все сетки, кроме себя самого), поэтому своя армия,
+    даже стоящая плотным блоком вокруг, поиск не замедляет.
+    Поиск ближайшего врага обходит корзины кольцами от корзины юнита и останавливается, как только
+    ближайшая возможная клетка следующего кольца дальше уже найденного врага. Обход начинается с первого кольца,
+    которое может задеть врага: каждая сетка считает своих юнитов по столбцам и строкам корзин, поэтому пустое
+    пространство между армиями не перебирается.
+
+    Команда юнита запоминается при добавлении в индекс: менять ее, пока юнит стоит на поле, нельзя.
+    При равном расстоянии ближайшим считается юнит, добавленный на поле раньше (как min() по списку юнитов в бою)
+    """
+
+    def __init__(self, width: int, height: int, bucket_size: int = 8):
+        self.bucket_size = bucket_size
+        self._columns = (width + bucket_size - 1) // bucket_size
+        self._rows = (height + bucket_size - 1) // bucket_size
+        self._grids: Dict[Optional[int], _TeamGrid] = {}
+        self._teams: Dict['Unit', Optional[int]] = {}
+        self._order: Dict['Unit', int] = {}
+        self._counter = 0
+
+
+    def _bucket_index(self, position: Position) -> int:
+        return (position.y // self.bucket_size) * self._columns + position.x // self.bucket_size
+
+
+    def _get_grid(self, team: Optional[int]) -> '_TeamGrid':
+        grid = self._grids.get(team)
+        if grid is None:
+            grid = self._grids[team] = _TeamGrid(self._columns, self._rows)
+        return grid
+
+
+    def _get_enemy_grids(self, unit: 'Unit') -> List['_TeamGrid']:
+        """
+        Сетки, в которых лежат враги юнита: все, кроме сетки его команды (у юнита без команды - все)
+        :param unit:
+        :return:
+        """
+
+        team = unit.team
+        return [grid for grid_team, grid in self._grids.items() if team is None or grid_team != team]
+
+
+    def add(self, unit: 'Unit', position: Position):
+        """
+        Добавляет юнита в индекс
+        :param unit:
+        :param position:
+        :return:
+        """
+
+        self._get_grid(unit.team).add(unit, position, self.bucket_size)
+        self._teams[unit] = unit.team
+        self._order[unit] = self._counter
+        self._counter += 1
+
+
+    def add_many(self, units: List['Unit']):
+        """
+        Добавляет в индекс пачку юнитов на их текущих позициях (в порядке списка)
+        :param units:
+        :return:
+        """
+
+        teams, order = self._teams, self._order
+        bucket_size = self.bucket_size
+        counter = self._counter
+        grid_team, grid = object(), None
+        for unit in units:
+            team = unit.team
+            if team != grid_team:
+                grid_team, grid = team, self._get_grid(team)
+            grid.add(unit, unit.position, bucket_size)
+            teams[unit] = team
+            order[unit] = counter
+            counter += 1
+        self._counter = counter
+
+
+    def remove(self, unit: 'Unit', position: Position):
+        """
+        Убирает юнита из индекса
+        :param unit:
+        :param position:
+        :return:
+        """
+
+        if unit in self._teams:
+            self._grids[self._teams.pop(unit)].remove(unit, position, self.bucket_size)
+        self._order.pop(unit, None)
+
+
+    def move(self, unit: 'Unit', old_position: Position, new_position: Position):
+        """
+        Переносит юнита на новую позицию (между корзинами, если нужно)
+        :param unit:
+        :param old_position:
+        :param new_position:
+        :return:
+        """
+
+        bucket_size = self.bucket_size
+        if old_position.x // bucket_size == new_position.x // bucket_size and \
+                old_position.y // bucket_size == new_position.y // bucket_size:
+            self._grids[self._teams[unit]].buckets[self._bucket_index(new_position)][unit] = new_position
+        else:
+            grid = self._grids[self._teams[unit]]
+            grid.remove(unit, old_position, bucket_size)
+            grid.add(unit, new_position, bucket_size)
+
+
+    def nearest_enemy(self, unit: 'Unit', position: Position) -> Optional['Unit']:
+        """
+        Ищет ближайшего к позиции врага юнита (см. Unit.is_enemy_of)
+        :param unit:
+        :param position:
+        :return:
+        """
+
+        bucket_size = self.bucket_size
+        center_column = position.x // bucket_size
+        center_row = position.y // bucket_size
+
+        # пустые сетки не обходятся, а обход начинается с самого близкого кольца, где может оказаться враг
+        grids = []
+        first_radius = max_radius = max(self._columns, self._rows)
+        for grid in self._get_enemy_grids(unit):
+            grid_radius = grid.get_min_radius(center_column, center_row)
+            if grid_radius is not None:
+                grids.append(grid.buckets)
+                first_radius = min(first_radius, grid_radius)
+
+        order = self._order
+        best: Optional['Unit'] = None
+        best_distance = 0
+        best_order = 0
+
+        x, y = position.x, position.y
+        columns = self._columns
+        for radius in range(first_radius, max_radius):
+            # ближайшая клетка кольца корзин radius не ближе (radius - 1) * bucket_size + 1
+            if best is not None and (radius - 1) * bucket_size + 1 > best_distance:
+                break
+
+            # непустые корзины кольца обходятся от ближайшей: как только нижняя граница расстояния до корзины
+            # больше уже найденного, остальные корзины кольца пропускаются
+            ring = []
+            for bucket_index in self._ring(center_column, center_row, radius):
+                for buckets in grids:
+                    bucket = buckets[bucket_index]
+                    if bucket:
+                        row, column = divmod(bucket_index, columns)
+                        ring.append((_get_bucket_bound(x, y, column * bucket_size, row * bucket_size, bucket_size), bucket))
+            ring.sort(key=_get_bound)
+
+            for bound, bucket in ring:
+                if best is not None and bound > best_distance:
+                    break
+                for other, other_position in bucket.items():
+                    if other is unit:
+                        continue
+                    dx = x - other_position.x
+                    dy = y - other_position.y
+                    distance = (abs(dx) + abs(dy) + abs(dx + dy)) // 2
+                    if (best is None or distance < best_distance or
+                            (distance == best_distance and order[other] < best_order)):
+                        best, best_distance, best_order = other, distance, order[other]
+
+        return best
+
+
+    def enemies_within(self, unit: 'Unit', position: Position, radius: int) -> List['Unit']:
+        """
+        Возвращает всех врагов юнита на расстоянии не больше radius от позиции (в порядке добавления на поле)
+        :param unit:
+        :param position:
+        :param radius:
+        :return:
+        """
+
+        bucket_size = self.bucket_size
+        first_column = max(0, (position.x - radius) // bucket_size)
+        last_column = min(self._columns - 1, (position.x + radius) // bucket_size)
+        first_row = max(0, (position.y - radius) // bucket_size)
+        last_row = min(self._rows - 1, (position.y + radius) // bucket_size)
+
+        found = []
+        for grid in self._get_enemy_grids(unit):
+            buckets = grid.buckets
+            for row in range(first_row, last_row + 1):
+                for column in range(first_column, last_column + 1):
+                    for other, other_position in buckets[row * self._columns + column].items():
+                        if other is unit:
+                            continue
+                        dx = position.x - other_position.x
+                        dy = position.y - other_position.y
+                        if (abs(dx) + abs(dy) + abs(dx + dy)) // 2 <= radius:
+                            found.append(other)
+
+        found.sort(key=self._order.__getitem__)
+        return found
+
+
+    def _ring(self, center_column: int, center_row: int, radius: int):
+        """
+        Перебирает индексы существующих корзин на расстоянии Чебышёва radius от центральной
+        :param center_column:
+        :param center_row:
+        :param radius:
+        :return:
+        """
+
+        for row in range(max(0, center_row - radius), min(self._rows, center_row + radius + 1)):
+            on_edge = abs(row - center_row) == radius
+            step = 1 if on_edge or radius == 0 else 2 * radius
+            for column in range(center_column - radius, center_column + radius + 1, step):
+                if 0 <= column < self._columns:
+                    yield row * self._columns + column
+
+
+class _TeamGrid:
+    """
+    Сетка корзин одной команды и число ее юнитов в каждом столбце и каждой строке корзин
+    """
+
+    __slots__ = ('buckets', 'columns', 'column_counts', 'row_counts', 'size')
+
+    def __init__(self, columns: int, rows: int):
+        self.buckets: List[Dict['Unit', Position]] = [{} for _ in range(columns * rows)]
+        self.columns = columns
+        self.column_counts = [0] * columns
+        self.row_counts = [0] * rows
+        self.size = 0
+
+
+    def add(self, unit: 'Unit', position: Position, bucket_size: int):
+        column, row = position.x // bucket_size, position.y // bucket_size
+        self.buckets[row * self.columns + column][unit] = position
+        self.column_counts[column] += 1
+        self.row_counts[row] += 1
+        self.size += 1
+
+
+    def remove(self, unit: 'Unit', position: Position, bucket_size: int):
+        column, row = position.x // bucket_size, position.y // bucket_size
+        if self.buckets[row * self.columns + column].pop(unit, None) is not None:
+            self.column_counts[column] -= 1
+            self.row_counts[row] -= 1
+            self.size -= 1
+
+
+    def get_min_radius(self, center_column: int, center_row: int) -> Optional[int]:
+        """
+        Нижняя граница расстояния Чебышёва (в корзинах) от корзины до юнитов сетки:
+        не меньше расстояния до ближайшего занятого столбца и до ближайшей занятой строки
+        :param center_column:
+        :param center_row:
+        :return: None, если сетка пуста
+        """
+
+        if not self.size:
+            return None
+        return max(_get_gap(self.column_counts, center_column), _get_gap(self.row_counts, center_row))
+
+
+def _get_bucket_bound(x: int, y: int, left: int, top: int, size: int) -> int:
+    """
+    Нижняя граница гексагонального расстояния от клетки до корзины size x size с левым верхним углом (left, top):
+    расстояние max(|dx|, |dy|, |dx + dy|) не меньше зазора по каждой из трех осей
+    :return:
+    """
+
+    right, bottom = left + size - 1, top + size - 1
+    gap_x = left - x if x < left else (x - right if x > right else 0)
+    gap_y = top - y if y < top else (y - bottom if y > bottom else 0)
+    total = x + y
+    gap_total = left + top - total if total < left + top else (total - right - bottom if total > right + bottom else 0)
+    return max(gap_x, gap_y, gap_total)
+
+
+def _get_bound(item: tuple) -> int:
+    return item[0]
+
+
+def _get_gap(counts: List[int], center: int) -> int:
+    """
+    Расстояние от center до ближайшего ненулевого счетчика (хотя бы один ненулевой есть)
+    :param counts:
+    :param center:
+    :return:
+    """
+
+    for gap in range(len(counts)):
+        if (center - gap >= 0 and counts[center - gap]) or (center + gap < len(counts) and counts[center + gap]):
+            return gap
+    return len(counts)
@@ -1 +1,10 @@
-from .battle_manager import BattleManager
\ No newline at end of file
+from .battle_manager import BattleManager
+from .batch_simulator import BatchSimulator, BattleStatistics
+from .vectorized_battle_engine import VectorizedBattleEngine
+from .replay import ReplayRecorder, ReplayPlayer
+from .game_state import GameState
+from .matchup_matrix import MatchupMatrix
+from .combat_solver import CombatSolver
+from .scheduler import TurnScheduler, InitiativeScheduler, TimelineScheduler
+from .tournament import Tournament
+from .army_optimizer import ArmyOptimizer
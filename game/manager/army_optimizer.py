@@ -0,0 +1,385 @@
+import math
+from multiprocessing import cpu_count
+from time import monotonic
+from typing import Dict, List, Optional, Sequence, Tuple
+from core.logging.logger import Logger
+from game.manager.batch_simulator import _deploy, _get_columns, worker_map
+from utils.random_stream import RandomStream
+
+
+logger = Logger(__name__)
+
+
+# Состав армии: ключ юнита в JSON -> количество
+Composition = Dict[str, int]
+
+# Геном армии: (количества юнитов по типам, порядок типов от передней колонны к задней, шаг по рядам)
+Genome = Tuple[Tuple[int, ...], Tuple[int, ...], int]
+
+# Армия, которую геном ставит на поле: (юниты от передней колонны к задней, шаг по рядам). Геномы, которые
+# отличаются только местом отсутствующих типов в порядке, дают одну и ту же армию
+ArmyKey = Tuple[Tuple[str, ...], int]
+
+# Шаги построения: 1 - плотный блок, 2 - юниты через ряд в шахматном порядке (шире фронт, меньше давки)
+SPACINGS = (1, 2)
+
+
+class ArmyOptimizer:
+    """
+    Класс подбора армии под бюджет очков (инструмент баланса)
+
+    Генетический алгоритм ищет армию, которая чаще всего побеждает заданную армию противника. Геном - количество
+    юнитов каждого типа (сумма цен из units.json не больше budget), порядок типов от передней колонны к задней
+    и шаг построения (см. SPACINGS). Армии стоят колоннами от своего края поля (см. _deploy), армия противника -
+    плотным блоком, первый тип ее состава - в передней колонне.
+
+    Приспособленность - доля очков в battles headless-боях против противника (победа 1, ничья 0.5), при равной -
+    лучше более дешевая армия. Все кандидаты играют бои с одними и теми же сидами, поэтому сравниваются честно.
+    Бои поколения делятся на пачки и считаются параллельно на пуле процессов, приспособленность уже
+    встречавшихся армий (см. ArmyKey) запоминается и не пересчитывается.
+
+    Поиск идет, пока не кончится time_budget секунд (поколение, на котором кончилось время, не доигрывается)
+    или generations поколений, или пока stall_generations поколений подряд не дают ни одного нового генома
+    (маленькое пространство армий уже перебрано)
+    """
+
+    def __init__(
+            self,
+            opponent: Composition,
+            budget: int,
+            units: Optional[Sequence[str]] = None,
+            width: int = 30,
+            height: int = 10,
+            battles: int = 20,
+            max_turns: int = 100,
+            population: int = 16,
+            elite: int = 2,
+            mutation_rate: float = 0.3,
+            time_budget: float = 60.0,
+            generations: Optional[int] = None,
+            processes: Optional[int] = None,
+            chunk_size: int = 5,
+            stall_generations: int = 20,
+            seed: int = 0
+    ):
+        from game.units.unit_factory import UnitFactory
+
+        registered_units = UnitFactory.get_registered_units()
+        self.units: List[str] = list(units) if units is not None else list(registered_units)
+        unknown = [unit_name for unit_name in [*self.units, *opponent] if unit_name not in registered_units]
+        if unknown:
+            raise ValueError(f'Неизвестные юниты: {", ".join(unknown)}')
+        if population < 2 or not 0 <= elite < population:
+            raise ValueError('В популяции должно быть хотя бы две армии, а элита должна быть меньше популяции')
+
+        self.costs = [UnitFactory.resolve(unit_name)[1].cost for unit_name in self.units]
+        if budget < min(self.costs):
+            raise ValueError(f'Бюджета {budget} не хватает ни на один юнит')
+
+        self.opponent = dict(opponent)
+        self.budget = budget
+        self.width = width
+        self.height = height
+        self.battles = battles
+        self.max_turns = max_turns
+        self.population = population
+        self.elite = elite
+        self.mutation_rate = mutation_rate
+        self.time_budget = time_budget
+        self.generations = generations
+        self.processes = processes or cpu_count()
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.stall_generations = stall_generations
+        self.immigrants = min(max(1, population // 8), population - elite)
+        if _get_columns(sum(self.opponent.values()), 1, height) > width // 2:
+            raise ValueError(f'Армия противника не помещается на половину поля {width}x{height}')
+
+        self.rng = RandomStream(seed)
+        self.fitness: Dict[ArmyKey, Tuple[float, int]] = {}
+        self.history: List[dict] = []
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def run(self) -> dict:
+        """
+        Ищет лучшую армию
+        :return: {"composition", "order", "spacing", "cost", "score", "battles", "generations", "evaluations",
+            "elapsed", "history": лучшие оценки по поколениям}
+        """
+
+        deadline = monotonic() + self.time_budget
+        started = monotonic()
+        population = [self._get_random_genome() for _ in range(self.population)]
+        generation = 0
+
+        with worker_map(self.processes) as map_function:
+            generation = self._evolve(population, map_function, deadline)
+
+        if not self.fitness:
+            raise ValueError('За отведенное время не оценена ни одна армия, увеличьте time_budget')
+
+        best = max(self.fitness, key=self.fitness.get)
+        army, spacing = best
+        result = {
+            "composition": {unit_name: army.count(unit_name) for unit_name in self.units if unit_name in army},
+            "order": list(dict.fromkeys(army)),
+            "spacing": spacing,
+            "cost": -self.fitness[best][1],
+            "score": self.fitness[best][0] / self.battles,
+            "battles": self.battles,
+            "generations": generation,
+            "evaluations": len(self.fitness),
+            "elapsed": monotonic() - started,
+            "history": self.history,
+        }
+        logger.info(
+            "Best army %s (%s points) scores %.3f after %d generations",
+            result["composition"], result["cost"], result["score"], generation
+        )
+        return result
+
+
+    def _evolve(self, population: List[Genome], map_function, deadline: float) -> int:
+        """
+        Крутит поколения, пока не кончится время или число поколений
+        :param population:
+        :param map_function: map или Pool.imap_unordered
+        :param deadline: срок по time.monotonic
+        :return: число полностью оцененных поколений
+        """
+
+        generation = 0
+        stalled = 0
+        while self.generations is None or generation < self.generations:
+            evaluated = len(self.fitness)
+            if not self._evaluate(population, map_function, deadline):
+                break
+            generation += 1
+            stalled = stalled + 1 if len(self.fitness) == evaluated else 0
+            if stalled >= self.stall_generations:
+                logger.info("No new armies for %d generations, search stopped", stalled)
+                break
+
+            # в элиту попадает по одному геному на армию
+            ranked = sorted(
+                {self._get_key(genome): genome for genome in population}.values(), key=self._get_rank, reverse=True
+            )
+            best = ranked[0]
+            self.history.append({
+                "generation": generation,
+                "score": self._get_rank(best)[0] / self.battles,
+                "cost": self._get_cost(best[0]),
+                "evaluations": len(self.fitness),
+            })
+            logger.info("Generation %d: best score %.3f", generation, self.history[-1]["score"])
+
+            # несколько случайных армий в каждом поколении не дают популяции сойтись к одному составу раньше времени
+            children = ranked[:self.elite] + [self._get_random_genome() for _ in range(self.immigrants)]
+            while len(children) < self.population:
+                first, second = self._select(population), self._select(population)
+                children.append(self._mutate(self._crossover(first, second)))
+            population = children
+
+        return generation
+
+
+    def _evaluate(self, population: List[Genome], map_function, deadline: float) -> bool:
+        """
+        Досчитывает приспособленность новых армий поколения (см. ArmyKey) пачками боев.
+        Армия, все бои которой сыграны, запоминается сразу, даже если поколение не успеет оцениться целиком
+        :param population:
+        :param map_function:
+        :param deadline:
+        :return: успело ли поколение оцениться до срока
+        """
+
+        pending_genomes: Dict[ArmyKey, Genome] = {}
+        for genome in population:
+            key = self._get_key(genome)
+            if key not in self.fitness:
+                pending_genomes.setdefault(key, genome)
+        pending = list(pending_genomes.items())
+        tasks = [
+            (list(army), spacing, self.opponent, self.width, self.height, self.max_turns, self.seed,
+             start, min(self.chunk_size, self.battles - start), index)
+            for index, ((army, spacing), _) in enumerate(pending)
+            for start in range(0, self.battles, self.chunk_size)
+        ]
+        scores = [0.0] * len(pending)
+        chunks_left = [math.ceil(self.battles / self.chunk_size)] * len(pending)
+        for index, chunk_score in map_function(_evaluate_chunk, tasks):
+            scores[index] += chunk_score
+            chunks_left[index] -= 1
+            if not chunks_left[index]:
+                key, genome = pending[index]
+                self.fitness[key] = (scores[index], -self._get_cost(genome[0]))
+            if monotonic() >= deadline:
+                return False
+
+        return monotonic() < deadline
+
+
+    def _get_rank(self, genome: Genome) -> Tuple[float, int]:
+        return self.fitness[self._get_key(genome)]
+
+
+    def _get_key(self, genome: Genome) -> ArmyKey:
+        return tuple(self._get_army(genome)), genome[2]
+
+
+    def _get_cost(self, counts: Sequence[int]) -> int:
+        return sum(count * cost for count, cost in zip(counts, self.costs))
+
+
+    def _get_army(self, genome: Genome) -> List[str]:
+        """
+        Юниты армии от передней колонны к задней
+        :param genome:
+        :return:
+        """
+
+        counts, order, _ = genome
+        return [self.units[index] for index in order for _ in range(counts[index])]
+
+
+    def _get_random_genome(self) -> Genome:
+        # перемешивание Фишера - Йетса
+        order = list(range(len(self.units)))
+        for index in range(len(order) - 1, 0, -1):
+            other = self.rng.randint(0, index)
+            order[index], order[other] = order[other], order[index]
+        spacing = SPACINGS[self.rng.randint(0, len(SPACINGS) - 1)]
+        counts = self._fill([0] * len(self.units), spacing)
+        return tuple(counts), tuple(order), spacing
+
+
+    def _fill(self, counts: List[int], spacing: int) -> List[int]:
+        """
+        Докупает случайных юнитов, пока хватает бюджета и места на поле.
+        Типы выбираются со случайными весами (свои на каждую докупку), иначе почти все армии выходили бы
+        смешанными поровну, а однородные не встречались бы вовсе
+        :param counts:
+        :param spacing:
+        :return:
+        """
+
+        weights = [self.rng.random() ** 3 for _ in self.units]
+        while True:
+            left = self.budget - self._get_cost(counts)
+            affordable = [index for index, cost in enumerate(self.costs) if cost <= left]
+            if not affordable or not self._fits(sum(counts) + 1, spacing):
+                return counts
+            point = self.rng.random() * sum(weights[index] for index in affordable)
+            for index in affordable:
+                point -= weights[index]
+                if point <= 0:
+                    break
+            counts[index] += 1
+
+
+    def _repair(self, counts: List[int], spacing: int) -> List[int]:
+        """
+        Убирает случайных юнитов, пока армия не уложится в бюджет и на поле
+        :param counts:
+        :param spacing:
+        :return:
+        """
+
+        while self._get_cost(counts) > self.budget or not self._fits(sum(counts), spacing):
+            present = [index for index, count in enumerate(counts) if count]
+            counts[present[self.rng.randint(0, len(present) - 1)]] -= 1
+        if not any(counts):
+            return self._fill(counts, spacing)
+        return counts
+
+
+    def _fits(self, size: int, spacing: int) -> bool:
+        return _get_columns(size, spacing, self.height) <= self.width // 2
+
+
+    def _select(self, population: List[Genome]) -> Genome:
+        """
+        Турнирный отбор из трех
+        :param population:
+        :return:
+        """
+
+        contenders = [population[self.rng.randint(0, len(population) - 1)] for _ in range(3)]
+        return max(contenders, key=self._get_rank)
+
+
+    def _crossover(self, first: Genome, second: Genome) -> Genome:
+        """
+        Равномерное скрещивание количеств, порядок и шаг - от одного из родителей
+        :param first:
+        :param second:
+        :return:
+        """
+
+        counts = [
+            first_count if self.rng.randint(0, 1) else second_count
+            for first_count, second_count in zip(first[0], second[0])
+        ]
+        order = first[1] if self.rng.randint(0, 1) else second[1]
+        spacing = first[2] if self.rng.randint(0, 1) else second[2]
+        return tuple(self._repair(counts, spacing)), order, spacing
+
+
+    def _mutate(self, genome: Genome) -> Genome:
+        """
+        Мутации: обмен одного-трех юнитов одного типа на другой, перестановка двух типов в порядке, смена шага,
+        докупка на остаток бюджета
+        :param genome:
+        :return:
+        """
+
+        counts, order, spacing = list(genome[0]), list(genome[1]), genome[2]
+        types = len(self.units)
+        if types > 1 and self._roll():
+            source, target = self.rng.randint(0, types - 1), self.rng.randint(0, types - 1)
+            if source != target:
+                moved = min(counts[source], self.rng.randint(1, 3))
+                counts[source] -= moved
+                counts[target] += moved
+        if types > 1 and self._roll():
+            first, second = self.rng.randint(0, types - 1), self.rng.randint(0, types - 1)
+            order[first], order[second] = order[second], order[first]
+        if self._roll():
+            spacing = SPACINGS[self.rng.randint(0, len(SPACINGS) - 1)]
+        counts = self._repair(counts, spacing)
+        if self._roll():
+            counts = self._fill(counts, spacing)
+        return tuple(counts), tuple(order), spacing
+
+
+    def _roll(self) -> bool:
+        return self.rng.randint(0, 999) < self.mutation_rate * 1000
+
+
+def _evaluate_chunk(task: tuple) -> Tuple[int, float]:
+    """
+    Играет пачку боев кандидата против противника в текущем процессе
+    :param task: (армия кандидата, ее шаг построения, состав противника, ширина и высота поля, ограничение ходов, сид,
+        номер первого боя, число боев, номер кандидата)
+    :return: номер кандидата и его очки в пачке
+    """
+
+    from game.field.battlefield import BattleField
+    from game.manager.battle_manager import BattleManager
+
+    army, spacing, opponent, width, height, max_turns, seed, start, count, index = task
+    opponent_army = [unit_name for unit_name, unit_count in opponent.items() for _ in range(unit_count)]
+    score = 0.0
+    for battle_number in range(start, start + count):
+        units = _deploy(army, 0, width, height, spacing) + _deploy(opponent_army, 1, width, height)
+        battle = BattleManager(
+            BattleField(width, height), headless=True, max_turns=max_turns,
+            rng=RandomStream(RandomStream.derive_seed(seed, battle_number))
+        )
+        winner = battle.run(*units)
+        if winner is None:
+            score += 0.5
+        elif winner.team == 0:
+            score += 1.0
+    return index, score
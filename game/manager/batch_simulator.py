@@ -0,0 +1,264 @@
+import math
+from contextlib import contextmanager
+from multiprocessing import Pool, cpu_count
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from core.logging.logger import Logger, set_logging_enabled, logging_disabled
+from utils.random_stream import RandomStream
+
+
+logger = Logger(__name__)
+
+
+# Описание одного юнита в бою: (ключ юнита в JSON, координата x)
+UnitSetup = Tuple[str, int]
+
+
+class BattleStatistics:
+    """
+    Класс накопленной статистики по серии боев
+
+    Хранит только суммы, поэтому статистики разных процессов можно складывать через merge()
+    Юниты обозначаются индексами в порядке, в котором они описаны в раскладке боя
+    """
+
+    def __init__(self, sides: int):
+        self.sides = sides
+        self.battles = 0
+        self.draws = 0
+        self.wins = [0] * sides
+        self.damage_total = [0] * sides
+        self.turns_total = 0
+        self.turns_squares_total = 0  # для разброса длины боя
+        self.turns_min: Optional[int] = None
+        self.turns_max: Optional[int] = None
+        self.turns_counts: Dict[int, int] = {}  # ход -> сколько боев закончились на нем
+
+
+    def add_result(self, result: dict):
+        """
+        Добавляет в статистику результат одного боя (см. BattleManager.get_battle_result)
+        :param result:
+        :return:
+        """
+
+        self.battles += 1
+
+        winner = result["winner"]
+        if winner is None:
+            self.draws += 1
+        else:
+            self.wins[winner] += 1
+
+        for index, damage in enumerate(result["damage"]):
+            self.damage_total[index] += damage
+
+        turns = result["turns"]
+        self.turns_total += turns
+        self.turns_squares_total += turns * turns
+        self.turns_min = turns if self.turns_min is None else min(self.turns_min, turns)
+        self.turns_max = turns if self.turns_max is None else max(self.turns_max, turns)
+        self.turns_counts[turns] = self.turns_counts.get(turns, 0) + 1
+
+
+    def merge(self, other: 'BattleStatistics'):
+        """
+        Складывает с текущей статистикой статистику другой серии боев
+        :param other:
+        :return:
+        """
+
+        self.battles += other.battles
+        self.draws += other.draws
+        for index in range(self.sides):
+            self.wins[index] += other.wins[index]
+            self.damage_total[index] += other.damage_total[index]
+        self.turns_total += other.turns_total
+        self.turns_squares_total += other.turns_squares_total
+
+        if other.turns_min is not None:
+            self.turns_min = other.turns_min if self.turns_min is None else min(self.turns_min, other.turns_min)
+            self.turns_max = other.turns_max if self.turns_max is None else max(self.turns_max, other.turns_max)
+        for turns, count in other.turns_counts.items():
+            self.turns_counts[turns] = self.turns_counts.get(turns, 0) + count
+
+
+    def to_dict(self) -> dict:
+        """
+        Возвращает агрегированные показатели: доли побед, статистику ходов и урона
+        :return:
+        """
+
+        battles = self.battles or 1
+        turns_mean = self.turns_total / battles
+        return {
+            "battles": self.battles,
+            "wins": list(self.wins),
+            "draws": self.draws,
+            "win_rates": [wins / battles for wins in self.wins],
+            "draw_rate": self.draws / battles,
+            "turns_mean": turns_mean,
+            "turns_std": max(0.0, self.turns_squares_total / battles - turns_mean ** 2) ** 0.5,
+            "turns_min": self.turns_min,
+            "turns_max": self.turns_max,
+            "turns_histogram": dict(sorted(self.turns_counts.items())),
+            "damage_total": list(self.damage_total),
+            "damage_mean": [damage / battles for damage in self.damage_total],
+        }
+
+
+class BatchSimulator:
+    """
+    Класс пакетного симулятора
+
+    Прогоняет много независимых боев одной и той же раскладки в headless-режиме на пуле процессов
+    и собирает агрегированную статистику. Нужен для настройки баланса.
+
+    Бои раздаются процессам пачками (chunk_size), каждый процесс возвращает уже сложенную статистику своей пачки,
+    поэтому между процессами передаются только суммы, а не результаты каждого боя.
+
+    Сид i-го боя серии выводится из seed и номера боя (RandomStream.derive_seed), поэтому при заданном seed
+    результат не зависит ни от числа процессов, ни от размера пачек, а процессы пула никогда не повторяют броски
+    """
+
+    def __init__(
+            self,
+            unit_setups: Sequence[UnitSetup],
+            field_size: int,
+            processes: Optional[int] = None,
+            max_turns: Optional[int] = None,
+            disable_logging: bool = True,
+            seed: Optional[int] = None
+    ):
+        self.unit_setups: List[UnitSetup] = list(unit_setups)
+        self.field_size = field_size
+        self.processes = processes or cpu_count()
+        self.max_turns = max_turns
+        self.disable_logging = disable_logging
+        self.seed = seed
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def run(self, battles: int, chunk_size: Optional[int] = None) -> dict:
+        """
+        Прогоняет заданное количество боев и возвращает агрегированную статистику (см. BattleStatistics.to_dict)
+
+        При processes=1 бои считаются в текущем процессе без создания пула (логи на это время тоже глушатся)
+        :param battles:
+        :param chunk_size: сколько боев отдается процессу за раз
+        :return:
+        """
+
+        if chunk_size is None:
+            chunk_size = max(1, min(1000, battles // (self.processes * 4) or 1))
+
+        # без заданного сида серия все равно получает один общий сид, из которого выводятся сиды боев
+        seed = self.seed if self.seed is not None else RandomStream().seed
+        tasks = [
+            (self.unit_setups, self.field_size, self.max_turns, seed, start, min(chunk_size, battles - start))
+            for start in range(0, battles, chunk_size)
+        ]
+
+        statistics = BattleStatistics(len(self.unit_setups))
+
+        with worker_map(self.processes, self.disable_logging) as map_function:
+            for chunk_statistics in map_function(_simulate_chunk, tasks):
+                statistics.merge(chunk_statistics)
+
+        logger.info("Batch of %d battles simulated", battles)
+
+        return statistics.to_dict()
+
+
+@contextmanager
+def worker_map(processes: int, disable_logging: bool = True, ordered: bool = False) -> Iterator[Callable]:
+    """
+    Отдает функцию map для прогона задач: при processes=1 - встроенный map в текущем процессе (логи на это время
+    глушатся так же, как в процессах пула), иначе - map пула процессов, который закрывается при выходе из блока
+    :param processes:
+    :param disable_logging: глушить ли логи на время прогона
+    :param ordered: нужны ли результаты в порядке задач (иначе пул отдает их по готовности)
+    :return:
+    """
+
+    if processes == 1:
+        with logging_disabled(disable_logging):
+            yield map
+    else:
+        with Pool(processes, initializer=_init_worker, initargs=(disable_logging,)) as pool:
+            yield pool.imap if ordered else pool.imap_unordered
+
+
+def _init_worker(disable_logging: bool):
+    """
+    Инициализирует процесс пула: при необходимости глушит логи, чтобы процессы не писали в один файл
+    :param disable_logging:
+    :return:
+    """
+
+    if disable_logging:
+        set_logging_enabled(False)
+
+
+def _get_columns(size: int, spacing: int, height: int) -> int:
+    """
+    Сколько колонн займет армия из size юнитов с шагом spacing
+    :param size:
+    :param spacing:
+    :param height:
+    :return:
+    """
+
+    return math.ceil(size / max(1, math.ceil(height / spacing)))
+
+
+def _deploy(army: List[str], team: int, width: int, height: int, spacing: int = 1) -> list:
+    """
+    Расставляет армию колоннами у своего края поля (команда 0 - слева, 1 - справа): первые юниты списка - в колонне,
+    ближайшей к врагу, неполная колонна - у края. С шагом 2 юниты стоят через ряд, в соседних колоннах со сдвигом (шахматный порядок)
+    :param army: ключи юнитов от передней колонны к задней
+    :param team:
+    :param width:
+    :param height:
+    :param spacing:
+    :return: юниты
+    """
+
+    from game.units.unit_factory import UnitFactory
+    from game.field.position import Position
+
+    columns = _get_columns(len(army), spacing, height)
+    rows_per_column = max(1, math.ceil(height / spacing))
+    units = []
+    for index, unit_name in enumerate(army):
+        column, slot = divmod(index, rows_per_column)
+        row = min(height - 1, slot * spacing + (column % spacing))
+        depth = columns - 1 - column  # 0 - у края поля
+        unit = UnitFactory.create(unit_name, Position(depth if team == 0 else width - 1 - depth, row))
+        unit.team = team
+        units.append(unit)
+    return units
+
+
+def _simulate_chunk(task: Tuple[List[UnitSetup], int, Optional[int], int, int, int]) -> BattleStatistics:
+    """
+    Прогоняет пачку боев в текущем процессе и возвращает их сложенную статистику
+    :param task: (раскладка юнитов, размер поля, ограничение ходов, сид серии, номер первого боя, количество боев)
+    :return:
+    """
+
+    from game.units.unit_factory import UnitFactory
+    from game.field.position import Position
+    from game.field.battlefield import BattleField
+    from game.manager.battle_manager import BattleManager
+
+    unit_setups, field_size, max_turns, seed, start, count = task
+    statistics = BattleStatistics(len(unit_setups))
+
+    for battle_number in range(start, start + count):
+        units = [UnitFactory.create(unit_name, Position(x)) for unit_name, x in unit_setups]
+        rng = RandomStream(RandomStream.derive_seed(seed, battle_number))
+        battle = BattleManager(BattleField(field_size), headless=True, max_turns=max_turns, rng=rng)
+        battle.run(*units)
+        statistics.add_result(battle.get_battle_result())
+
+    return statistics
@@ -1,6 +1,12 @@
-from typing import TYPE_CHECKING, List, Optional
+from array import array
+from time import perf_counter
+from typing import TYPE_CHECKING, List, Optional, Dict
 from core.logging.logger import Logger
 from core.rendering.renderer import Renderer
+from utils.random_stream import RandomStream
+from game.manager.game_state import GameState
+from game.ai.policy import ATTACK, MOVE, Action, DecisionPolicy, GreedyPolicy
+from game.manager.scheduler import TurnScheduler, InitiativeScheduler
 
 
 logger = Logger(__name__)
@@ -9,24 +15,73 @@ logger = Logger(__name__)
 if TYPE_CHECKING:
     from game.field.battlefield import BattleField
     from game.units.base_units import Unit
+    from game.manager.replay import ReplayRecorder
+    from core.instrumentation import Instrumentation
 
 
 class BattleManager:
     """
     Класс менеджера битвы
 
-    Умеет запускать и полностью обрабатывать автоматический бой 1 на 1 на одномерной карте.
-    Примитивный ИИ умеет просто бить, когда бьется
+    Умеет запускать и полностью обрабатывать автоматический бой любого числа юнитов на гексагональном поле
+    BattleField (поле высотой 1 - прежняя одномерная карта). Бой идет, пока на поле не останется одна сторона.
+
+    Решения юнитов принимает политика (DecisionPolicy): общая policy (по умолчанию жадная GreedyPolicy)
+    или своя для команды из team_policies (например, MonteCarloPolicy для более умного противника)
+
+    Юнитов можно разбить на команды (Unit.team), иначе каждый сам за себя.
+    Очередность ходов и живых юнитов сторон ведет планировщик scheduler (TurnScheduler): по умолчанию
+    InitiativeScheduler (каждый ходит раз за ход по убыванию скорости), TimelineScheduler - шкала инициативы.
+    Рендерер можно подать свой (например, FrameRenderer), по умолчанию используется консольный Renderer.
+    В режиме headless ничего не рендерит (нужно для пакетных симуляций, см. BatchSimulator).
+    max_turns ограничивает длину боя, по его достижении бой заканчивается ничьей.
+
+    Все броски боя идут из собственного потока случайных чисел rng (RandomStream), бой с тем же сидом повторяется.
+    Если поток не подан, он создается с сидом recorder (если есть) или со случайным.
+    Если подан recorder (ReplayRecorder), бой записывается в бинарный реплей вместе с сидом потока.
+    Если подан instrumentation (Instrumentation), бой копит в нем время фаз, счетчики и задержки ходов
+    (и профилируется, если это в нем включено)
     """
 
-    def __init__(self, battlefield: 'BattleField'):
+    def __init__(
+            self,
+            battlefield: 'BattleField',
+            headless: bool = False,
+            max_turns: Optional[int] = None,
+            renderer=None,
+            recorder: Optional['ReplayRecorder'] = None,
+            rng: Optional[RandomStream] = None,
+            policy: Optional[DecisionPolicy] = None,
+            team_policies: Optional[Dict[int, DecisionPolicy]] = None,
+            instrumentation: Optional['Instrumentation'] = None,
+            scheduler: Optional[TurnScheduler] = None
+    ):
         self.battlefield = battlefield
-        self.renderer = Renderer(self.battlefield)
+        self.headless = headless
+        self.max_turns = max_turns
+        if headless:
+            self.renderer = None
+        else:
+            self.renderer = renderer if renderer is not None else Renderer(self.battlefield)
+        self.recorder = recorder
+        if rng is None:
+            rng = RandomStream(recorder.seed if recorder is not None else None)
+        elif recorder is not None:
+            recorder.seed = rng.seed
+        self.rng = rng
+        self.policy = policy if policy is not None else GreedyPolicy()
+        self.team_policies = team_policies or {}
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            battlefield.instrumentation = instrumentation
+        self.scheduler = scheduler if scheduler is not None else InitiativeScheduler()
+        battlefield.scheduler = self.scheduler
         self.units_in_game: List['Unit'] = []
+        self.damage_dealt: Dict['Unit', int] = {}
         self.current_turn = 0
         self.game_over = False
-        self.winner:  Optional[str] = None
-        logger.info(f"{self.__class__.__name__} initiated")
+        self.winner: Optional['Unit'] = None
+        logger.info("%s initiated", self.__class__.__name__)
 
 
     def run(self, *units):
@@ -35,52 +90,179 @@ class BattleManager:
             - Добавляет поданных юнитов на поле
             - Ходит за каждого юнита
             - Атакует за каждого юнита
-            - Отсылает данные в рендер
+            - Отсылает данные в рендер (если бой не headless)
+        :param units:
+        :return: победитель или None в случае ничьей
+        """
+
+        if self.instrumentation is None:
+            return self._run_battle(units)
+
+        self.instrumentation.start_battle()
+        try:
+            return self._run_battle(units)
+        finally:
+            self.instrumentation.finish_battle()
+
+
+    def _run_battle(self, units) -> Optional['Unit']:
+        self.start(*units)
+        while not self.game_over:
+            self.step()
+        return self.finish()
+
+
+    def start(self, *units):
+        """
+        Начинает бой, который дальше играется по ходам через step() (run делает все сразу):
+        добавляет юнитов на поле, начинает запись реплея и рендер
         :param units:
         :return:
         """
 
-        logger.info(f"Game started")
+        logger.info("Game started")
+
+        self._add_units(units)
 
-        for unit in units:
-            self._add_unit(unit)
+        if self.recorder is not None:
+            self.recorder.begin(self.battlefield, self.units_in_game)
 
         # TODO
         # надо каким-то образом исправить это дело, потому что на данный момент я никак не проверяю,
         # какой юнит слева, а какой справа, у меня даже нет понятия команд
-        self.renderer.render_start_info(self.units_in_game[0], self.units_in_game[-1])
+        if not self.headless:
+            self._render('render_start_info', self.units_in_game[0], self.units_in_game[-1])
 
-        while not self.game_over:
-            self.current_turn += 1
-            self.renderer.render_turn_number(self.current_turn)
+
+    def step(self) -> bool:
+        """
+        Играет один полный ход (с записью в реплей и рендером). По достижении max_turns бой кончается ничьей
+        :return: закончен ли бой
+        """
+
+        self.current_turn += 1
+        if self.recorder is not None:
+            self.recorder.record_turn(self.current_turn)
+        if not self.headless:
+            self._render('render_turn_number', self.current_turn)
+        instrumentation = self.instrumentation
+        if instrumentation is None:
             self._process_full_turn()
-            self.renderer.render_battlefield()
+        else:
+            started = perf_counter()
+            self._process_full_turn()
+            instrumentation.observe('turn_latency_seconds', perf_counter() - started)
+            instrumentation.count('turns')
+        if not self.headless:
+            self._render('render_battlefield')
             for unit in self.units_in_game:
-                self.renderer.render_hp_bars(unit)
-            self.renderer.render_turns_separator()
+                self._render('render_hp_bars', unit)
+            self._render('render_turns_separator')
+        if self.max_turns is not None and not self.game_over and self.current_turn >= self.max_turns:
+            self.game_over = True
+        return self.game_over
+
+
+    def finish(self) -> Optional['Unit']:
+        """
+        Заканчивает бой: дописывает реплей и выводит итог
+        :return: победитель или None в случае ничьей
+        """
+
+        if self.recorder is not None:
+            self.recorder.finish(self.current_turn, self.winner)
 
-        self.renderer.render_end_info(self.winner)
+        if not self.headless:
+            self._render('render_end_info', self.winner)
 
-        logger.info(f"Game is over with winner {self.winner}")
+        logger.info("Game is over with winner %s", self.winner)
 
+        return self.winner
 
-    def get_game_state(self):
+
+    def get_game_state(self) -> GameState:
         """
-        Концептуально должна мочь послать все данные о бое в рендер, но пока просто молча существует
+        Снимает компактный снимок боя: номер хода, итог, позиции, здоровье, боезапас и жизнь юнитов,
+        нанесенный урон, очередь ходов планировщика и состояние потока случайных чисел (см. GameState)
+
+        Юниты в снимке идут в порядке units_in_game, поэтому восстанавливать его можно только в этот же бой
         :return:
         """
-        pass
 
+        units = self.units_in_game
+        return GameState(
+            self.current_turn,
+            self.game_over,
+            None if self.winner is None else units.index(self.winner),
+            tuple([unit.position for unit in units]),
+            array('i', [unit.health for unit in units]),
+            array('i', [getattr(unit, 'ammo', -1) for unit in units]),
+            bytes([unit.alive for unit in units]),
+            array('q', [self.damage_dealt.get(unit, 0) for unit in units]),
+            self.scheduler.get_state(),
+            self.rng.get_state()
+        )
+
+
+    def restore_game_state(self, state: GameState):
+        """
+        Возвращает бой в состояние снимка: юнитов, поле (меняются только отличающиеся клетки), очередь ходов
+        и поток случайных чисел. После восстановления бой продолжается так же, как продолжился бы с момента снимка,
+        в том числе снятого посреди полного хода: юниты, еще не ходившие в этом ходу, остаются в очереди
+        (их ходы доигрывает _process_turn_rest).
+        Снимок восстанавливается только в бой с планировщиком того же класса
+
+        Рендерер и запись реплея о восстановлении не узнают, снимки рассчитаны на headless-бои (поиск ИИ, анализ)
+        :param state:
+        :return:
+        """
+
+        units = self.units_in_game
+        for index, unit in enumerate(units):
+            unit.position = state.positions[index]
+            unit.health = state.health[index]
+            unit.alive = bool(state.alive[index])
+            if state.ammo[index] >= 0:
+                unit.ammo = state.ammo[index]
+
+        self.damage_dealt = {unit: damage for unit, damage in zip(units, state.damage) if damage}
+        self.current_turn = state.turn
+        self.game_over = state.game_over
+        self.winner = None if state.winner is None else units[state.winner]
 
-    def _add_unit(self, unit: 'Unit'):
+        self.battlefield._restore_units(units)
+        self.scheduler.reset(units)
+        self.scheduler.set_state(state.scheduler_state)
+        self.rng.set_state(state.rng_state)
+
+
+    def get_battle_result(self) -> dict:
         """
-        Добавляет юнита на поле (простит поле битвы добавить юнита через self.battlefield.add_unit())
-        :param unit:
+        Возвращает итог боя в компактном виде, пригодном для передачи между процессами.
+
+        Юниты обозначаются индексами в порядке их добавления в бой
+        :return: {"winner": индекс победителя или None, "turns": число ходов, "damage": [урон каждого юнита]}
+        """
+
+        winner_index = self.units_in_game.index(self.winner) if self.winner is not None else None
+        return {
+            "winner": winner_index,
+            "turns": self.current_turn,
+            "damage": [self.damage_dealt.get(unit, 0) for unit in self.units_in_game],
+        }
+
+
+    def _add_units(self, units):
+        """
+        Добавляет юнитов в бой и ставит на поле тех, кого там еще нет (например, UnitFactory.create_many уже
+        расставил их), одним проходом через self.battlefield.add_units()
+        :param units:
         :return:
         """
 
-        self.battlefield.add_unit(unit)
-        self.units_in_game.append(unit)
+        self.battlefield.add_units([unit for unit in units if not self.battlefield._unit_on_field(unit)])
+        self.units_in_game.extend(units)
+        self.scheduler.add_units(units)
 
 
     def _process_full_turn(self):
@@ -89,90 +271,114 @@ class BattleManager:
         :return:
         """
 
-        alive_units = self._get_alive_units()
-        sorted_units = sorted(alive_units, key=lambda unit: unit.speed, reverse=True)
-        for unit_turned in sorted_units:
+        self.scheduler.begin_turn()
+        self._process_turn_rest()
+
+        logger.info("Turn number %d processed", self.current_turn)
+
+
+    def _process_turn_rest(self):
+        """
+        Доигрывает текущий полный ход: ходят все юниты, которые еще ждут хода в очереди планировщика
+        (так же доигрывается ход после восстановления снимка, снятого посреди хода)
+        :return:
+        """
+
+        scheduler = self.scheduler
+        unit_turned = scheduler.next_unit()
+        while unit_turned is not None:
             self._process_unit_turn(unit_turned)
             if self._check_victory():
                 break
-
-        logger.info(f"Turn number {self.current_turn} processed")
+            unit_turned = scheduler.next_unit()
 
 
     def _process_unit_turn(self, unit: 'Unit'):
         """
-        С позволения сказать ИИ, который решает, что делать юниту в зависимости от ситуации на поле.
-
-        Теоретически умеет обрабатывать бои не только 1 на 1, но тестов не проходила и скорее всего сдохнет.
-        Хотя по идее оно будет работать, как просто "каждый сам за себя"
+        Спрашивает у политики юнита решение на ход и выполняет его
         :param unit:
         :return:
         """
 
-        # находим всех врагов
-        enemies = [enemy for enemy in self.units_in_game if enemy.alive and enemy != unit]
-        if not enemies:
+        policy = self.team_policies.get(unit.team, self.policy) if unit.team is not None else self.policy
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            self._apply_action(unit, policy.decide(self, unit))
             return
 
-        # находим ближайшего врага
-        nearest_enemy = min(enemies, key=lambda e: self.battlefield.get_distance(unit.position, e.position))
-
-
-        # атакуем врага, если можем с текущей позиции
-        if unit.can_attack(nearest_enemy, self.battlefield):
-            damage = unit.attack(nearest_enemy, self.battlefield)
-            self.renderer.render_unit_action('attack', unit=unit, target=nearest_enemy, damage=damage)
-            return
-
-
-        # пытаемся найти позицию, с которой можно атаковать
-        attack_position = unit.find_attack_position(nearest_enemy, self.battlefield)
+        # поиск пути внутри решения поле записывает в фазу перемещения, из выбора цели он вычитается
+        pathing_before = instrumentation.timers['movement']
+        started = perf_counter()
+        action = policy.decide(self, unit)
+        decision_time = perf_counter() - started
+        instrumentation.add_time('target_selection', decision_time - (instrumentation.timers['movement'] - pathing_before))
+        self._apply_action(unit, action)
+        instrumentation.observe('unit_turn_latency_seconds', perf_counter() - started)
 
 
-        # если атакующая позиция найдена, двигаемся на нее
-        if attack_position:
-            # Двигаемся к атакующей позиции
-            self.battlefield.move_unit(unit, attack_position)
-            return
-
-
-        # Если не смогли найти атакующую позицию, просто двигаемся в сторону врага
-        direction = unit.position.direction_to(nearest_enemy.position)
-
-        new_position = unit.position + (direction * unit.speed)
+    def _apply_action(self, unit: 'Unit', action: Action):
+        """
+        Выполняет решение юнита: атаку или перемещение (с записью в реплей и рендером)
+        :param unit:
+        :param action:
+        :return:
+        """
 
-        if not (self.battlefield.is_position_available(new_position)):
-            for steps in range(unit.speed, -1, -1):
-                new_position = unit.position + (direction * steps)
-                if self.battlefield.is_position_available(new_position):
-                    break
-            else:
+        instrumentation = self.instrumentation
+        started = perf_counter() if instrumentation is not None else 0.0
+
+        if action.kind == ATTACK:
+            target = action.target
+            damage = unit.attack(target, self.battlefield, self.rng)
+            self.damage_dealt[unit] = self.damage_dealt.get(unit, 0) + damage
+            if self.recorder is not None:
+                self.recorder.record_attack(unit, target, damage)
+            if instrumentation is not None:
+                instrumentation.add_time('attack', perf_counter() - started)
+                instrumentation.count('attacks')
+            if not self.headless:
+                self._render('render_unit_action', 'attack', unit=unit, target=target, damage=damage)
+
+        elif action.kind == MOVE:
+            distance = self.battlefield.move_unit(unit, action.position)
+            if distance is None:
                 return
+            if self.recorder is not None:
+                self.recorder.record_move(unit)
+            if instrumentation is not None:
+                instrumentation.add_time('movement', perf_counter() - started)
+                instrumentation.count('moves')
+            if not self.headless:
+                self._render('render_unit_action', 'move', unit=unit, distance=distance)
 
-        distance = self.battlefield.move_unit(unit, new_position)
-        self.renderer.render_unit_action('move', unit=unit, distance=distance)
 
-
-    def _check_victory(self):
+    def _render(self, method: str, *args, **kwargs):
         """
-        Проверяет, не случилась ли победы и, как следствие - конец игры
+        Вызывает метод рендерера (с замером фазы рендера, если бой инструментирован)
+        :param method: имя метода рендерера
         :return:
         """
 
-        alive_units = self._get_alive_units()
-        alive_unit_quantity = len(alive_units)
-        if alive_unit_quantity == 1:
-            self.game_over = True
-            self.winner = alive_units[0]
-            return True
-        else:
-            return False
+        if self.instrumentation is None:
+            getattr(self.renderer, method)(*args, **kwargs)
+            return
+        started = perf_counter()
+        getattr(self.renderer, method)(*args, **kwargs)
+        self.instrumentation.add_time('rendering', perf_counter() - started)
 
 
-    def _get_alive_units(self):
+    def _check_victory(self):
         """
-        Добывает список всех живых юнитов на поле
+        Проверяет, не случилась ли победы и, как следствие - конец игры
+
+        Победа наступает, когда в живых остались юниты одной команды (юнит без команды - сам себе команда).
+        Победителем считается первый из выживших юнитов (если не выжил никто - ничья).
+        Живых юнитов сторон считает планировщик, поэтому проверка не проходит по юнитам
         :return:
         """
 
-        return [unit for unit in self.units_in_game if unit.alive]
\ No newline at end of file
+        if not self.scheduler.is_decided():
+            return False
+        self.game_over = True
+        self.winner = self.scheduler.get_winner()
+        return True
@@ -0,0 +1,230 @@
+from typing import Dict, List, Optional, Tuple, Union
+from core.logging.logger import Logger, logging_disabled
+from game.ai.policy import ATTACK, GreedyPolicy
+from game.field.position import Position
+
+
+logger = Logger(__name__)
+
+
+# Состояние одного юнита: (позиция, здоровье, боезапас или -1); состояние боя - пара таких
+UnitState = Tuple[Position, int, int]
+DuelState = Tuple[UnitState, UnitState]
+
+
+class _FixedRoll:
+    """
+    Подставляется в бой вместо потока случайных чисел, чтобы атака прошла с заданным базовым уроном
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value: int):
+        self.value = value
+
+
+    def randint(self, low: int, high: int) -> int:
+        return self.value
+
+
+class CombatSolver:
+    """
+    Класс точного решателя боя 1 на 1
+
+    Бой двух юнитов - конечная цепь Маркова: все решения жадного ИИ (GreedyPolicy) и передвижения детерминированы,
+    случаен только базовый урон атаки, равномерный от damage_min до damage_max. Состояние боя в начале хода -
+    позиции, здоровье и боезапас обоих юнитов (кто ходит первым, определяется скоростями, как в BattleManager).
+
+    Переходы состояния за полный ход считаются настоящими правилами Unit/Shooter: юниты ставятся на поле
+    в нужное состояние, ход выбирает GreedyPolicy, атака выполняется через BattleManager._apply_action
+    с каждым возможным значением броска. Переходы запоминаются, а распределение вероятностей по состояниям
+    продвигается вперед ход за ходом (одинаковые состояния сливаются), поэтому точные вероятности побед и
+    распределение длины боя считаются за миллисекунды. Годится как эталон для проверки быстрых симуляторов.
+
+    Бой, не закончившийся за max_turns ходов, считается ничьей (как BattleManager с max_turns)
+    """
+
+    def __init__(self, width: int, height: int = 1, max_turns: int = 1000):
+        if max_turns <= 0:
+            raise ValueError('Ограничение ходов max_turns должно быть положительным')
+
+        self.width = width
+        self.height = height
+        self.max_turns = max_turns
+        self.policy = GreedyPolicy()
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def solve(
+            self,
+            unit_a: str,
+            unit_b: str,
+            position_a: Union[Position, int] = 0,
+            position_b: Optional[Union[Position, int]] = None
+    ) -> dict:
+        """
+        Считает точный исход боя двух юнитов (индексы 0 и 1 - юниты в порядке подачи, как в BatchSimulator)
+        :param unit_a: ключ первого юнита в JSON
+        :param unit_b: ключ второго юнита в JSON
+        :param position_a: позиция первого юнита (число - клетка x на одномерном поле)
+        :param position_b: позиция второго юнита, по умолчанию - последняя клетка поля
+        :return: {"win_rates", "draw_rate", "turns_mean", "turns_std", "turns_min", "turns_max",
+            "turns_distribution": {ход: вероятность конца боя на этом ходу}, "states": число различных состояний}
+        """
+
+        from game.units.unit_factory import UnitFactory
+        from game.field.battlefield import BattleField
+        from game.manager.battle_manager import BattleManager
+
+        if position_b is None:
+            position_b = Position(self.width - 1, self.height - 1)
+        positions = [
+            position if isinstance(position, Position) else Position(position) for position in (position_a, position_b)
+        ]
+
+        with logging_disabled():
+            units = [UnitFactory.create(unit_name, position) for unit_name, position in zip((unit_a, unit_b), positions)]
+            battle = BattleManager(BattleField(self.width, self.height), headless=True)
+            battle._add_units(units)
+            # порядок хода не меняется: скорости постоянны, при равных первым ходит поданный раньше
+            order = sorted(range(2), key=lambda index: units[index].speed, reverse=True)
+
+            result = self._propagate(battle, units, order, self._get_state(units))
+
+        logger.info(
+            "Duel %s vs %s solved: win rates %.4f / %.4f over %d states",
+            unit_a, unit_b, result["win_rates"][0], result["win_rates"][1], result["states"]
+        )
+
+        return result
+
+
+    def _propagate(self, battle, units: list, order: List[int], initial_state: DuelState) -> dict:
+        """
+        Продвигает распределение по состояниям ход за ходом, пока оно не поглотится или не кончатся ходы
+        :param battle:
+        :param units:
+        :param order:
+        :param initial_state:
+        :return:
+        """
+
+        transitions: Dict[DuelState, List[Tuple[float, object]]] = {}
+        win_rates = [0.0, 0.0]
+        turns_distribution: Dict[int, float] = {}
+        distribution: Dict[DuelState, float] = {initial_state: 1.0}
+
+        turn = 0
+        while distribution and turn < self.max_turns:
+            turn += 1
+            next_distribution: Dict[DuelState, float] = {}
+            ended = 0.0
+            for state, probability in distribution.items():
+                outcomes = transitions.get(state)
+                if outcomes is None:
+                    outcomes = transitions[state] = self._get_turn_outcomes(battle, units, order, state)
+                for outcome_probability, outcome in outcomes:
+                    mass = probability * outcome_probability
+                    if isinstance(outcome, int):
+                        win_rates[outcome] += mass
+                        ended += mass
+                    else:
+                        next_distribution[outcome] = next_distribution.get(outcome, 0.0) + mass
+            if ended:
+                turns_distribution[turn] = ended
+            distribution = next_distribution
+
+        draw_rate = float(sum(distribution.values()))
+        if draw_rate:
+            turns_distribution[turn] = turns_distribution.get(turn, 0.0) + draw_rate
+
+        turns_mean = sum(turns * probability for turns, probability in turns_distribution.items())
+        turns_variance = sum(
+            (turns - turns_mean) ** 2 * probability for turns, probability in turns_distribution.items()
+        )
+        return {
+            "win_rates": win_rates,
+            "draw_rate": draw_rate,
+            "turns_mean": turns_mean,
+            "turns_std": turns_variance ** 0.5,
+            "turns_min": min(turns_distribution, default=None),
+            "turns_max": max(turns_distribution, default=None),
+            "turns_distribution": turns_distribution,
+            "states": len(transitions),
+        }
+
+
+    def _get_turn_outcomes(self, battle, units: list, order: List[int], state: DuelState) -> List[Tuple[float, object]]:
+        """
+        Исходы полного хода из состояния: список (вероятность, следующее состояние или индекс победителя)
+        :param battle:
+        :param units:
+        :param order:
+        :param state:
+        :return:
+        """
+
+        outcomes: Dict[object, float] = {}
+        frontier: Dict[DuelState, float] = {state: 1.0}
+        for actor in order:
+            next_frontier: Dict[DuelState, float] = {}
+            for current_state, probability in frontier.items():
+                for outcome_probability, next_state in self._get_unit_turn_outcomes(battle, units, actor, current_state):
+                    mass = probability * outcome_probability
+                    if next_state[1 - actor][1] <= 0:
+                        outcomes[actor] = outcomes.get(actor, 0.0) + mass
+                    else:
+                        next_frontier[next_state] = next_frontier.get(next_state, 0.0) + mass
+            frontier = next_frontier
+
+        for next_state, probability in frontier.items():
+            outcomes[next_state] = outcomes.get(next_state, 0.0) + probability
+
+        return [(probability, outcome) for outcome, probability in outcomes.items()]
+
+
+    def _get_unit_turn_outcomes(self, battle, units: list, actor: int, state: DuelState) -> List[Tuple[float, DuelState]]:
+        """
+        Исходы хода одного юнита: ход выбирает GreedyPolicy, атака разыгрывается с каждым значением броска
+        :param battle:
+        :param units:
+        :param actor:
+        :param state:
+        :return:
+        """
+
+        unit = units[actor]
+        self._set_state(battle, units, state)
+        action = self.policy.decide(battle, unit)
+        if action.kind != ATTACK:
+            battle._apply_action(unit, action)
+            return [(1.0, self._get_state(units))]
+
+        rolls = range(unit.damage_min, unit.damage_max + 1)
+        roll_probability = 1 / len(rolls)
+        outcomes: Dict[DuelState, float] = {}
+        for roll in rolls:
+            self._set_state(battle, units, state)
+            battle.rng = _FixedRoll(roll)
+            battle._apply_action(unit, action)
+            next_state = self._get_state(units)
+            outcomes[next_state] = outcomes.get(next_state, 0.0) + roll_probability
+
+        return [(probability, next_state) for next_state, probability in outcomes.items()]
+
+
+    @staticmethod
+    def _get_state(units: list) -> DuelState:
+        return tuple([(unit.position, max(unit.health, 0), getattr(unit, 'ammo', -1)) for unit in units])
+
+
+    @staticmethod
+    def _set_state(battle, units: list, state: DuelState):
+        for unit, (position, health, ammo) in zip(units, state):
+            unit.position = position
+            unit.health = health
+            unit.alive = True
+            if ammo >= 0:
+                unit.ammo = ammo
+        battle.battlefield._restore_units(units)
+        battle.scheduler.reset()
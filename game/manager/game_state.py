@@ -0,0 +1,54 @@
+from array import array
+from typing import Optional, Tuple
+from game.field.position import Position
+
+
+class GameState:
+    """
+    Класс снимка состояния боя (см. BattleManager.get_game_state и restore_game_state)
+
+    Снимок неизменяем и компактен: состояние юнитов лежит в массивах по порядку юнитов в бою
+    (BattleManager.units_in_game), позиции - кортеж ссылок на интернированные Position.
+    Занятость поля в снимок не входит: при восстановлении она пересобирается по позициям живых юнитов.
+    Очередь ходов планировщика хранится вместе с юнитами, ждущими хода (см. TurnScheduler.get_state),
+    поэтому снимок можно снять и посреди полного хода.
+    Состояние потока случайных чисел берется без копирования буфера (см. RandomStream.get_state).
+    Поэтому снимок снимается за микросекунды, а один снимок можно восстанавливать сколько угодно раз.
+
+    Для юнитов без боезапаса в ammo лежит -1
+    """
+
+    __slots__ = (
+        'turn', 'game_over', 'winner', 'positions', 'health', 'ammo', 'alive', 'damage', 'scheduler_state', 'rng_state'
+    )
+
+    def __init__(
+            self,
+            turn: int,
+            game_over: bool,
+            winner: Optional[int],
+            positions: Tuple[Position, ...],
+            health: array,
+            ammo: array,
+            alive: bytes,
+            damage: array,
+            scheduler_state: tuple,
+            rng_state: tuple
+    ):
+        self.turn = turn
+        self.game_over = game_over
+        self.winner = winner
+        self.positions = positions
+        self.health = health
+        self.ammo = ammo
+        self.alive = alive
+        self.damage = damage
+        self.scheduler_state = scheduler_state
+        self.rng_state = rng_state
+
+
+    def __repr__(self):
+        return (
+            f"GameState(turn={self.turn}, game_over={self.game_over}, winner={self.winner}, "
+            f"health={list(self.health)}, alive={list(self.alive)})"
+        )
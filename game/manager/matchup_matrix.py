@@ -0,0 +1,309 @@
+import dataclasses
+import hashlib
+import pickle
+from itertools import product
+from multiprocessing import cpu_count
+from pathlib import Path
+from statistics import NormalDist
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from core.logging.logger import Logger
+from game.manager.batch_simulator import BattleStatistics, _simulate_chunk, worker_map
+from utils.data_functions import CACHE_DIR, write_file_atomically
+from utils.random_stream import RandomStream
+
+
+logger = Logger(__name__)
+
+
+MATCHUP_CACHE_FILE = CACHE_DIR / 'matchups.pickle'
+
+# Версия формата кэша матчапов. Поднимается при изменении формата или правил боя (формулы урона, ИИ и т.п.),
+# чтобы старые результаты не использовались
+MATCHUP_FORMAT_VERSION = 1
+
+# Ячейка матрицы: (юнит A, юнит B, стартовая дистанция, размер поля)
+MatchupCell = Tuple[str, str, int, int]
+
+
+class MatchupMatrix:
+    """
+    Класс матрицы матчапов (инструмент баланса)
+
+    Для каждой упорядоченной пары юнитов (по умолчанию - всех из UnitFactory.get_registered_units()),
+    каждой стартовой дистанции и каждого размера поля прогоняет бои 1 на 1 на одномерном поле:
+    юнит A стоит в клетке 0, юнит B - в клетке distance. Комбинации, где B не влезает на поле, пропускаются.
+
+    Бои ячейки идут пачками по batch_size (последовательная проверка): после каждой пачки для доли побед A
+    считается доверительный интервал Уилсона, и ячейка перестает набирать бои, как только его полуширина
+    не больше precision (но не раньше min_battles и не позже max_battles). Пачки всех незаконченных ячеек
+    одного раунда считаются параллельно на пуле процессов.
+
+    Сиды боев выводятся из seed и ячейки, поэтому результат не зависит от числа процессов.
+    Запуск из командной строки - tools/matchup_matrix.py
+    Результаты кэшируются на диске по отпечаткам характеристик обоих юнитов (и хэшу каталога),
+    поэтому после правки units.json пересчитываются только ячейки с юнитами, чьи характеристики изменились
+    """
+
+    def __init__(
+            self,
+            units: Optional[Sequence[str]] = None,
+            distances: Sequence[int] = (1, 5, 10),
+            field_sizes: Sequence[int] = (23,),
+            processes: Optional[int] = None,
+            precision: float = 0.05,
+            confidence: float = 0.95,
+            min_battles: int = 100,
+            max_battles: int = 10000,
+            batch_size: int = 100,
+            max_turns: Optional[int] = 200,
+            seed: int = 0,
+            cache_path: Optional[Union[str, Path]] = MATCHUP_CACHE_FILE
+    ):
+        from game.units.unit_factory import UnitFactory
+        from game.units.unit_catalog import UnitCatalog
+
+        if not 0 < precision < 0.5:
+            raise ValueError('Точность precision должна быть в (0, 0.5)')
+        if not 0 < confidence < 1:
+            raise ValueError('Уровень доверия confidence должен быть в (0, 1)')
+        if min_battles > max_battles:
+            raise ValueError('min_battles не может быть больше max_battles')
+
+        self.catalog = UnitCatalog.get_default()
+        registered_units = UnitFactory.get_registered_units()
+        self.units: List[str] = list(units) if units is not None else [
+            unit_name for unit_name in registered_units if unit_name in self.catalog
+        ]
+        unknown = [unit_name for unit_name in self.units if unit_name not in registered_units]
+        if unknown:
+            raise ValueError(f'Неизвестные юниты: {", ".join(unknown)}')
+
+        self.distances = list(distances)
+        self.field_sizes = list(field_sizes)
+        self.processes = processes or cpu_count()
+        self.precision = precision
+        self.confidence = confidence
+        self.z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self.min_battles = min_battles
+        self.max_battles = max_battles
+        self.batch_size = batch_size
+        self.max_turns = max_turns
+        self.seed = seed
+        self.cache_path = cache_path
+        self._fingerprints = {
+            unit_name: self.get_unit_fingerprint(unit_name) for unit_name in self.units
+        }
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    @staticmethod
+    def get_unit_fingerprint(unit_name: str) -> str:
+        """
+        Отпечаток юнита для кэша: класс поведения и все характеристики из каталога
+        :param unit_name:
+        :return:
+        """
+
+        from game.units.unit_factory import UnitFactory
+
+        unit_class, stats = UnitFactory.resolve(unit_name)
+        description = repr((unit_class.__module__, unit_class.__qualname__, dataclasses.astuple(stats)))
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()[:16]
+
+
+    def get_cells(self) -> List[MatchupCell]:
+        """
+        Все ячейки матрицы (пары юнитов, дистанции и размеры полей, где оба юнита помещаются)
+        :return:
+        """
+
+        return [
+            (unit_a, unit_b, distance, field_size)
+            for unit_a, unit_b, field_size, distance in product(self.units, self.units, self.field_sizes, self.distances)
+            if 0 < distance < field_size
+        ]
+
+
+    def run(self) -> List[dict]:
+        """
+        Считает все ячейки матрицы (посчитанные раньше берутся из кэша) и возвращает их результаты
+        :return: список результатов ячеек (см. _get_cell_result)
+        """
+
+        cells = self.get_cells()
+        cache = self._read_cache()
+        results: Dict[MatchupCell, dict] = {}
+        pending: Dict[MatchupCell, BattleStatistics] = {}
+        for cell in cells:
+            cached = cache.get(self._get_cache_key(cell))
+            if cached is not None:
+                results[cell] = dict(cached, cached=True)
+            else:
+                pending[cell] = BattleStatistics(2)
+
+        logger.info("Matchup matrix: %d cells, %d from cache", len(cells), len(results))
+
+        if pending:
+            with worker_map(self.processes, ordered=True) as map_function:
+                self._simulate(pending, map_function)
+
+            for cell, statistics in pending.items():
+                results[cell] = self._get_cell_result(statistics)
+                cache[self._get_cache_key(cell)] = results[cell]
+            self._write_cache(cache)
+            for cell in pending:
+                results[cell] = dict(results[cell], cached=False)
+
+        return [
+            {"unit_a": cell[0], "unit_b": cell[1], "distance": cell[2], "field_size": cell[3], **results[cell]}
+            for cell in cells
+        ]
+
+
+    def _simulate(self, pending: Dict[MatchupCell, BattleStatistics], map_function):
+        """
+        Раундами добирает бои незаконченным ячейкам, пока у всех не сузится доверительный интервал
+        :param pending: статистики считаемых ячеек, пополняются на месте
+        :param map_function: map или Pool.imap (результаты нужны в порядке задач)
+        :return:
+        """
+
+        seeds = {cell: self._get_cell_seed(cell) for cell in pending}
+        active = list(pending)
+        rounds = 0
+        while active:
+            rounds += 1
+            tasks = []
+            for cell in active:
+                unit_a, unit_b, distance, field_size = cell
+                statistics = pending[cell]
+                count = min(self.batch_size, self.max_battles - statistics.battles)
+                if statistics.battles < self.min_battles:
+                    count = max(count, self.min_battles - statistics.battles)
+                tasks.append(
+                    ([(unit_a, 0), (unit_b, distance)], field_size, self.max_turns, seeds[cell], statistics.battles, count)
+                )
+
+            for cell, chunk_statistics in zip(active, map_function(_simulate_chunk, tasks)):
+                pending[cell].merge(chunk_statistics)
+
+            active = [cell for cell in active if not self._is_cell_done(pending[cell])]
+
+        logger.info(
+            "Matchup matrix: %d cells simulated in %d rounds, %d battles",
+            len(pending), rounds, sum(statistics.battles for statistics in pending.values())
+        )
+
+
+    def _get_wilson_interval(self, successes: int, trials: int) -> Tuple[float, float]:
+        """
+        Доверительный интервал Уилсона для доли успехов
+        :param successes:
+        :param trials:
+        :return:
+        """
+
+        if trials == 0:
+            return 0.0, 1.0
+        z2 = self.z * self.z
+        rate = successes / trials
+        center = (rate + z2 / (2 * trials)) / (1 + z2 / trials)
+        half_width = self.z * ((rate * (1 - rate) + z2 / (4 * trials)) / trials) ** 0.5 / (1 + z2 / trials)
+        return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+    def _is_cell_done(self, statistics: BattleStatistics) -> bool:
+        if statistics.battles >= self.max_battles:
+            return True
+        if statistics.battles < self.min_battles:
+            return False
+        low, high = self._get_wilson_interval(statistics.wins[0], statistics.battles)
+        return (high - low) / 2 <= self.precision
+
+
+    def _get_cell_result(self, statistics: BattleStatistics) -> dict:
+        """
+        Итог ячейки: доли побед A и B, ничьи, доверительный интервал доли побед A, длина боя
+        :param statistics:
+        :return:
+        """
+
+        summary = statistics.to_dict()
+        return {
+            "battles": summary["battles"],
+            "win_rate": summary["win_rates"][0],
+            "win_rate_ci": list(self._get_wilson_interval(statistics.wins[0], statistics.battles)),
+            "loss_rate": summary["win_rates"][1],
+            "draw_rate": summary["draw_rate"],
+            "turns_mean": summary["turns_mean"],
+            "turns_std": summary["turns_std"],
+        }
+
+
+    def _get_cell_seed(self, cell: MatchupCell) -> int:
+        """
+        Сид ячейки: зависит только от seed и самой ячейки, а не от ее места в матрице
+        :param cell:
+        :return:
+        """
+
+        digest = hashlib.sha256(repr(cell).encode('utf-8')).digest()
+        return RandomStream.derive_seed(self.seed, int.from_bytes(digest[:8], 'little') >> 1)
+
+
+    def _get_cache_key(self, cell: MatchupCell) -> tuple:
+        unit_a, unit_b, distance, field_size = cell
+        return (
+            unit_a, self._fingerprints[unit_a], unit_b, self._fingerprints[unit_b], distance, field_size,
+            self.max_turns, self.seed, self.precision, self.confidence, self.min_battles, self.max_battles,
+            self.batch_size
+        )
+
+
+    def _read_cache(self) -> dict:
+        """
+        Читает кэш ячеек. Если хэш каталога не изменился, годятся все записи,
+        иначе только записи, чьи отпечатки юнитов совпадают с текущими (это проверяется ключом)
+        :return:
+        """
+
+        if self.cache_path is None:
+            return {}
+        try:
+            with open(self.cache_path, 'rb') as file:
+                cached = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+            return {}
+        if not isinstance(cached, dict) or cached.get('version') != MATCHUP_FORMAT_VERSION:
+            return {}
+        if cached['catalog_hash'] != self.catalog.hash:
+            logger.info("Unit catalog changed, reusing matchups of unchanged units only")
+        return cached['cells']
+
+
+    def _write_cache(self, cells: dict):
+        """
+        Пишет кэш атомарно, выбрасывая записи с устаревшими отпечатками юнитов текущего каталога
+        :param cells:
+        :return:
+        """
+
+        from game.units.unit_factory import UnitFactory
+
+        if self.cache_path is None:
+            return
+
+        current = {
+            unit_name: self.get_unit_fingerprint(unit_name)
+            for unit_name in UnitFactory.get_registered_units() if unit_name in self.catalog
+        }
+        cells = {
+            key: result for key, result in cells.items()
+            if current.get(key[0]) == key[1] and current.get(key[2]) == key[3]
+        }
+
+        content = {'version': MATCHUP_FORMAT_VERSION, 'catalog_hash': self.catalog.hash, 'cells': cells}
+        try:
+            write_file_atomically(self.cache_path, pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError as error:
+            logger.warning("Matchup cache was not written: %s", error)
@@ -0,0 +1,367 @@
+import mmap
+import random
+import struct
+from bisect import bisect_right
+from typing import TYPE_CHECKING, BinaryIO, Iterator, List, Optional, Tuple
+from core.logging.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+if TYPE_CHECKING:
+    from game.field.battlefield import BattleField
+    from game.units.base_units import Unit
+
+
+# Формат файла (все числа little-endian):
+#   заголовок: сигнатура, версия, интервал ключевых кадров, сид RNG, размеры поля, число юнитов
+#   таблица юнитов: ключ юнита в JSON (длина + utf-8), x, y, команда (-1 - без команды)
+#   поток событий: байт типа события + упакованные поля события
+#   индекс ключевых кадров: (число завершенных ходов, смещение кадра в файле)
+#   хвост: смещение индекса, число ходов, победитель, сигнатура
+_MAGIC = b'BHRP'
+_VERSION = 1
+
+_HEADER = struct.Struct('<4sHHQHHH')
+_UNIT_NAME_LENGTH = struct.Struct('<B')
+_UNIT_RECORD = struct.Struct('<hhh')
+_INDEX_ENTRY = struct.Struct('<IQ')
+_TRAILER = struct.Struct('<QIIh4s')
+
+# События
+EVENT_TURN = 1
+EVENT_MOVE = 2
+EVENT_ATTACK = 3
+EVENT_KEYFRAME = 4
+EVENT_END = 5
+
+_EVENT_TYPE = struct.Struct('<B')
+_TURN = struct.Struct('<I')
+_MOVE = struct.Struct('<Hhh')
+_ATTACK = struct.Struct('<HHHh')
+_KEYFRAME = struct.Struct('<I')
+_KEYFRAME_UNIT = struct.Struct('<hhihB')
+_END = struct.Struct('<Ih')
+
+_NO_VALUE = -1
+
+
+class ReplayRecorder:
+    """
+    Класс записи реплея боя в компактный бинарный поток событий
+
+    Подается в BattleManager (параметр recorder). Пишет сид RNG, юнитов в том виде, в каком их создавала фабрика
+    (ключ в JSON, позиция, команда), и каждое действие: начало хода, перемещение, атаку.
+    Каждые keyframe_interval ходов пишется ключевой кадр с полным состоянием юнитов,
+    а в конце файла - индекс ключевых кадров, по которому ReplayPlayer быстро переходит к любому ходу.
+
+    Если сид не подан, он выбирается случайно. BattleManager берет его как сид своего потока случайных чисел
+    (или, если поток подан явно, записывает сюда сид потока), поэтому по сиду и таблице юнитов бой можно переиграть
+    """
+
+    def __init__(self, path: str, seed: Optional[int] = None, keyframe_interval: int = 10):
+        if keyframe_interval < 1:
+            raise ValueError(f'Интервал ключевых кадров должен быть положительным, подано {keyframe_interval}')
+
+        self.path = path
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(63)
+        self.keyframe_interval = keyframe_interval
+
+        self._file: Optional[BinaryIO] = None
+        self._units: List['Unit'] = []
+        self._unit_indices = {}
+        self._keyframes: List[Tuple[int, int]] = []
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def begin(self, battlefield: 'BattleField', units: List['Unit']):
+        """
+        Открывает файл и пишет заголовок и таблицу юнитов
+        :param battlefield:
+        :param units: юниты в порядке добавления в бой
+        :return:
+        """
+
+        self._units = list(units)
+        self._unit_indices = {unit: index for index, unit in enumerate(self._units)}
+        self._keyframes = []
+
+        self._file = open(self.path, 'wb')
+        buffer = [_HEADER.pack(
+            _MAGIC, _VERSION, self.keyframe_interval, self.seed,
+            battlefield.width, battlefield.height, len(self._units)
+        )]
+        for unit in self._units:
+            unit_name = unit.stats.key.encode('utf-8')
+            team = _NO_VALUE if unit.team is None else unit.team
+            buffer.append(_UNIT_NAME_LENGTH.pack(len(unit_name)))
+            buffer.append(unit_name)
+            buffer.append(_UNIT_RECORD.pack(unit.position.x, unit.position.y, team))
+        self._file.write(b''.join(buffer))
+
+
+    def record_turn(self, turn: int):
+        """
+        Отмечает начало хода. Перед ходами 1, K + 1, 2K + 1, ... пишет ключевой кадр
+        :param turn: номер начинающегося хода
+        :return:
+        """
+
+        completed_turns = turn - 1
+        if completed_turns % self.keyframe_interval == 0:
+            self._write_keyframe(completed_turns)
+        self._file.write(_EVENT_TYPE.pack(EVENT_TURN) + _TURN.pack(turn))
+
+
+    def record_move(self, unit: 'Unit'):
+        """
+        Пишет перемещение юнита (в его текущую позицию)
+        :param unit:
+        :return:
+        """
+
+        self._file.write(
+            _EVENT_TYPE.pack(EVENT_MOVE) + _MOVE.pack(self._unit_indices[unit], unit.position.x, unit.position.y)
+        )
+
+
+    def record_attack(self, unit: 'Unit', target: 'Unit', damage: int):
+        """
+        Пишет атаку: атакующий, цель, урон и боезапас атакующего после атаки
+        :param unit:
+        :param target:
+        :param damage:
+        :return:
+        """
+
+        ammo = getattr(unit, 'ammo', _NO_VALUE)
+        self._file.write(
+            _EVENT_TYPE.pack(EVENT_ATTACK) +
+            _ATTACK.pack(self._unit_indices[unit], self._unit_indices[target], damage, ammo)
+        )
+
+
+    def finish(self, turns: int, winner: Optional['Unit']):
+        """
+        Пишет конец боя, индекс ключевых кадров, хвост файла и закрывает файл
+        :param turns:
+        :param winner:
+        :return:
+        """
+
+        winner_index = _NO_VALUE if winner is None else self._unit_indices[winner]
+        self._file.write(_EVENT_TYPE.pack(EVENT_END) + _END.pack(turns, winner_index))
+
+        index_offset = self._file.tell()
+        self._file.write(b''.join(_INDEX_ENTRY.pack(turn, offset) for turn, offset in self._keyframes))
+        self._file.write(_TRAILER.pack(index_offset, len(self._keyframes), turns, winner_index, _MAGIC))
+        self._file.close()
+        self._file = None
+        logger.info("Replay saved to %s (%d keyframes)", self.path, len(self._keyframes))
+
+
+    def _write_keyframe(self, completed_turns: int):
+        self._keyframes.append((completed_turns, self._file.tell()))
+        buffer = [_EVENT_TYPE.pack(EVENT_KEYFRAME), _KEYFRAME.pack(completed_turns)]
+        for unit in self._units:
+            buffer.append(_KEYFRAME_UNIT.pack(
+                unit.position.x, unit.position.y, unit.health, getattr(unit, 'ammo', _NO_VALUE), unit.alive
+            ))
+        self._file.write(b''.join(buffer))
+
+
+class ReplayUnitState:
+    """
+    Класс состояния одного юнита в реплее
+    """
+
+    __slots__ = ('name', 'team', 'x', 'y', 'health', 'ammo', 'alive')
+
+    def __init__(self, name: str, team: Optional[int], x: int, y: int, health: int, ammo: Optional[int], alive: bool):
+        self.name = name
+        self.team = team
+        self.x = x
+        self.y = y
+        self.health = health
+        self.ammo = ammo
+        self.alive = alive
+
+
+    def __repr__(self):
+        return (
+            f"ReplayUnitState({self.name!r}, team={self.team}, x={self.x}, y={self.y}, "
+            f"health={self.health}, ammo={self.ammo}, alive={self.alive})"
+        )
+
+
+class ReplayPlayer:
+    """
+    Класс проигрывателя реплея
+
+    Отображает файл в память (mmap) и читает события прямо из него.
+    state_at(turn) находит по индексу ближайший ключевой кадр не позже хода и доигрывает от него только события
+    нескольких ходов, так что переход к любому ходу не требует чтения всего файла.
+    create_units() заново создает юнитов через UnitFactory, чтобы переиграть бой с тем же сидом
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._data
+
+        magic, version, self.keyframe_interval, self.seed, self.width, self.height, unit_count = \
+            _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError(f'Файл {path} не является реплеем BattleHex версии {_VERSION}')
+
+        offset = _HEADER.size
+        self.unit_names: List[str] = []
+        self._initial_units: List[Tuple[int, int, Optional[int]]] = []
+        for _ in range(unit_count):
+            (name_length,) = _UNIT_NAME_LENGTH.unpack_from(data, offset)
+            offset += _UNIT_NAME_LENGTH.size
+            self.unit_names.append(bytes(data[offset:offset + name_length]).decode('utf-8'))
+            offset += name_length
+            x, y, team = _UNIT_RECORD.unpack_from(data, offset)
+            offset += _UNIT_RECORD.size
+            self._initial_units.append((x, y, None if team == _NO_VALUE else team))
+        self._events_offset = offset
+
+        index_offset, keyframe_count, self.turns, winner, trailer_magic = \
+            _TRAILER.unpack_from(data, len(data) - _TRAILER.size)
+        if trailer_magic != _MAGIC:
+            self.close()
+            raise ValueError(f'Реплей {path} не дописан до конца')
+        self.winner: Optional[int] = None if winner == _NO_VALUE else winner
+        self._index_offset = index_offset
+
+        self._keyframe_turns: List[int] = []
+        self._keyframe_offsets: List[int] = []
+        for number in range(keyframe_count):
+            turn, keyframe_offset = _INDEX_ENTRY.unpack_from(data, index_offset + number * _INDEX_ENTRY.size)
+            self._keyframe_turns.append(turn)
+            self._keyframe_offsets.append(keyframe_offset)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+
+    def create_units(self) -> List['Unit']:
+        """
+        Создает юнитов боя заново теми же вызовами UnitFactory.create, что и в записанном бою
+        :return:
+        """
+
+        from game.units.unit_factory import UnitFactory
+        from game.field.position import Position
+
+        units = []
+        for unit_name, (x, y, team) in zip(self.unit_names, self._initial_units):
+            unit = UnitFactory.create(unit_name, Position(x, y))
+            unit.team = team
+            units.append(unit)
+        return units
+
+
+    def events(self, offset: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Итератор по событиям потока, начиная со смещения (по умолчанию - с первого события).
+
+        События - кортежи, первым элементом идет тип:
+            (EVENT_TURN, turn)
+            (EVENT_MOVE, unit, x, y)
+            (EVENT_ATTACK, unit, target, damage, ammo)
+            (EVENT_KEYFRAME, completed_turns, offset)
+            (EVENT_END, turns, winner)
+        :param offset:
+        :return:
+        """
+
+        data = self._data
+        offset = self._events_offset if offset is None else offset
+        unit_count = len(self.unit_names)
+
+        while offset < self._index_offset:
+            (event_type,) = _EVENT_TYPE.unpack_from(data, offset)
+            event_offset = offset
+            offset += _EVENT_TYPE.size
+
+            if event_type == EVENT_TURN:
+                yield (EVENT_TURN,) + _TURN.unpack_from(data, offset)
+                offset += _TURN.size
+            elif event_type == EVENT_MOVE:
+                yield (EVENT_MOVE,) + _MOVE.unpack_from(data, offset)
+                offset += _MOVE.size
+            elif event_type == EVENT_ATTACK:
+                yield (EVENT_ATTACK,) + _ATTACK.unpack_from(data, offset)
+                offset += _ATTACK.size
+            elif event_type == EVENT_KEYFRAME:
+                (completed_turns,) = _KEYFRAME.unpack_from(data, offset)
+                yield EVENT_KEYFRAME, completed_turns, event_offset
+                offset += _KEYFRAME.size + unit_count * _KEYFRAME_UNIT.size
+            elif event_type == EVENT_END:
+                yield (EVENT_END,) + _END.unpack_from(data, offset)
+                offset += _END.size
+            else:
+                raise ValueError(f'Неизвестный тип события {event_type} по смещению {event_offset}')
+
+
+    def state_at(self, turn: int) -> List[ReplayUnitState]:
+        """
+        Состояние юнитов после turn завершенных ходов (0 - расстановка до начала боя)
+        :param turn:
+        :return:
+        """
+
+        if not 0 <= turn <= self.turns:
+            raise ValueError(f'В реплее {self.turns} ходов, ход {turn} недоступен')
+
+        keyframe_number = bisect_right(self._keyframe_turns, turn) - 1
+        keyframe_offset = self._keyframe_offsets[keyframe_number]
+        states = self._read_keyframe(keyframe_offset)
+
+        for event in self.events(keyframe_offset):
+            event_type = event[0]
+            if event_type == EVENT_TURN:
+                if event[1] > turn:
+                    break
+            elif event_type == EVENT_MOVE:
+                state = states[event[1]]
+                state.x, state.y = event[2], event[3]
+            elif event_type == EVENT_ATTACK:
+                _, unit, target, damage, ammo = event
+                states[unit].ammo = None if ammo == _NO_VALUE else ammo
+                target_state = states[target]
+                target_state.health -= damage
+                if target_state.health <= 0:
+                    target_state.health = 0
+                    target_state.alive = False
+            elif event_type == EVENT_END:
+                break
+
+        return states
+
+
+    def _read_keyframe(self, offset: int) -> List[ReplayUnitState]:
+        offset += _EVENT_TYPE.size + _KEYFRAME.size
+        states = []
+        for unit_name, (_, _, team) in zip(self.unit_names, self._initial_units):
+            x, y, health, ammo, alive = _KEYFRAME_UNIT.unpack_from(self._data, offset)
+            offset += _KEYFRAME_UNIT.size
+            states.append(ReplayUnitState(
+                unit_name, team, x, y, health, None if ammo == _NO_VALUE else ammo, bool(alive)
+            ))
+        return states
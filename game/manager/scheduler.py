@@ -0,0 +1,248 @@
+from abc import ABC, abstractmethod
+from heapq import heapify, heappop, heappush
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+from core.logging.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+if TYPE_CHECKING:
+    from game.units.base_units import Unit
+
+
+# Тиков времени в одном полном ходе шкалы инициативы: делится на все скорости от 1 до 16,
+# поэтому интервалы между действиями целые и ходы не набегают из-за ошибок округления
+TIMELINE_TICKS = 720720
+
+
+class TurnScheduler(ABC):
+    """
+    Базовый класс планировщика ходов
+
+    Хранит очередь инициативы (кучу) и счетчики живых юнитов каждой стороны (сторона - команда юнита,
+    юнит без команды - сам себе сторона). Счетчики уменьшает Unit.die через battlefield.scheduler,
+    поэтому проверка победы - O(1), а не проход по всем юнитам.
+
+    Полный ход: begin_turn(), затем next_unit() до None. Очередь ленивая: погибшие юниты выбрасываются,
+    когда доходят до верха кучи, поэтому выбор следующего юнита - O(log n).
+
+    Наследники задают, кто и сколько раз ходит за полный ход (см. InitiativeScheduler и TimelineScheduler)
+    """
+
+    def __init__(self):
+        self.units: List['Unit'] = []
+        self.alive_by_side: Dict[object, int] = {}
+        self.alive_sides = 0
+        self._queue: list = []
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def add_units(self, units: Iterable['Unit']):
+        """
+        Регистрирует юнитов боя (порядок добавления решает при равной инициативе)
+        :param units:
+        :return:
+        """
+
+        for unit in units:
+            self.units.append(unit)
+            if unit.alive:
+                self._add_alive(unit)
+
+
+    def reset(self, units: Optional[Iterable['Unit']] = None):
+        """
+        Пересчитывает счетчики по флагам alive и сбрасывает очередь (нужно после восстановления снимка боя,
+        когда юниты оживают в обход Unit.die)
+        :param units: новый состав боя, по умолчанию - прежний
+        :return:
+        """
+
+        if units is not None:
+            self.units = list(units)
+        self.alive_by_side = {}
+        self.alive_sides = 0
+        for unit in self.units:
+            if unit.alive:
+                self._add_alive(unit)
+        self._queue = []
+
+
+    def on_unit_died(self, unit: 'Unit'):
+        side = unit if unit.team is None else unit.team
+        count = self.alive_by_side[side] - 1
+        self.alive_by_side[side] = count
+        if count == 0:
+            self.alive_sides -= 1
+
+
+    def is_decided(self) -> bool:
+        """
+        Закончен ли бой: живых сторон осталось не больше одной
+        :return:
+        """
+
+        return self.alive_sides <= 1
+
+
+    def get_winner(self) -> Optional['Unit']:
+        """
+        Победитель - первый из выживших юнитов (в порядке добавления) или None, если живых не осталось
+        :return:
+        """
+
+        for unit in self.units:
+            if unit.alive:
+                return unit
+        return None
+
+
+    @abstractmethod
+    def begin_turn(self):
+        """
+        Начинает полный ход: ставит в очередь юнитов, которые в нем ходят
+        :return:
+        """
+
+
+    @abstractmethod
+    def next_unit(self) -> Optional['Unit']:
+        """
+        Следующий живой юнит, который ходит в текущем полном ходе, или None, если ход закончен
+        :return:
+        """
+
+
+    def get_state(self) -> tuple:
+        """
+        Снимок очереди для GameState: записи кучи без ссылок на юнитов (последнее поле записи - индекс юнита
+        в порядке добавления), поэтому снимок можно восстановить в копию боя с теми же юнитами
+        :return:
+        """
+
+        return tuple([entry[:-1] for entry in self._queue])
+
+
+    def set_state(self, state: tuple):
+        """
+        Восстанавливает очередь из снимка get_state. Порядок записей сохранен, поэтому это по-прежнему куча.
+        Счетчики живых не трогает, их пересчитывает reset
+        :param state:
+        :return:
+        """
+
+        units = self.units
+        self._queue = [(*entry, units[entry[-1]]) for entry in state]
+
+
+    def _add_alive(self, unit: 'Unit'):
+        side = unit if unit.team is None else unit.team
+        count = self.alive_by_side.get(side, 0)
+        if count == 0:
+            self.alive_sides += 1
+        self.alive_by_side[side] = count + 1
+
+
+class InitiativeScheduler(TurnScheduler):
+    """
+    Класс классической очереди инициативы (по умолчанию в BattleManager)
+
+    За полный ход каждый живой юнит ходит один раз, по убыванию скорости (при равной - в порядке добавления)
+    """
+
+    def begin_turn(self):
+        self._queue = [(-unit.speed, index, unit) for index, unit in enumerate(self.units) if unit.alive]
+        heapify(self._queue)
+
+
+    def next_unit(self) -> Optional['Unit']:
+        queue = self._queue
+        while queue:
+            unit = heappop(queue)[2]
+            if unit.alive:
+                return unit
+        return None
+
+
+class TimelineScheduler(TurnScheduler):
+    """
+    Класс шкалы инициативы (в духе ATB): юнит ходит раз в base_speed / speed полных ходов,
+    то есть быстрые юниты ходят пропорционально чаще медленных
+
+    По умолчанию base_speed - наименьшая скорость живых юнитов на первом ходу: самые медленные ходят раз в ход,
+    остальные чаще. В начале боя все готовы к ходу сразу (первые действия идут в порядке убывания скорости).
+    Время хранится в целых тиках (TIMELINE_TICKS на полный ход).
+
+    Положение на шкале входит в снимки боя (см. get_state), а после reset() без восстановления снимка
+    все живые юниты снова готовы к ходу в начале следующего полного хода
+    """
+
+    def __init__(self, base_speed: Optional[int] = None):
+        if base_speed is not None and base_speed <= 0:
+            raise ValueError('Базовая скорость base_speed должна быть положительной')
+
+        super().__init__()
+        self.base_speed = base_speed
+        self._turn_end = 0
+        self._intervals: Dict['Unit', int] = {}
+        self._initialized = False
+
+
+    def add_units(self, units: Iterable['Unit']):
+        start = len(self.units)
+        super().add_units(units)
+        if self._initialized:
+            for index in range(start, len(self.units)):
+                unit = self.units[index]
+                if unit.alive:
+                    heappush(self._queue, (self._turn_end, -unit.speed, index, unit))
+
+
+    def reset(self, units: Optional[Iterable['Unit']] = None):
+        super().reset(units)
+        self._initialized = False
+
+
+    def begin_turn(self):
+        if not self._initialized:
+            self._initialize()
+        self._turn_end += TIMELINE_TICKS
+
+
+    def next_unit(self) -> Optional['Unit']:
+        queue = self._queue
+        turn_end = self._turn_end
+        while queue and queue[0][0] < turn_end:
+            time, priority, index, unit = heappop(queue)
+            if not unit.alive:
+                continue
+            interval = self._intervals.get(unit)
+            if interval is None:
+                interval = self._intervals[unit] = max(1, TIMELINE_TICKS * self.base_speed // max(unit.speed, 1))
+            heappush(queue, (time + interval, priority, index, unit))
+            return unit
+        return None
+
+
+    def get_state(self) -> tuple:
+        return self._turn_end, self._initialized, self.base_speed, super().get_state()
+
+
+    def set_state(self, state: tuple):
+        self._turn_end, self._initialized, base_speed, queue = state
+        if base_speed != self.base_speed:
+            self.base_speed = base_speed
+            self._intervals = {}
+        super().set_state(queue)
+
+
+    def _initialize(self):
+        alive_units = [unit for unit in self.units if unit.alive]
+        if self.base_speed is None:
+            self.base_speed = min((unit.speed for unit in alive_units), default=1) or 1
+        self._queue = [
+            (self._turn_end, -unit.speed, index, unit) for index, unit in enumerate(self.units) if unit.alive
+        ]
+        heapify(self._queue)
+        self._initialized = True
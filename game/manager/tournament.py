@@ -0,0 +1,365 @@
+import math
+import pickle
+from itertools import combinations
+from multiprocessing import cpu_count
+from pathlib import Path
+from time import monotonic
+from typing import Dict, List, Optional, Tuple, Union
+from core.logging.logger import Logger
+from game.manager.batch_simulator import _deploy, _get_columns, worker_map
+from utils.data_functions import CACHE_DIR, write_file_atomically
+from utils.random_stream import RandomStream
+
+
+logger = Logger(__name__)
+
+
+TOURNAMENT_CHECKPOINT_FILE = CACHE_DIR / 'tournament.pickle'
+
+# Версия формата чекпоинта турнира (поднимается при изменении формата или правил боя, как у матрицы матчапов)
+TOURNAMENT_FORMAT_VERSION = 2
+
+# Состав армии: ключ юнита в JSON -> количество (первый тип встает в переднюю колонну, см. _deploy)
+Composition = Dict[str, int]
+
+# Матч: (номер раунда, индекс первой армии, индекс второй армии)
+MatchId = Tuple[int, int, int]
+
+PAIRINGS = ('round_robin', 'swiss')
+
+# Параметры рейтинга Глико (Glickman, 1999)
+GLICKO_Q = math.log(10) / 400
+GLICKO_MIN_RD = 30.0
+
+
+class Tournament:
+    """
+    Класс турнира армий (инструмент баланса): ранжирует составы армий, а не отдельные матчапы
+
+    Армии (составы из ключей юнитов UnitFactory) играют матчи по круговой системе (round_robin, один раунд
+    со всеми парами) или по швейцарской (swiss, rounds раундов, в каждом армии с близким рейтингом Эло,
+    еще не игравшие друг с другом). Матч - games_per_match боев на поле width x height, армии по очереди
+    стоят слева и справа, бой, не законченный за max_turns ходов, - ничья.
+
+    Матчи раунда раздаются пулу процессов по одному: освободившийся процесс сразу берет следующий матч из общей
+    очереди, поэтому долгие матчи не задерживают остальные. Рейтинги Эло и Глико обновляются по мере прихода
+    результатов, но в порядке матчей раунда (пришедшие раньше своей очереди ждут), поэтому итог не зависит
+    ни от числа процессов, ни от того, какой матч закончился первым. Сиды боев выводятся из seed и матча.
+
+    Результаты матчей раз в checkpoint_interval секунд (и в конце каждого раунда) атомарно пишутся в чекпоинт.
+    Прерванный турнир с теми же параметрами продолжается с чекпоинта: сыгранные матчи не переигрываются,
+    рейтинги пересчитываются из их результатов
+    """
+
+    def __init__(
+            self,
+            compositions: Dict[str, Composition],
+            pairing: str = 'round_robin',
+            rounds: Optional[int] = None,
+            games_per_match: int = 2,
+            width: int = 30,
+            height: int = 10,
+            max_turns: int = 100,
+            processes: Optional[int] = None,
+            seed: int = 0,
+            elo_k: float = 16.0,
+            initial_rating: float = 1500.0,
+            initial_rd: float = 350.0,
+            checkpoint_path: Optional[Union[str, Path]] = TOURNAMENT_CHECKPOINT_FILE,
+            checkpoint_interval: float = 30.0
+    ):
+        from game.units.unit_factory import UnitFactory
+        from game.manager.matchup_matrix import MatchupMatrix
+
+        if len(compositions) < 2:
+            raise ValueError('Для турнира нужно хотя бы две армии')
+        if pairing not in PAIRINGS:
+            raise ValueError(f'Неизвестная система турнира: {pairing}. Доступные: {", ".join(PAIRINGS)}')
+        if games_per_match <= 0:
+            raise ValueError('В матче должен быть хотя бы один бой')
+
+        registered_units = UnitFactory.get_registered_units()
+        for name, composition in compositions.items():
+            unknown = [unit_name for unit_name in composition if unit_name not in registered_units]
+            if unknown:
+                raise ValueError(f'Неизвестные юниты в армии {name}: {", ".join(unknown)}')
+            size = sum(composition.values())
+            if size <= 0 or any(count < 0 for count in composition.values()):
+                raise ValueError(f'В армии {name} должен быть хотя бы один юнит')
+            if _get_columns(size, 1, height) > width // 2:
+                raise ValueError(f'Армия {name} из {size} юнитов не помещается на половину поля {width}x{height}')
+
+        self.names: List[str] = list(compositions)
+        self.compositions: List[Composition] = [dict(compositions[name]) for name in self.names]
+        self.pairing = pairing
+        self.rounds = 1 if pairing == 'round_robin' else (rounds or max(1, math.ceil(math.log2(len(self.names)))))
+        self.games_per_match = games_per_match
+        self.width = width
+        self.height = height
+        self.max_turns = max_turns
+        self.processes = processes or cpu_count()
+        self.seed = seed
+        self.elo_k = elo_k
+        self.initial_rating = initial_rating
+        self.initial_rd = initial_rd
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+
+        self._key = (
+            tuple(
+                (name, tuple((unit_name, count, MatchupMatrix.get_unit_fingerprint(unit_name))
+                             for unit_name, count in composition.items()))
+                for name, composition in zip(self.names, self.compositions)
+            ),
+            self.pairing, self.rounds, games_per_match, width, height, max_turns, seed
+        )
+        self._reset_standings()
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def run(self) -> List[dict]:
+        """
+        Играет (или доигрывает с чекпоинта) турнир и возвращает таблицу
+        :return: таблица по убыванию рейтинга Эло (см. get_standings)
+        """
+
+        checkpoint = self._read_checkpoint()
+        self._results: Dict[MatchId, List[float]] = checkpoint['results']
+        self._round_pairs: List[List[Tuple[int, int]]] = checkpoint['rounds']
+        self._reset_standings()
+        self._last_checkpoint = monotonic()
+        if self._results:
+            logger.info("Tournament resumed with %d finished matches", len(self._results))
+
+        with worker_map(self.processes) as map_function:
+            self._play_rounds(map_function)
+
+        logger.info("Tournament finished: %d matches", len(self._results))
+
+        return self.get_standings()
+
+
+    def get_standings(self) -> List[dict]:
+        """
+        Таблица турнира: рейтинги Эло и Глико (с отклонением RD), победы, ничьи и поражения в боях
+        :return:
+        """
+
+        standings = [
+            {
+                "name": name,
+                "elo": self.elo[index],
+                "glicko": self.glicko[index],
+                "glicko_rd": self.glicko_rd[index],
+                "wins": self.record[index][0],
+                "draws": self.record[index][1],
+                "losses": self.record[index][2],
+            }
+            for index, name in enumerate(self.names)
+        ]
+        standings.sort(key=lambda row: row["elo"], reverse=True)
+        return standings
+
+
+    def _play_rounds(self, map_function):
+        """
+        Играет раунды по очереди (пары швейцарского раунда зависят от рейтингов после прошлого)
+        :param map_function: map или Pool.imap_unordered
+        :return:
+        """
+
+        for round_number in range(self.rounds):
+            if round_number < len(self._round_pairs):
+                pairs = self._round_pairs[round_number]
+            else:
+                pairs = self._get_pairs(round_number)
+                self._round_pairs.append(pairs)
+
+            matches = [(round_number, first, second) for first, second in pairs]
+            tasks = [self._get_task(match) for match in matches if match not in self._results]
+            applied = 0
+            for match, scores in map_function(_play_match, tasks):
+                self._results[match] = scores
+                # рейтинги обновляются строго в порядке матчей раунда
+                while applied < len(matches) and matches[applied] in self._results:
+                    self._apply_match(matches[applied])
+                    applied += 1
+                if monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+                    self._write_checkpoint()
+            while applied < len(matches):
+                self._apply_match(matches[applied])
+                applied += 1
+
+            self._write_checkpoint()
+            logger.info("Tournament round %d of %d finished", round_number + 1, self.rounds)
+
+
+    def _get_pairs(self, round_number: int) -> List[Tuple[int, int]]:
+        """
+        Пары раунда. Круговая система - все пары. Швейцарская - армии по убыванию рейтинга Эло,
+        каждая с ближайшей ниже, с которой еще не играла (если таких нет - с ближайшей ниже).
+        При нечетном числе армий самая слабая из еще не пропускавших пропускает раунд
+        :param round_number:
+        :return:
+        """
+
+        if self.pairing == 'round_robin':
+            return list(combinations(range(len(self.names)), 2))
+
+        played = {frozenset(pair) for pairs in self._round_pairs for pair in pairs}
+        order = sorted(range(len(self.names)), key=lambda index: (-self.elo[index], index))
+        if len(order) % 2:
+            had_bye = {
+                index for pairs in self._round_pairs for index in range(len(self.names))
+                if all(index not in pair for pair in pairs)
+            }
+            bye = next((index for index in reversed(order) if index not in had_bye), order[-1])
+            order.remove(bye)
+
+        pairs = []
+        while order:
+            first = order.pop(0)
+            second = next((index for index in order if frozenset((first, index)) not in played), order[0])
+            order.remove(second)
+            pairs.append((first, second))
+        return pairs
+
+
+    def _get_task(self, match: MatchId) -> tuple:
+        round_number, first, second = match
+        count = len(self.names)
+        seed = RandomStream.derive_seed(self.seed, (round_number * count + first) * count + second)
+        return (
+            match, self.compositions[first], self.compositions[second], self.width, self.height, self.max_turns,
+            seed, self.games_per_match
+        )
+
+
+    def _reset_standings(self):
+        count = len(self.names)
+        self.elo = [self.initial_rating] * count
+        self.glicko = [self.initial_rating] * count
+        self.glicko_rd = [self.initial_rd] * count
+        self.record = [[0, 0, 0] for _ in range(count)]
+
+
+    def _apply_match(self, match: MatchId):
+        """
+        Обновляет рейтинги и счет по боям матча, бой за боем
+        :param match:
+        :return:
+        """
+
+        _, first, second = match
+        for score in self._results[match]:
+            self._update_elo(first, second, score)
+            self._update_glicko(first, second, score)
+            if score == 1:
+                self.record[first][0] += 1
+                self.record[second][2] += 1
+            elif score == 0:
+                self.record[first][2] += 1
+                self.record[second][0] += 1
+            else:
+                self.record[first][1] += 1
+                self.record[second][1] += 1
+
+
+    def _update_elo(self, first: int, second: int, score: float):
+        expected = 1 / (1 + 10 ** ((self.elo[second] - self.elo[first]) / 400))
+        delta = self.elo_k * (score - expected)
+        self.elo[first] += delta
+        self.elo[second] -= delta
+
+
+    def _update_glicko(self, first: int, second: int, score: float):
+        """
+        Обновление Глико-1 по одному бою (бой - отдельный рейтинговый период), обе армии - по значениям до боя
+        :param first:
+        :param second:
+        :param score: очки первой армии (1, 0.5 или 0)
+        :return:
+        """
+
+        ratings, deviations = self.glicko, self.glicko_rd
+        updated = []
+        for player, opponent, player_score in ((first, second, score), (second, first, 1 - score)):
+            g = 1 / math.sqrt(1 + 3 * GLICKO_Q ** 2 * deviations[opponent] ** 2 / math.pi ** 2)
+            expected = 1 / (1 + 10 ** (-g * (ratings[player] - ratings[opponent]) / 400))
+            d_squared = 1 / (GLICKO_Q ** 2 * g ** 2 * expected * (1 - expected))
+            precision = 1 / deviations[player] ** 2 + 1 / d_squared
+            updated.append((
+                ratings[player] + GLICKO_Q / precision * g * (player_score - expected),
+                max(GLICKO_MIN_RD, math.sqrt(1 / precision))
+            ))
+        (ratings[first], deviations[first]), (ratings[second], deviations[second]) = updated
+
+
+    def _read_checkpoint(self) -> dict:
+        empty = {'results': {}, 'rounds': []}
+        if self.checkpoint_path is None:
+            return empty
+        try:
+            with open(self.checkpoint_path, 'rb') as file:
+                checkpoint = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+            return empty
+        if (
+                not isinstance(checkpoint, dict) or checkpoint.get('version') != TOURNAMENT_FORMAT_VERSION
+                or checkpoint.get('key') != self._key
+        ):
+            logger.info("Tournament checkpoint belongs to another tournament, starting anew")
+            return empty
+        return {'results': checkpoint['results'], 'rounds': checkpoint['rounds']}
+
+
+    def _write_checkpoint(self):
+        """
+        Пишет чекпоинт атомарно (см. write_file_atomically), чтобы убитый посреди записи процесс не испортил его
+        :return:
+        """
+
+        self._last_checkpoint = monotonic()
+        if self.checkpoint_path is None:
+            return
+
+        content = {
+            'version': TOURNAMENT_FORMAT_VERSION, 'key': self._key, 'results': self._results, 'rounds': self._round_pairs
+        }
+        try:
+            write_file_atomically(self.checkpoint_path, pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError as error:
+            logger.warning("Tournament checkpoint was not written: %s", error)
+
+
+def _play_match(task: tuple) -> Tuple[MatchId, List[float]]:
+    """
+    Играет матч в текущем процессе
+    :param task: (матч, состав первой армии, состав второй, ширина и высота поля, ограничение ходов, сид матча,
+        число боев)
+    :return: матч и очки первой армии в каждом бою (1 - победа, 0.5 - ничья, 0 - поражение)
+    """
+
+    from game.field.battlefield import BattleField
+    from game.manager.battle_manager import BattleManager
+
+    match, first, second, width, height, max_turns, seed, games = task
+    first, second = (
+        [unit_name for unit_name, count in composition.items() for _ in range(count)] for composition in (first, second)
+    )
+    scores = []
+    for game in range(games):
+        # в нечетных боях армии меняются сторонами поля
+        swapped = game % 2 == 1
+        first_units = _deploy(first, 1 if swapped else 0, width, height)
+        second_units = _deploy(second, 0 if swapped else 1, width, height)
+        battle = BattleManager(
+            BattleField(width, height), headless=True, max_turns=max_turns,
+            rng=RandomStream(RandomStream.derive_seed(seed, game))
+        )
+        winner = battle.run(*first_units, *second_units)
+        if winner is None:
+            scores.append(0.5)
+        else:
+            scores.append(1.0 if winner.team == first_units[0].team else 0.0)
+    return match, scores
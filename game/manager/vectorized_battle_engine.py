@@ -0,0 +1,250 @@
+from typing import Optional, Sequence
+import numpy as np
+
+from game.manager.batch_simulator import BattleStatistics, UnitSetup
+from core.logging.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class VectorizedBattleEngine:
+    """
+    Векторизованный движок боев 1 на 1 на одномерном поле (BattleField с height = 1)
+
+    Хранит много боев сразу в виде структуры массивов (одна строка на бой, один столбец на юнита)
+    и продвигает все бои одновременно векторными операциями NumPy.
+
+    Полностью повторяет правила объектного движка:
+        - порядок хода по убыванию скорости (при равенстве ходит юнит, описанный раньше), см. BattleManager._process_full_turn
+        - атаку с места, поиск атакующей позиции и движение в сторону врага, см. BattleManager._process_unit_turn
+        - расчет урона, см. Unit._calculate_damage_to_target
+        - стрельбу, расход боезапаса и штраф в ближнем бою, см. Shooter.attack
+
+    Вместо перебора клеток в find_attack_position и отката шагов при движении используются замкнутые формулы,
+    дающие ту же самую клетку, что и объектный движок.
+
+    Столбцы массивов соответствуют юнитам в порядке их описания в раскладке боя
+    """
+
+    def __init__(
+            self,
+            unit_setups: Sequence[UnitSetup],
+            field_size: int,
+            battles: int,
+            max_turns: Optional[int] = None,
+            seed: Optional[int] = None
+    ):
+        if len(unit_setups) != 2:
+            raise ValueError('векторизованный движок умеет только бои 1 на 1')
+
+        from game.units.unit_factory import UnitFactory
+        from game.units.base_units import Shooter
+        from game.field.position import Position
+
+        self.field_size = field_size
+        self.battles = battles
+        self.max_turns = max_turns
+        self.rng = np.random.default_rng(seed)
+
+        units = [UnitFactory.create(unit_name, Position(x)) for unit_name, x in unit_setups]
+
+        def column(values, dtype):
+            return np.tile(np.array(values, dtype=dtype), (battles, 1))
+
+        # Неизменяемые характеристики юнитов
+        self.speed = column([unit.speed for unit in units], np.int64)
+        self.range = column([unit.range for unit in units], np.int64)
+        self.damage_min = column([unit.damage_min for unit in units], np.int64)
+        self.damage_max = column([unit.damage_max for unit in units], np.int64)
+        self.is_shooter = column([isinstance(unit, Shooter) for unit in units], np.bool_)
+        self.melee_penalty = column([getattr(unit, 'melee_penalty', 1.0) for unit in units], np.float64)
+        self.damage_multiplier = column(
+            [units[0].get_damage_multiplier(units[1]), units[1].get_damage_multiplier(units[0])],
+            np.float64
+        )
+
+        # Состояние боев
+        self.position = column([unit.position.x for unit in units], np.int64)
+        self.health = column([unit.health for unit in units], np.int64)
+        self.ammo = column([getattr(unit, 'ammo', 0) for unit in units], np.int64)
+        self.damage_dealt = np.zeros((battles, 2), dtype=np.int64)
+        self.turns = np.zeros(battles, dtype=np.int64)
+        self.winner = np.full(battles, -1, dtype=np.int64)
+        self.done = np.zeros(battles, dtype=np.bool_)
+
+        # Стабильная сортировка по убыванию скорости: при равной скорости первым ходит юнит из первого столбца
+        first = np.where(self.speed[:, 1] > self.speed[:, 0], 1, 0)
+        self.order = np.stack([first, 1 - first], axis=1)
+
+        logger.info("%s initiated with %d battles", self.__class__.__name__, battles)
+
+
+    def run(self) -> dict:
+        """
+        Прогоняет все бои до конца и возвращает агрегированную статистику в том же виде, что и BatchSimulator.run
+        :return:
+        """
+
+        while not self.done.all():
+            self._process_full_turn()
+
+        logger.info("%d battles simulated", self.battles)
+
+        return self.get_statistics().to_dict()
+
+
+    def get_statistics(self) -> BattleStatistics:
+        """
+        Собирает BattleStatistics из массивов результатов
+        :return:
+        """
+
+        statistics = BattleStatistics(2)
+        statistics.battles = self.battles
+        statistics.draws = int(np.count_nonzero(self.winner == -1))
+        statistics.wins = [int(np.count_nonzero(self.winner == index)) for index in range(2)]
+        statistics.damage_total = [int(total) for total in self.damage_dealt.sum(axis=0)]
+        statistics.turns_total = int(self.turns.sum())
+        statistics.turns_squares_total = int((self.turns * self.turns).sum())
+        if self.battles:
+            statistics.turns_min = int(self.turns.min())
+            statistics.turns_max = int(self.turns.max())
+        turns, counts = np.unique(self.turns, return_counts=True)
+        statistics.turns_counts = {int(turn): int(count) for turn, count in zip(turns, counts)}
+        return statistics
+
+
+    def _process_full_turn(self):
+        """
+        Обрабатывает один полный ход во всех незаконченных боях
+        :return:
+        """
+
+        rows = np.flatnonzero(~self.done)
+        self.turns[rows] += 1
+
+        for step in range(2):
+            rows = rows[~self.done[rows]]
+            if rows.size:
+                self._process_unit_turn(rows, self.order[rows, step])
+
+        if self.max_turns is not None:
+            self.done[self.turns >= self.max_turns] = True
+
+
+    def _process_unit_turn(self, rows: np.ndarray, actor: np.ndarray):
+        """
+        Ход одного юнита в каждом из поданных боев
+        :param rows: индексы боев
+        :param actor: столбец ходящего юнита в каждом бою
+        :return:
+        """
+
+        target = 1 - actor
+        actor_x = self.position[rows, actor]
+        target_x = self.position[rows, target]
+        distance = np.abs(actor_x - target_x)
+
+        is_shooter = self.is_shooter[rows, actor]
+        unit_range = self.range[rows, actor]
+        has_ammo = self.ammo[rows, actor] > 0
+
+        can_attack = np.where(
+            is_shooter,
+            ((distance <= unit_range) & has_ammo) | (distance <= 1),
+            distance <= unit_range
+        )
+
+        if can_attack.any():
+            self._attack(rows[can_attack], actor[can_attack], distance[can_attack])
+
+        moving = ~can_attack
+        if moving.any():
+            # Из атакующей позиции бьют на дистанцию range, стрелок без боезапаса - только вплотную
+            effective_range = np.where(is_shooter & ~has_ammo, np.minimum(unit_range, 1), unit_range)
+            self._move(
+                rows[moving], actor[moving], actor_x[moving], target_x[moving], effective_range[moving]
+            )
+
+
+    def _attack(self, rows: np.ndarray, actor: np.ndarray, distance: np.ndarray):
+        """
+        Атака юнита по врагу в каждом из поданных боев
+        :param rows:
+        :param actor:
+        :param distance:
+        :return:
+        """
+
+        target = 1 - actor
+
+        base_damage = self.rng.integers(self.damage_min[rows, actor], self.damage_max[rows, actor] + 1)
+        damage = np.maximum(1, (base_damage * self.damage_multiplier[rows, actor]).astype(np.int64))
+
+        is_shooter = self.is_shooter[rows, actor]
+        ammo = self.ammo[rows, actor]
+        is_melee = is_shooter & ((distance <= 1) | (ammo <= 0))
+        is_shot = is_shooter & ~is_melee
+
+        penalized = np.maximum(1, (damage * self.melee_penalty[rows, actor]).astype(np.int64))
+        damage = np.where(is_melee, penalized, damage)
+        self.ammo[rows[is_shot], actor[is_shot]] -= 1
+
+        self.health[rows, target] -= damage
+        self.damage_dealt[rows, actor] += damage
+
+        killed = self.health[rows, target] <= 0
+        if killed.any():
+            killed_rows = rows[killed]
+            self.health[killed_rows, target[killed]] = 0
+            self.winner[killed_rows] = actor[killed]
+            self.done[killed_rows] = True
+
+
+    def _move(
+            self,
+            rows: np.ndarray,
+            actor: np.ndarray,
+            actor_x: np.ndarray,
+            target_x: np.ndarray,
+            effective_range: np.ndarray
+    ):
+        """
+        Движение юнита в каждом из поданных боев.
+
+        Сначала ищется атакующая позиция (как в Unit.find_attack_position: минимальная дистанция до врага,
+        при равенстве - клетка слева от врага), иначе юнит идет к врагу на максимально возможное число шагов
+        :param rows:
+        :param actor:
+        :param actor_x:
+        :param target_x:
+        :param effective_range:
+        :return:
+        """
+
+        speed = self.speed[rows, actor]
+        reachable_low = np.maximum(0, actor_x - speed)
+        reachable_high = np.minimum(self.field_size - 1, actor_x + speed)
+
+        # Ближайшая к врагу клетка слева от него (своя клетка занята самим юнитом)
+        left = np.minimum(target_x - 1, reachable_high)
+        left = np.where(left == actor_x, left - 1, left)
+        left_valid = (left >= reachable_low) & (left >= target_x - effective_range)
+
+        # Ближайшая к врагу клетка справа от него
+        right = np.maximum(target_x + 1, reachable_low)
+        right = np.where(right == actor_x, right + 1, right)
+        right_valid = (right <= reachable_high) & (right <= target_x + effective_range)
+
+        use_left = left_valid & (~right_valid | (target_x - left <= right - target_x))
+        attack_position = np.where(use_left, left, right)
+        found = left_valid | right_valid
+
+        # Движение в сторону врага: максимум шагов в пределах поля, не вставая на клетку врага
+        direction = np.where(target_x > actor_x, 1, -1)
+        steps = np.minimum(speed, np.where(direction > 0, self.field_size - 1 - actor_x, actor_x))
+        steps = np.where(actor_x + direction * steps == target_x, steps - 1, steps)
+        step_position = np.where(steps >= 1, actor_x + direction * steps, actor_x)
+
+        self.position[rows, actor] = np.where(found, attack_position, step_position)
@@ -0,0 +1 @@
+from .battle_service import BattleService, BattleRequest, DEFAULT_HOST, DEFAULT_PORT
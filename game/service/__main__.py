@@ -0,0 +1,60 @@
+"""
+Сервис боев: принимает раскладки боев строками JSON по TCP или Unix-сокету и отвечает их итогами
+(или событиями каждого хода), см. BattleService
+
+Запуск из корня проекта:
+    python -m game.service --port 8765 --workers 4
+    python -m game.service --unix /tmp/battlehex.sock
+
+Пример запроса:
+    {"id": 1, "units": [["pikeman", 0], ["archer", 22]], "width": 23, "seed": 42, "stream": true}
+"""
+
+import argparse
+import asyncio
+import signal
+from contextlib import suppress
+from game.service.battle_service import BattleService, DEFAULT_HOST, DEFAULT_PORT
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=DEFAULT_HOST, help='адрес TCP')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='порт TCP')
+    parser.add_argument('--unix', default=None, help='путь Unix-сокета (вместо TCP)')
+    parser.add_argument('--workers', type=int, default=None, help='процессов, играющих бои (по умолчанию по числу ядер)')
+    parser.add_argument('--max-concurrent', type=int, default=64, help='предел одновременно идущих боев')
+    parser.add_argument('--max-pending', type=int, default=32, help='предел незаконченных запросов соединения')
+    parser.add_argument('--timeout', type=float, default=30.0, help='срок боя по умолчанию, секунды')
+    parser.add_argument('--max-turns', type=int, default=1000, help='наибольшее ограничение ходов боя')
+    parser.add_argument('--log', action='store_true', help='не глушить логи боев')
+    arguments = parser.parse_args()
+
+    service = BattleService(
+        host=arguments.host,
+        port=arguments.port,
+        unix_path=arguments.unix,
+        workers=arguments.workers,
+        max_concurrent=arguments.max_concurrent,
+        max_pending=arguments.max_pending,
+        default_timeout=arguments.timeout,
+        max_turns=arguments.max_turns,
+        disable_logging=not arguments.log
+    )
+
+    async def serve():
+        await service.start()
+        print(f"Battle service listening on {service.get_address()}", flush=True)
+        # по SIGTERM сервис закрывается штатно, иначе процессы боев остаются сиротами
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        with suppress(asyncio.CancelledError):
+            await service.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,483 @@
+import asyncio
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from time import perf_counter
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from core.logging.logger import Logger, set_logging_enabled
+
+
+logger = Logger(__name__)
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Предельная длина строки запроса в байтах
+MAX_LINE_LENGTH = 1 << 20
+
+# Предельные размеры поля боя в запросе
+MAX_FIELD_SIZE = 1000
+
+# Юнит в запросе: (ключ в JSON, позиция x, позиция y, команда)
+UnitRequest = Tuple[str, int, int, Optional[int]]
+
+
+if TYPE_CHECKING:
+    from game.manager.battle_manager import BattleManager
+
+
+class BattleRequest:
+    """
+    Класс разобранного запроса на бой
+
+    Запрос - JSON-объект в одной строке:
+        {"id": "b1", "units": [{"name": "pikeman", "x": 0}, {"name": "archer", "x": 22, "y": 0, "team": 1}],
+         "width": 23, "height": 1, "seed": 42, "max_turns": 200, "stream": false, "timeout": 5}
+    Юнита можно задать и списком [имя, x] или [имя, x, y, команда] (как раскладки BatchSimulator).
+    Все поля, кроме units, необязательны
+    """
+
+    __slots__ = ('id', 'units', 'width', 'height', 'seed', 'max_turns', 'stream', 'timeout')
+
+    def __init__(
+            self,
+            request_id,
+            units: List[UnitRequest],
+            width: int,
+            height: int,
+            seed: Optional[int],
+            max_turns: int,
+            stream: bool,
+            timeout: float
+    ):
+        self.id = request_id
+        self.units = units
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.max_turns = max_turns
+        self.stream = stream
+        self.timeout = timeout
+
+
+    @classmethod
+    def from_message(cls, message: dict, default_timeout: float, max_turns_limit: int) -> 'BattleRequest':
+        """
+        Разбирает и проверяет сообщение клиента
+
+        ValueError: если в запросе не хватает полей или они неверного типа
+        :param message:
+        :param default_timeout: срок боя, если в запросе его нет
+        :param max_turns_limit: наибольшее допустимое ограничение ходов (и ограничение по умолчанию)
+        :return:
+        """
+
+        units = message.get('units')
+        if not isinstance(units, list) or len(units) < 2:
+            raise ValueError('В запросе должно быть поле units со списком хотя бы из двух юнитов')
+        parsed_units = [cls._parse_unit(unit) for unit in units]
+
+        width = message.get('width', 23)
+        height = message.get('height', 1)
+        if not all(isinstance(size, int) and 0 < size <= MAX_FIELD_SIZE for size in (width, height)):
+            raise ValueError(f'Размеры поля width и height должны быть целыми от 1 до {MAX_FIELD_SIZE}')
+
+        seed = message.get('seed')
+        if seed is not None and (not isinstance(seed, int) or seed < 0):
+            raise ValueError('Сид seed должен быть неотрицательным целым')
+
+        max_turns = message.get('max_turns', max_turns_limit)
+        if not isinstance(max_turns, int) or not 0 < max_turns <= max_turns_limit:
+            raise ValueError(f'Ограничение ходов max_turns должно быть целым от 1 до {max_turns_limit}')
+
+        timeout = message.get('timeout', default_timeout)
+        if not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ValueError('Срок timeout должен быть положительным числом секунд')
+
+        return cls(
+            message.get('id'), parsed_units, width, height, seed, max_turns, bool(message.get('stream', False)),
+            float(timeout)
+        )
+
+
+    @staticmethod
+    def _parse_unit(unit) -> UnitRequest:
+        if isinstance(unit, dict):
+            name, x, y, team = unit.get('name'), unit.get('x'), unit.get('y', 0), unit.get('team')
+        elif isinstance(unit, list) and 2 <= len(unit) <= 4:
+            name, x, y, team = unit + [0, None][len(unit) - 2:]
+        else:
+            raise ValueError(f'Неверное описание юнита: {unit!r}')
+
+        if not isinstance(name, str) or not isinstance(x, int) or not isinstance(y, int):
+            raise ValueError(f'У юнита должны быть имя name и целые координаты x и y: {unit!r}')
+        if team is not None and not isinstance(team, int):
+            raise ValueError(f'Команда team юнита должна быть целым числом: {unit!r}')
+        return name, x, y, team
+
+
+class BattleService:
+    """
+    Класс сервиса боев на asyncio
+
+    Принимает запросы на бой (см. BattleRequest) строками JSON по TCP или Unix-сокету и отвечает строками JSON
+    с тем же id:
+        {"id": ..., "event": "turn", "turn": 3, "units": [[x, y, здоровье], ...]} - после каждого хода, если stream
+        {"id": ..., "event": "result", "winner": индекс или null, "turns": ..., "damage": [...], "elapsed": секунды}
+        {"id": ..., "event": "error" | "timeout" | "cancelled", "error": текст ошибки}
+    Запрос {"cancel": id} отменяет бой этого соединения с таким id.
+
+    Бои headless (BattleManager) играются в workers процессах (по умолчанию - по числу ядер) отрезками
+    по slice_seconds, между отрезками цикл событий принимает запросы, проверяет сроки и отмены, поэтому отмена
+    и срок срабатывают не позже чем через отрезок. Бои - чистый Python, поэтому потоки из-за GIL не дали бы
+    параллельности, а процессы дают.
+
+    Бой создается в наименее загруженном процессе и живет там до конца: у каждого процесса свой однопроцессный
+    пул, а между процессом и сервисом ходят только номер боя, события и итог. Бой, отмененный или
+    не уложившийся в срок, выбрасывается из процесса следующей задачей того же пула.
+
+    Ограничения:
+        - одновременно играется не больше max_concurrent боев (остальные ждут, ожидание входит в срок)
+        - на соединение - не больше max_pending незаконченных запросов: пока их столько, сервис не читает
+          новые строки из сокета, и клиент упирается в буфер сокета (обратное давление)
+        - следующий отрезок боя со stream не начинается, пока события прошлого не ушли клиенту (drain)
+    """
+
+    def __init__(
+            self,
+            host: str = DEFAULT_HOST,
+            port: int = DEFAULT_PORT,
+            unix_path: Optional[str] = None,
+            workers: Optional[int] = None,
+            max_concurrent: int = 64,
+            max_pending: int = 32,
+            default_timeout: float = 30.0,
+            max_turns: int = 1000,
+            slice_seconds: float = 0.01,
+            disable_logging: bool = True
+    ):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 0 or max_concurrent <= 0 or max_pending <= 0:
+            raise ValueError('workers, max_concurrent и max_pending должны быть положительными')
+
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.workers = workers
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.default_timeout = default_timeout
+        self.max_turns = max_turns
+        self.slice_seconds = slice_seconds
+        self.disable_logging = disable_logging
+        self._executors: List[ProcessPoolExecutor] = []
+        self._loads: List[int] = []  # сколько боев живет в каждом процессе
+        self._battle_numbers = itertools.count()
+        self._battle_slots: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    async def start(self) -> asyncio.AbstractServer:
+        """
+        Открывает сокет и начинает принимать соединения
+        :return: сервер asyncio
+        """
+
+        if self.disable_logging:
+            set_logging_enabled(False)
+
+        self._executors = [
+            ProcessPoolExecutor(1, initializer=_init_worker, initargs=(self.disable_logging,))
+            for _ in range(self.workers)
+        ]
+        self._loads = [0] * self.workers
+        # процессы запускаются и грузят каталог юнитов сразу, а не на первых запросах
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(executor, _warm_up) for executor in self._executors])
+
+        self._battle_slots = asyncio.Semaphore(self.max_concurrent)
+        if self.unix_path is not None:
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, self.unix_path, limit=MAX_LINE_LENGTH
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self._handle_connection, self.host, self.port, limit=MAX_LINE_LENGTH
+            )
+        logger.info("Battle service listening on %s", self.get_address())
+        return self._server
+
+
+    def get_address(self) -> str:
+        if self.unix_path is not None:
+            return self.unix_path
+        if self._server is not None and self._server.sockets:
+            host, port = self._server.sockets[0].getsockname()[:2]
+            return f'{host}:{port}'
+        return f'{self.host}:{self.port}'
+
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Читает запросы соединения и запускает бои. Закрытие соединения отменяет все его бои
+        :param reader:
+        :param writer:
+        :return:
+        """
+
+        tasks: Dict[object, asyncio.Task] = {}
+        pending = asyncio.Semaphore(self.max_pending)
+        sequence = 0
+
+        def forget(request_id, task: asyncio.Task):
+            tasks.pop(request_id, None)
+            pending.release()
+            # задача, отмененная до начала, не успевает ответить сама
+            if task.cancelled():
+                self._send(writer, {"id": request_id, "event": "cancelled", "error": 'Бой отменен'})
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    self._send(writer, {"id": None, "event": "error", "error": 'Слишком длинная строка запроса'})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                try:
+                    message = json.loads(line)
+                except ValueError as error:
+                    self._send(writer, {"id": None, "event": "error", "error": f'Неверный JSON: {error}'})
+                    continue
+                if not isinstance(message, dict):
+                    self._send(writer, {"id": None, "event": "error", "error": 'Запрос должен быть JSON-объектом'})
+                    continue
+
+                if 'cancel' in message:
+                    task = tasks.get(message['cancel'])
+                    if task is None:
+                        self._send(
+                            writer, {"id": message['cancel'], "event": "error", "error": 'Нет боя с таким id'}
+                        )
+                    else:
+                        task.cancel()
+                    continue
+
+                request_id = message.get('id')
+                if request_id is None:
+                    sequence += 1
+                    request_id = message['id'] = sequence
+                if request_id in tasks:
+                    self._send(writer, {"id": request_id, "event": "error", "error": 'Бой с таким id уже идет'})
+                    continue
+
+                # обратное давление: пока соединение держит max_pending боев, следующая строка не читается
+                await pending.acquire()
+                task = asyncio.create_task(self._serve_request(message, writer))
+                tasks[request_id] = task
+                task.add_done_callback(lambda done, request_id=request_id: forget(request_id, done))
+        except ConnectionError:
+            pass
+        finally:
+            for task in list(tasks.values()):
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+
+    async def _serve_request(self, message: dict, writer: asyncio.StreamWriter):
+        """
+        Проводит один бой по запросу и отправляет клиенту его итог (или ошибку, истечение срока, отмену)
+        :param message:
+        :param writer:
+        :return:
+        """
+
+        request_id = message.get('id')
+        try:
+            request = BattleRequest.from_message(message, self.default_timeout, self.max_turns)
+        except ValueError as error:
+            self._send(writer, {"id": request_id, "event": "error", "error": str(error)})
+            return
+
+        started = perf_counter()
+        try:
+            result = await asyncio.wait_for(self._play(request, writer), request.timeout)
+        except asyncio.TimeoutError:
+            response = {"id": request_id, "event": "timeout", "error": f'Бой не закончился за {request.timeout} с'}
+        except asyncio.CancelledError:
+            response = {"id": request_id, "event": "cancelled", "error": 'Бой отменен'}
+        except ValueError as error:
+            response = {"id": request_id, "event": "error", "error": str(error)}
+        except Exception as error:
+            logger.error("Battle %s failed: %r", request_id, error)
+            response = {"id": request_id, "event": "error", "error": 'Внутренняя ошибка сервиса'}
+        else:
+            response = {"id": request_id, "event": "result", **result, "elapsed": perf_counter() - started}
+
+        if not writer.is_closing():
+            self._send(writer, response)
+            with suppress(ConnectionError):
+                await writer.drain()
+
+
+    async def _play(self, request: BattleRequest, writer: asyncio.StreamWriter) -> dict:
+        """
+        Играет бой в наименее загруженном процессе отрезками и отправляет события ходов, если они запрошены
+        :param request:
+        :param writer:
+        :return: итог боя (см. BattleManager.get_battle_result)
+        """
+
+        loop = asyncio.get_running_loop()
+        async with self._battle_slots:
+            worker = min(range(len(self._loads)), key=self._loads.__getitem__)
+            executor = self._executors[worker]
+            battle_number = next(self._battle_numbers)
+            self._loads[worker] += 1
+            result = None
+            try:
+                # бой создается вместе с первым отрезком: короткие бои обходятся одним обращением к процессу
+                play, args = _create_battle, (battle_number, request, self.slice_seconds)
+                while result is None:
+                    events, result = await loop.run_in_executor(executor, play, *args)
+                    play, args = _play_slice, (battle_number, self.slice_seconds, request.stream)
+                    if events:
+                        for event in events:
+                            self._send(writer, {"id": request.id, **event})
+                        await writer.drain()
+                return result
+            finally:
+                self._loads[worker] -= 1
+                # незаконченный бой (отмена, срок, ошибка) выбрасывается после уже отданного процессу отрезка
+                if result is None and self._executors:
+                    executor.submit(_drop_battle, battle_number)
+
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter, message: dict):
+        if not writer.is_closing():
+            writer.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+
+
+# Бои, которые живут в процессе пула, по номерам
+_battles: Dict[int, 'BattleManager'] = {}
+
+
+def _init_worker(disable_logging: bool):
+    """
+    Инициализирует процесс пула сервиса: при необходимости глушит логи
+    :param disable_logging:
+    :return:
+    """
+
+    if disable_logging:
+        set_logging_enabled(False)
+
+
+def _warm_up():
+    from game.units.unit_factory import UnitFactory
+
+    UnitFactory.preload_data()
+
+
+def _create_battle(
+        battle_number: int,
+        request: BattleRequest,
+        slice_seconds: float
+) -> Tuple[List[dict], Optional[dict]]:
+    """
+    Создает и начинает headless-бой по запросу, оставляет его в процессе пула под номером battle_number
+    и сразу играет первый отрезок (см. _play_slice)
+
+    ValueError: если юнит не зарегистрирован или позиции юнитов за полем или совпадают
+    :param battle_number:
+    :param request:
+    :param slice_seconds:
+    :return:
+    """
+
+    from game.units.unit_factory import UnitFactory
+    from game.field.position import Position
+    from game.field.battlefield import BattleField
+    from game.manager.battle_manager import BattleManager
+    from utils.random_stream import RandomStream
+
+    units = []
+    for unit_name, x, y, team in request.units:
+        unit = UnitFactory.create(unit_name, Position(x, y))
+        unit.team = team
+        units.append(unit)
+
+    battle = BattleManager(
+        BattleField(request.width, request.height), headless=True, max_turns=request.max_turns,
+        rng=RandomStream(request.seed)
+    )
+    battle.start(*units)
+    _battles[battle_number] = battle
+    return _play_slice(battle_number, slice_seconds, request.stream)
+
+
+def _drop_battle(battle_number: int):
+    _battles.pop(battle_number, None)
+
+
+def _play_slice(battle_number: int, slice_seconds: float, stream: bool) -> Tuple[List[dict], Optional[dict]]:
+    """
+    Играет ходы боя процесса пула, пока не кончится отрезок времени или бой. Законченный бой выбрасывается
+    :param battle_number:
+    :param slice_seconds:
+    :param stream: собирать ли события ходов
+    :return: (события сыгранных ходов, итог боя или None, если бой не закончен)
+    """
+
+    battle = _battles[battle_number]
+    deadline = perf_counter() + slice_seconds
+    events = []
+    while True:
+        battle.step()
+        if stream:
+            events.append({
+                "event": "turn",
+                "turn": battle.current_turn,
+                "units": [
+                    [unit.position.x, unit.position.y, unit.health if unit.alive else 0]
+                    for unit in battle.units_in_game
+                ],
+            })
+        if battle.game_over:
+            battle.finish()
+            del _battles[battle_number]
+            return events, battle.get_battle_result()
+        if perf_counter() >= deadline:
+            return events, None
@@ -1,2 +1,5 @@
 from game.units.specific_units import *
-from .base_units import *
\ No newline at end of file
+from .base_units import *
+from .damage_table import DamageTable, DamageEntry
+from .unit_catalog import UnitCatalog, UnitStats
+from .unit_pool import UnitPool, PooledUnit, PooledShooter
\ No newline at end of file
@@ -1,8 +1,8 @@
-from random import randint
-from numpy import sign
 from abc import ABC
-from typing import Dict, TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Optional
 from game.field.position import Position
+from game.units.damage_table import DamageTable
+from utils.random_stream import RandomStream
 from core.logging.logger import Logger
 
 
@@ -11,36 +11,40 @@ logger = Logger(__name__)
 
 if TYPE_CHECKING:
     from game.field.battlefield import BattleField
+    from game.units.unit_catalog import UnitStats
+
+
+# Поток случайных чисел для атак вне боя (когда BattleManager не подал свой)
+_default_rng = RandomStream()
 
 
 class Unit(ABC):
     """
     Базовый класс всех юнитов.
 
-    Загружает все данные из json, реализует основные возможности юнитов:
+    Берет характеристики из записи каталога (UnitStats), реализует основные возможности юнитов:
         - атаковать
         - умирать
 
     * передвижение юнитов реализовано в классе ButtleField
     """
 
-    def __init__(self, unit_data: dict, position: Position):
-        self.name = unit_data["name"]
-        self.type = unit_data["type"]
-        self.health = unit_data["health"]
-        self.max_health = unit_data["health"]  # для полоски здоровья
-        self.attack_value = unit_data["attack"]
-        self.defense = unit_data["defense"]
-        self.damage_min = unit_data["damage_min"]
-        self.damage_max = unit_data["damage_max"]
-        self.speed = unit_data["speed"]
-        self.icon = unit_data["icon"]
+    def __init__(self, stats: 'UnitStats', position: Position):
+        self.stats = stats
+        self.name = stats.name
+        self.type = stats.type
+        self.health = stats.health
+        self.max_health = stats.health  # для полоски здоровья
+        self.attack_value = stats.attack
+        self.defense = stats.defense
+        self.damage_min = stats.damage_min
+        self.damage_max = stats.damage_max
+        self.speed = stats.speed
+        self.icon = stats.icon
         self.position = position
         self.alive = True
-
-        # TODO тут проблема, непонятно, пихать его сюда или иначе сделать
-        self.range = unit_data.get("range", 1)
-        logger.info(f"{self.__class__.__name__} class unit initiated")
+        self.team: Optional[int] = None  # команда юнита, None - каждый сам за себя
+        self.range = stats.range
 
 
     def die(self, battlefield: 'BattleField'):
@@ -49,33 +53,58 @@ class Unit(ABC):
             - На всякий случай проверяет здоровье юнита и приравнивает его к нулю
             - Делает влаг жизни юниита равным False (теперь юнит мертв)
             - Удаляет юнита с поля
+            - Сообщает о смерти планировщику ходов боя (он ведет счетчики живых юнитов сторон)
 
         :param battlefield:
         :return:
         """
 
+        was_alive = self.alive
         self.alive = False
         if self.health != 0:
             self.health = 0
         battlefield.remove_unit(self)
-        logger.info(f"Unit {self.name} dead")
+        if was_alive and battlefield.scheduler is not None:
+            battlefield.scheduler.on_unit_died(self)
+        logger.info("Unit %s dead", self.name)
+
+
+    def is_enemy_of(self, other: 'Unit') -> bool:
+        """
+        Проверяет, враг ли другой юнит: любой другой юнит, если команды нет, иначе юнит другой команды
+        :param other:
+        :return:
+        """
 
+        return other is not self and (self.team is None or other.team != self.team)
 
-    def _calculate_damage_to_target(self, target: 'Unit'):
+
+    def _calculate_damage_to_target(self, target: 'Unit', melee: bool = False, rng: Optional[RandomStream] = None):
         """
         Рассчитывает урон, который юнит нанесет врагу с учетом их характеристик
+
+        Урон для каждого значения базового урона заранее посчитан в DamageTable, здесь остается только бросок
+        :param target:
+        :param melee: атака стрелка в ближнем бою (со штрафом)
+        :param rng: поток случайных чисел боя
+        :return:
+        """
+
+        entry = DamageTable.get_entry(self, target, melee)
+        return entry.damage_for((rng or _default_rng).randint(self.damage_min, self.damage_max))
+
+
+    def get_damage_multiplier(self, target: 'Unit') -> float:
+        """
+        Рассчитывает множитель урона по врагу из разницы атаки юнита и защиты врага
         :param target:
         :return:
         """
 
-        base_damage = randint(self.damage_min, self.damage_max)
         attack_defense_difference = self.attack_value - target.defense
-        damage = base_damage * (
-                (1 + 0.05 * sign(attack_defense_difference))
-                ** min(abs(attack_defense_difference), 20)
-        )
+        sign = (attack_defense_difference > 0) - (attack_defense_difference < 0)
         # TODO возможно стоит вынести эту формулу в какой-то конфиг или типа того
-        return max(int(1), int(damage))
+        return (1 + 0.05 * sign) ** min(abs(attack_defense_difference), 20)
 
 
     def can_attack(self, target: 'Unit', battlefield: 'BattleField', new_position: 'Position'=None):
@@ -96,7 +125,7 @@ class Unit(ABC):
         return distance <= self.range
 
 
-    def attack(self, target: 'Unit', battlefield: 'BattleField'):
+    def attack(self, target: 'Unit', battlefield: 'BattleField', rng: Optional[RandomStream] = None):
         """
         Реализует атаку на врага.
             - проверяет возможность атаки на врага
@@ -104,15 +133,16 @@ class Unit(ABC):
             - убивает врага при помощи .die(), если урона достаточно для убийства
         :param target:
         :param battlefield:
+        :param rng: поток случайных чисел боя (BattleManager.rng)
         :return:
         """
 
         if not self.can_attack(target, battlefield):
             return 0
 
-        damage = self._calculate_damage_to_target(target)
+        damage = self._calculate_damage_to_target(target, rng=rng)
         target.health -= damage
-        logger.info(f"Unit {self.__class__.__name__} attack unit {target.__class__.__name__} with damage: {damage}")
+        logger.info("Unit %s attack unit %s with damage: %d", self.__class__.__name__, target.__class__.__name__, damage)
 
         if target.health <= 0:
             target.die(battlefield)
@@ -123,16 +153,22 @@ class Unit(ABC):
     def find_attack_position(self, target: 'Unit', battlefield: 'BattleField') -> Optional[Position]:
         """
         Находит ближайшую позицию, с которой можно атаковать врага
+
+        Перебирает кольца клеток вокруг врага по возрастанию радиуса. Кольца, до которых юнит не дойдет
+        за ход (радиус дальше расстояния до врага +- скорость), не перебираются
         :param target:
         :param battlefield:
         :return:
         """
 
         enemy_pos = target.position
+        distance_to_enemy = battlefield.get_distance(self.position, enemy_pos)
+
+        first_ring = max(1, distance_to_enemy - self.speed)
+        last_ring = min(self.range, distance_to_enemy + self.speed)
 
-        for distance in range(1, self.range + 1):
-            for direction in [-1, 1]:
-                test_position = Position(enemy_pos.x + distance * direction)
+        for distance in range(first_ring, last_ring + 1):
+            for test_position in enemy_pos.ring(distance):
                 if (battlefield.is_position_available(test_position) and
                         self.can_attack(target, battlefield, test_position) and
                         battlefield.get_distance(test_position, self.position) <= self.speed):
@@ -160,8 +196,8 @@ class Infantry(Unit):
     В этом заключается отличие между пехотой и летунами, для чего и нужны отдельные классы
     """
 
-    def __init__(self, unit_data: Dict, position: Position):
-        super().__init__(unit_data, position)
+    def __init__(self, stats: 'UnitStats', position: Position):
+        super().__init__(stats, position)
 
 
 class Shooter(Unit):
@@ -171,11 +207,10 @@ class Shooter(Unit):
     В случае, если закончился боезапас, действуют, как пехотинцы, но со штрафом к урону
     """
 
-    def __init__(self, unit_data: Dict, position: Position):
-        super().__init__(unit_data, position)
-        self.ammo = unit_data.get("ammo", 10)
-        self.range = unit_data.get("range", 5)
-        self.melee_penalty = unit_data.get("melee_penalty", 0.6)
+    def __init__(self, stats: 'UnitStats', position: Position):
+        super().__init__(stats, position)
+        self.ammo = stats.ammo
+        self.melee_penalty = stats.melee_penalty
 
 
     def can_attack(self, target: 'Unit', battlefield: 'BattleField', new_position: 'Position'=None):
@@ -206,7 +241,7 @@ class Shooter(Unit):
         return False
 
 
-    def attack(self, target: 'Unit', battlefield: 'BattleField'):
+    def attack(self, target: 'Unit', battlefield: 'BattleField', rng: Optional[RandomStream] = None):
         """
         Более сложная функция атаки, чем в базовом классе.
             - Если может стрелять, то стреляет и наносит полный урон
@@ -216,6 +251,7 @@ class Shooter(Unit):
 
         :param target:
         :param battlefield:
+        :param rng: поток случайных чисел боя (BattleManager.rng)
         :return:
         """
 
@@ -225,19 +261,16 @@ class Shooter(Unit):
         distance = battlefield.get_distance(self.position, target.position)
         is_melee = distance <= 1 or self.ammo <= 0
 
-        original_damage = self._calculate_damage_to_target(target)
+        # штраф ближнего боя уже учтен в таблице урона
+        real_damage = self._calculate_damage_to_target(target, melee=is_melee, rng=rng)
 
-        if is_melee:
-            real_damage = int(original_damage * self.melee_penalty)
-        else:
-            real_damage = original_damage
+        if not is_melee:
             self.ammo -= 1
 
-        real_damage = max(1, real_damage)
         target.health -= real_damage
         # TODO вот здесь ниже происходит самоповтор. хз, можно ли этого избежать каким-то образом
         logger.info(
-            f"Unit {self.__class__.__name__} attack unit {target.__class__.__name__} with damage: {real_damage}"
+            "Unit %s attack unit %s with damage: %d", self.__class__.__name__, target.__class__.__name__, real_damage
         )
         if target.health <= 0:
             target.die(battlefield)
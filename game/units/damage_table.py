@@ -0,0 +1,145 @@
+from typing import Dict, Tuple, Type, TYPE_CHECKING
+from core.logging.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+if TYPE_CHECKING:
+    from game.units.base_units import Unit
+
+
+class DamageEntry:
+    """
+    Класс записи таблицы урона для одной пары (тип атакующего, тип защищающегося)
+
+    Хранит урон для каждого значения базового урона атакующего (от damage_min до damage_max),
+    а также точное распределение урона, его матожидание и дисперсию
+    """
+
+    __slots__ = ('multiplier', 'damage_min', 'values', 'distribution', 'expected', 'variance')
+
+    def __init__(self, multiplier: float, damage_min: int, values: Tuple[int, ...]):
+        self.multiplier = multiplier
+        self.damage_min = damage_min
+        self.values = values
+
+        # Базовый урон распределен равномерно, поэтому вероятность каждого значения кратна 1 / len(values)
+        probability = 1 / len(values)
+        self.distribution: Dict[int, float] = {}
+        for value in values:
+            self.distribution[value] = self.distribution.get(value, 0) + probability
+
+        self.expected = sum(values) / len(values)
+        self.variance = sum((value - self.expected) ** 2 for value in values) / len(values)
+
+
+    def damage_for(self, base_damage: int) -> int:
+        """
+        Возвращает итоговый урон по выпавшему базовому урону атакующего
+        :param base_damage:
+        :return:
+        """
+
+        return self.values[base_damage - self.damage_min]
+
+
+class DamageTable:
+    """
+    Класс таблиц урона
+
+    Для каждой пары типов юнитов заранее считает множитель урона и итоговый урон для каждого значения базового урона,
+    отдельно для обычной атаки и для атаки в ближнем бою со штрафом стрелка (Shooter.melee_penalty).
+    Атака превращается в одно случайное число и поиск по таблице.
+
+    Таблица заполняется целиком через build() или лениво при первой атаке новой пары типов
+    """
+
+    # Записи по ключу (класс атакующего, класс защищающегося, атака в ближнем бою со штрафом)
+    _entries: Dict[Tuple[Type['Unit'], Type['Unit'], bool], DamageEntry] = {}
+
+
+    @classmethod
+    def build(cls):
+        """
+        Заполняет таблицу для всех пар юнитов, зарегистрированных в UnitFactory
+        :return:
+        """
+
+        from game.units.unit_factory import UnitFactory
+        from game.field.position import Position
+
+        prototypes = [UnitFactory.create(unit_name, Position(0)) for unit_name in UnitFactory.get_registered_units()]
+        for attacker in prototypes:
+            for defender in prototypes:
+                cls.get_entry(attacker, defender, False)
+                if hasattr(attacker, 'melee_penalty'):
+                    cls.get_entry(attacker, defender, True)
+
+        logger.info("Damage table built for %d unit types", len(prototypes))
+
+
+    @classmethod
+    def get(cls, attacker_name: str, defender_name: str, melee: bool = False) -> DamageEntry:
+        """
+        Возвращает запись таблицы по ключам юнитов в JSON (для аналитики)
+        :param attacker_name:
+        :param defender_name:
+        :param melee:
+        :return:
+        """
+
+        from game.units.unit_factory import UnitFactory
+        from game.field.position import Position
+
+        attacker = UnitFactory.create(attacker_name, Position(0))
+        defender = UnitFactory.create(defender_name, Position(0))
+        return cls.get_entry(attacker, defender, melee)
+
+
+    @classmethod
+    def get_entry(cls, attacker: 'Unit', defender: 'Unit', melee: bool = False) -> DamageEntry:
+        """
+        Возвращает запись таблицы для пары юнитов, при необходимости рассчитывая ее
+        :param attacker:
+        :param defender:
+        :param melee: атака в ближнем бою со штрафом стрелка
+        :return:
+        """
+
+        key = (attacker.__class__, defender.__class__, melee)
+        entry = cls._entries.get(key)
+        if entry is None:
+            entry = cls._compute_entry(attacker, defender, melee)
+            cls._entries[key] = entry
+        return entry
+
+
+    @classmethod
+    def clear(cls):
+        """
+        Очищает таблицу (нужно, если поменялись характеристики юнитов)
+        :return:
+        """
+
+        cls._entries.clear()
+
+
+    @staticmethod
+    def _compute_entry(attacker: 'Unit', defender: 'Unit', melee: bool) -> DamageEntry:
+        """
+        Рассчитывает запись таблицы по формуле из Unit.get_damage_multiplier и штрафу Shooter.melee_penalty
+        :param attacker:
+        :param defender:
+        :param melee:
+        :return:
+        """
+
+        multiplier = attacker.get_damage_multiplier(defender)
+        values = []
+        for base_damage in range(attacker.damage_min, attacker.damage_max + 1):
+            damage = max(1, int(base_damage * multiplier))
+            if melee:
+                damage = max(1, int(damage * attacker.melee_penalty))
+            values.append(damage)
+        return DamageEntry(multiplier, attacker.damage_min, tuple(values))
@@ -1,8 +1,12 @@
-from typing import Dict
+from typing import TYPE_CHECKING
 from game.units.unit_factory import UnitFactory
 from game.units.base_units import Shooter
 from game.field.position import Position
 
+if TYPE_CHECKING:
+    from game.units.unit_catalog import UnitStats
+
+
 @UnitFactory.register
 class Archer(Shooter):
     """
@@ -12,5 +16,5 @@ class Archer(Shooter):
     Класс существует для создания более удобной и масштабируемой архитектуры
     """
 
-    def __init__(self, unit_data: Dict, position: Position):
-        super().__init__(unit_data, position)
+    def __init__(self, stats: 'UnitStats', position: Position):
+        super().__init__(stats, position)
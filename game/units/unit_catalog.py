@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import pickle
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+from marshmallow import Schema, ValidationError, fields, post_load, validate, validates_schema
+from utils.data_functions import CACHE_DIR, GAME_DATA_DIR, write_file_atomically
+from core.logging.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+# Версия формата скомпилированного каталога. Нужно увеличить при любом изменении схемы или UnitStats,
+# чтобы старые файлы кэша перестали приниматься
+CATALOG_FORMAT_VERSION = 2
+
+UNITS_FILE = GAME_DATA_DIR / 'units.json'
+CATALOG_CACHE_FILE = CACHE_DIR / 'unit_catalog.pickle'
+
+# Значения по умолчанию для необязательных характеристик по виду юнита
+_TYPE_DEFAULTS = {
+    'infantry': {'range': 1, 'ammo': 0, 'melee_penalty': 1.0},
+    'shooter': {'range': 5, 'ammo': 10, 'melee_penalty': 0.6},
+}
+
+
+@dataclass(frozen=True, slots=True)
+class UnitStats:
+    """
+    Неизменяемая запись характеристик одного типа юнита из units.json
+    """
+
+    key: str
+    name: str
+    type: str
+    health: int
+    attack: int
+    defense: int
+    damage_min: int
+    damage_max: int
+    speed: int
+    icon: str
+    range: int
+    ammo: int
+    melee_penalty: float
+    cost: int
+
+
+class UnitStatsSchema(Schema):
+    """
+    Схема marshmallow для одной записи units.json. Неизвестные поля считаются ошибкой
+    """
+
+    name = fields.String(required=True, validate=validate.Length(min=1))
+    type = fields.String(required=True, validate=validate.OneOf(list(_TYPE_DEFAULTS)))
+    health = fields.Integer(required=True, strict=True, validate=validate.Range(min=1))
+    attack = fields.Integer(required=True, strict=True, validate=validate.Range(min=0))
+    defense = fields.Integer(required=True, strict=True, validate=validate.Range(min=0))
+    damage_min = fields.Integer(required=True, strict=True, validate=validate.Range(min=0))
+    damage_max = fields.Integer(required=True, strict=True, validate=validate.Range(min=0))
+    speed = fields.Integer(required=True, strict=True, validate=validate.Range(min=0))
+    icon = fields.String(required=True)
+    cost = fields.Integer(required=True, strict=True, validate=validate.Range(min=1))  # цена юнита в очках армии
+    range = fields.Integer(strict=True, validate=validate.Range(min=1))
+    ammo = fields.Integer(strict=True, validate=validate.Range(min=0))
+    melee_penalty = fields.Float(validate=validate.Range(min=0, max=1))
+
+
+    @validates_schema
+    def validate_damage(self, data, **kwargs):
+        if data.get('damage_min', 0) > data.get('damage_max', 0):
+            raise ValidationError('damage_min не может быть больше damage_max', 'damage_min')
+
+
+    @post_load
+    def apply_type_defaults(self, data, **kwargs):
+        return {**_TYPE_DEFAULTS[data['type']], **data}
+
+
+class UnitCatalog:
+    """
+    Класс скомпилированного каталога юнитов
+
+    units.json читается и проверяется схемой (UnitStatsSchema) один раз, каждая запись превращается
+    в неизменяемую UnitStats. Скомпилированный каталог сохраняется на диск (CATALOG_CACHE_FILE)
+    и при следующих запусках берется оттуда, если исходный файл не менялся: сначала сравниваются mtime и размер,
+    и только если они разошлись - хэш содержимого.
+
+    Каталог процесса (get_default) создается лениво один раз, процессы пула получают его при fork
+    или быстро поднимают из кэша на диске
+    """
+
+    _default: Optional['UnitCatalog'] = None
+
+    def __init__(self, stats: Dict[str, UnitStats], source_hash: str):
+        self._stats = stats
+        self.hash = source_hash
+
+
+    def __getitem__(self, unit_name: str) -> UnitStats:
+        return self._stats[unit_name]
+
+
+    def __contains__(self, unit_name: str) -> bool:
+        return unit_name in self._stats
+
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._stats)
+
+
+    def __len__(self) -> int:
+        return len(self._stats)
+
+
+    def get(self, unit_name: str) -> Optional[UnitStats]:
+        return self._stats.get(unit_name)
+
+
+    @classmethod
+    def get_default(cls) -> 'UnitCatalog':
+        """
+        Возвращает каталог процесса, при первом обращении загружая его
+        :return:
+        """
+
+        if cls._default is None:
+            cls._default = cls.load()
+        return cls._default
+
+
+    @classmethod
+    def reset_default(cls):
+        """
+        Забывает каталог процесса (следующий get_default перечитает units.json или кэш)
+        :return:
+        """
+
+        cls._default = None
+
+
+    @classmethod
+    def load(
+            cls,
+            path: Union[str, Path] = UNITS_FILE,
+            cache_path: Optional[Union[str, Path]] = CATALOG_CACHE_FILE
+    ) -> 'UnitCatalog':
+        """
+        Загружает каталог из кэша на диске или компилирует его из JSON (и обновляет кэш)
+        :param path: путь к units.json
+        :param cache_path: путь к файлу кэша, None - не использовать кэш
+        :return:
+        """
+
+        path = Path(path)
+        source_stat = os.stat(path)
+
+        cached = cls._read_cache(cache_path) if cache_path is not None else None
+        if cached is not None and cached['source'] == str(path.resolve()):
+            if cached['mtime_ns'] == source_stat.st_mtime_ns and cached['size'] == source_stat.st_size:
+                logger.info("Unit catalog loaded from cache (%d units)", len(cached['stats']))
+                return cls(cached['stats'], cached['hash'])
+
+        source = path.read_bytes()
+        source_hash = hashlib.sha256(source).hexdigest()
+
+        if cached is not None and cached['source'] == str(path.resolve()) and cached['hash'] == source_hash:
+            stats = cached['stats']
+            logger.info("Unit catalog loaded from cache after content check (%d units)", len(stats))
+        else:
+            stats = cls.compile(json.loads(source.decode('utf-8')), str(path))
+            logger.info("Unit catalog compiled from %s (%d units)", path, len(stats))
+
+        if cache_path is not None:
+            cls._write_cache(cache_path, {
+                'version': CATALOG_FORMAT_VERSION,
+                'source': str(path.resolve()),
+                'mtime_ns': source_stat.st_mtime_ns,
+                'size': source_stat.st_size,
+                'hash': source_hash,
+                'stats': stats,
+            })
+
+        return cls(stats, source_hash)
+
+
+    @staticmethod
+    def compile(raw_units: dict, source: str = 'units.json') -> Dict[str, UnitStats]:
+        """
+        Проверяет сырые данные units.json и превращает их в записи UnitStats
+
+        ValueError: если данные не проходят проверку, в сообщении перечислены все ошибки по ключам юнитов
+        :param raw_units:
+        :param source: откуда взяты данные (для сообщения об ошибке)
+        :return:
+        """
+
+        schema = UnitStatsSchema()
+        stats = {}
+        errors = {}
+        for unit_name, unit_data in raw_units.items():
+            try:
+                stats[unit_name] = UnitStats(key=unit_name, **schema.load(unit_data))
+            except ValidationError as error:
+                errors[unit_name] = error.messages
+
+        if errors:
+            logger.error("Unit data in %s failed validation: %s", source, errors)
+            raise ValueError(f'Некорректные данные юнитов в {source}: {errors}')
+
+        return stats
+
+
+    @staticmethod
+    def _read_cache(cache_path: Union[str, Path]) -> Optional[dict]:
+        try:
+            with open(cache_path, 'rb') as file:
+                cached = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+            return None
+        if not isinstance(cached, dict) or cached.get('version') != CATALOG_FORMAT_VERSION:
+            return None
+        return cached
+
+
+    @staticmethod
+    def _write_cache(cache_path: Union[str, Path], content: dict):
+        """
+        Пишет кэш атомарно (через временный файл), ошибки записи не мешают работе
+        :param cache_path:
+        :param content:
+        :return:
+        """
+
+        try:
+            write_file_atomically(cache_path, pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError as error:
+            logger.warning("Unit catalog cache was not written: %s", error)
@@ -1,15 +1,22 @@
-from typing import Dict, Type
+from typing import Dict, List, Optional, Tuple, Type, Union, TYPE_CHECKING
 from re import sub
 
 from game.field.position import Position
+from game.field.formations import Formation, get_formation
 from game.units.base_units import Unit
-from utils.data_functions import load_unit_data
+from game.units.unit_catalog import UnitCatalog, UnitStats
 from core.logging.logger import Logger
 
 
 logger = Logger(__name__)
 
 
+if TYPE_CHECKING:
+    from game.field.battlefield import BattleField
+    from game.units.unit_pool import UnitPool
+    from core.instrumentation import Instrumentation
+
+
 class UnitFactory:
     """
     Класс для создания юнитов
@@ -26,23 +33,30 @@ class UnitFactory:
     # Словарь, в котором хранятся все существующие классы по ключам из JSON
     _unit_list: Dict[str, Type[Unit]] = {}
 
-    # Данные обо всех юнитах загружаются один раз при инициализации
-    _unit_data_cache: Dict[str, dict] = {}
+    # Характеристики всех юнитов берутся из скомпилированного каталога один раз при первом создании юнита
+    _unit_data_cache: Dict[str, UnitStats] = {}
     _data_loaded = False
 
+    # Если подан объект инструментирования, фабрика считает в нем созданных юнитов (счетчик units_created)
+    instrumentation: Optional['Instrumentation'] = None
+
 
     @classmethod
-    def preload_data(cls):
+    def preload_data(cls, catalog: UnitCatalog = None):
         """
-        Подгружает все данные юнитов и хранит их внутри класса, чтобы не вызывать load по 1000 раз
+        Берет характеристики всех зарегистрированных юнитов из каталога (по умолчанию - каталог процесса,
+        units.json разбирается не больше одного раза)
+        :param catalog:
         :return:
         """
 
-        if not cls._data_loaded:
-            for unit_name in cls._unit_list:
-                cls._unit_data_cache[unit_name] = load_unit_data(unit_name)
-            cls._data_loaded = True
-        logger.info(f"Units data preloaded")
+        if catalog is None:
+            catalog = UnitCatalog.get_default()
+        cls._unit_data_cache = {
+            unit_name: catalog[unit_name] for unit_name in cls._unit_list if unit_name in catalog
+        }
+        cls._data_loaded = True
+        logger.info("Units data preloaded")
 
 
     @classmethod
@@ -57,7 +71,7 @@ class UnitFactory:
 
         cls._unit_list[unit_name] = unit_class
 
-        logger.info(f"Unit class {unit_class.__name__} registered in UnitFactory")
+        logger.info("Unit class %s registered in UnitFactory", unit_class.__name__)
 
         return unit_class
 
@@ -69,7 +83,7 @@ class UnitFactory:
 
         Создает нового юнита по имени СТРОГО такому же, как ключ в JSON. TODO надо как-то автоматизировать
 
-        1. Загружает данные из JSON TODO поправить, не прикольно при создании каждого нового юнита загружать все данные
+        1. Берет характеристики юнита из каталога (см. preload_data)
         2. Находит в реестре зарегистрированных юнитов соответствующий класс
         3. Кастует новый экземпляр класса
 
@@ -80,14 +94,88 @@ class UnitFactory:
         :return: unit_class
         """
 
+        unit_class, stats = cls.resolve(unit_name)
+
+        created_unit = unit_class(stats=stats, position=position)
+        if cls.instrumentation is not None:
+            cls.instrumentation.count('units_created')
+
+        logger.info("%s class unit has been created", unit_class.__name__)
+
+        return created_unit
+
+
+    @classmethod
+    def create_many(
+            cls,
+            unit_name: str,
+            count: int,
+            formation: Union[str, Formation] = 'line',
+            battlefield: Optional['BattleField'] = None,
+            origin: Position = Position(0),
+            team: Optional[int] = None,
+            pool: Optional['UnitPool'] = None
+    ) -> List[Unit]:
+        """
+        Создает сразу count юнитов одного типа в построении и, если подано поле, расставляет их за один проход.
+
+        Построение - имя ('line', 'column', 'wedge', 'random', от точки origin) или объект Formation.
+        Класс и характеристики юнита находятся один раз, юниты создаются без лога на каждого, в лог пишется одна строка.
+        Если подан pool, юниты создаются в нем (см. UnitPool)
+
+        ValueError: если юнит не зарегистрирован или позиции построения выходят за поле или заняты
+        (поле при этом не меняется)
+        :param unit_name:
+        :param count:
+        :param formation:
+        :param battlefield:
+        :param origin:
+        :param team:
+        :param pool:
+        :return: созданные юниты
+        """
+
+        positions = get_formation(formation, origin).positions(count, battlefield)
+
+        if pool is not None:
+            units = [pool.create(unit_name, position, team) for position in positions]
+        else:
+            unit_class, stats = cls.resolve(unit_name)
+            units = [unit_class(stats=stats, position=position) for position in positions]
+            if team is not None:
+                for unit in units:
+                    unit.team = team
+
+        if battlefield is not None:
+            battlefield.add_units(units)
+
+        if cls.instrumentation is not None:
+            cls.instrumentation.count('units_created', len(units))
+
+        logger.info(
+            "%d units %s created in %s formation", count, unit_name,
+            formation if isinstance(formation, str) else formation.__class__.__name__
+        )
+
+        return units
+
+
+    @classmethod
+    def resolve(cls, unit_name: str) -> Tuple[Type[Unit], UnitStats]:
+        """
+        Находит класс юнита и его характеристики по ключу в JSON (нужно и для создания юнитов в UnitPool)
+
+        ValueError: если юнит не зарегистрирован или отсутствует в каталоге
+        :param unit_name:
+        :return: (класс юнита, характеристики)
+        """
+
         if not cls._data_loaded:
             cls.preload_data()
 
-        unit_data = cls._unit_data_cache[unit_name]
-
         if unit_name not in cls._unit_list:
             available_units = list(cls._unit_list)
-            logger.warning(f"Unsuccessful attempt to register a unit")
+            logger.warning("Unsuccessful attempt to register a unit")
             raise ValueError(
                 f'Юнит {unit_name} не зарегистрирован в фабрике.\n'
                 f'Убедитесь, что юнит зарегистрирован при помощи декоратора @UnitFactory.register\n'
@@ -96,11 +184,16 @@ class UnitFactory:
             )
         unit_class: Type['Unit'] = cls._unit_list[unit_name]
 
-        created_unit = unit_class(unit_data=unit_data, position=position)
-
-        logger.info(f"{unit_class.__name__} class unit has been created")
+        stats = cls._unit_data_cache.get(unit_name)
+        if stats is None:
+            # класс мог быть зарегистрирован уже после загрузки данных
+            cls.preload_data()
+            stats = cls._unit_data_cache.get(unit_name)
+        if stats is None:
+            logger.warning("Unit %s has no data in the unit catalog", unit_name)
+            raise ValueError(f'Юнит {unit_name} зарегистрирован в фабрике, но отсутствует в units.json')
 
-        return created_unit
+        return unit_class, stats
 
 
     @classmethod
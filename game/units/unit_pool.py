@@ -0,0 +1,216 @@
+from array import array
+from types import FunctionType
+from typing import Dict, Iterator, List, Optional, Tuple, Type, TYPE_CHECKING
+from game.field.position import Position
+from game.units.base_units import Unit, Shooter
+from core.logging.logger import Logger
+
+
+logger = Logger(__name__)
+
+
+if TYPE_CHECKING:
+    from game.units.unit_catalog import UnitStats
+
+
+_NO_TEAM = -1
+
+
+class PooledUnit:
+    """
+    Базовый класс легкого описателя юнита из UnitPool
+
+    Сам описатель хранит только пул и номер юнита, а все состояние лежит в массивах пула.
+    Характеристики типа (имя, атака, скорость и т.д.) - атрибуты класса описателя, одного на тип юнита.
+    Поведение (атака, смерть, поиск позиции) берется у настоящего класса юнита, см. _get_handle_class
+    """
+
+    __slots__ = ('pool', 'id')
+
+    stats: 'UnitStats'
+
+    def __init__(self, pool: 'UnitPool', unit_id: int):
+        self.pool = pool
+        self.id = unit_id
+
+
+    @property
+    def health(self) -> int:
+        return self.pool.health[self.id]
+
+
+    @health.setter
+    def health(self, value: int):
+        self.pool.health[self.id] = value
+
+
+    @property
+    def alive(self) -> bool:
+        return bool(self.pool.alive[self.id])
+
+
+    @alive.setter
+    def alive(self, value: bool):
+        self.pool.alive[self.id] = 1 if value else 0
+
+
+    @property
+    def team(self) -> Optional[int]:
+        team = self.pool.team[self.id]
+        return None if team == _NO_TEAM else team
+
+
+    @team.setter
+    def team(self, value: Optional[int]):
+        self.pool.team[self.id] = _NO_TEAM if value is None else value
+
+
+    @property
+    def position(self) -> Position:
+        return self.pool.positions[self.id]
+
+
+    @position.setter
+    def position(self, value: Position):
+        self.pool.positions[self.id] = value
+
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(id={self.id}, position={self.position}, health={self.health})"
+
+
+class PooledShooter(PooledUnit):
+    """
+    Описатель стрелка: добавляет боезапас и штраф ближнего боя
+    """
+
+    __slots__ = ()
+
+    @property
+    def ammo(self) -> int:
+        return self.pool.ammo[self.id]
+
+
+    @ammo.setter
+    def ammo(self, value: int):
+        self.pool.ammo[self.id] = value
+
+
+# Классы описателей по классам юнитов и их характеристикам
+_handle_classes: Dict[Tuple[Type[Unit], 'UnitStats'], type] = {}
+
+
+def _get_handle_class(unit_class: Type[Unit], stats: 'UnitStats') -> type:
+    """
+    Создает (один раз) класс описателя для класса юнита.
+
+    Характеристики из записи каталога становятся атрибутами класса, поэтому не занимают памяти в каждом юните.
+    Методы юнита (attack, can_attack, die, find_attack_position, ...) переносятся в описатель как есть,
+    поэтому поведение юнитов из пула ничем не отличается от обычных. Класс описателя называется так же,
+    как класс юнита, и регистрируется как его виртуальный подкласс, так что isinstance(handle, Shooter) работает.
+    Переносимые методы не должны использовать super() (кроме __init__, который не переносится)
+    :param unit_class:
+    :return:
+    """
+
+    handle_class = _handle_classes.get((unit_class, stats))
+    if handle_class is None:
+        is_shooter = issubclass(unit_class, Shooter)
+        namespace = {
+            '__slots__': (),
+            '__module__': __name__,
+            '__doc__': f"Описатель юнита {unit_class.__name__} из UnitPool",
+            'stats': stats,
+            'name': stats.name,
+            'type': stats.type,
+            'max_health': stats.health,
+            'attack_value': stats.attack,
+            'defense': stats.defense,
+            'damage_min': stats.damage_min,
+            'damage_max': stats.damage_max,
+            'speed': stats.speed,
+            'icon': stats.icon,
+            'range': stats.range,
+        }
+        if is_shooter:
+            namespace['melee_penalty'] = stats.melee_penalty
+        for klass in reversed(unit_class.__mro__):
+            if not issubclass(klass, Unit):
+                continue
+            for method_name, value in vars(klass).items():
+                if isinstance(value, FunctionType) and method_name != '__init__':
+                    namespace[method_name] = value
+
+        handle_class = type(unit_class.__name__, (PooledShooter if is_shooter else PooledUnit,), namespace)
+        unit_class.register(handle_class)
+        _handle_classes[(unit_class, stats)] = handle_class
+    return handle_class
+
+
+class UnitPool:
+    """
+    Класс пула юнитов для огромных армий
+
+    Хранит состояние юнитов в типизированных массивах по номеру юнита (здоровье, боезапас, команда, жизнь),
+    позиции - в списке (сами Position интернированы и общие), характеристики - в общих на тип классах описателей.
+    Юниты пула - описатели со __slots__ (см. PooledUnit), которые поддерживают тот же интерфейс Unit/Infantry/Shooter,
+    что используют BattleManager и BattleField, поэтому их можно подавать в бой вместо обычных юнитов
+    """
+
+    def __init__(self):
+        self.positions: List[Position] = []
+        self.health = array('i')
+        self.ammo = array('i')
+        self.team = array('i')
+        self.alive = bytearray()
+        self.handles: List[PooledUnit] = []
+        logger.info("%s initiated", self.__class__.__name__)
+
+
+    def create(self, unit_name: str, position: Position, team: Optional[int] = None) -> PooledUnit:
+        """
+        Создает юнита в пуле по ключу в JSON (как UnitFactory.create)
+
+        ValueError: если юнит не зарегистрирован или отсутствует в каталоге
+        :param unit_name:
+        :param position:
+        :param team:
+        :return: описатель юнита
+        """
+
+        from game.units.unit_factory import UnitFactory
+
+        unit_class, stats = UnitFactory.resolve(unit_name)
+        unit_id = len(self.handles)
+
+        self.positions.append(position)
+        self.health.append(stats.health)
+        self.ammo.append(stats.ammo)
+        self.team.append(_NO_TEAM if team is None else team)
+        self.alive.append(1)
+
+        handle = _get_handle_class(unit_class, stats)(self, unit_id)
+        self.handles.append(handle)
+        return handle
+
+
+    def __len__(self) -> int:
+        return len(self.handles)
+
+
+    def __getitem__(self, unit_id: int) -> PooledUnit:
+        return self.handles[unit_id]
+
+
+    def __iter__(self) -> Iterator[PooledUnit]:
+        return iter(self.handles)
+
+
+    def get_alive_units(self) -> List[PooledUnit]:
+        """
+        Все живые юниты пула
+        :return:
+        """
+
+        alive = self.alive
+        return [handle for unit_id, handle in enumerate(self.handles) if alive[unit_id]]
@@ -0,0 +1,34 @@
+import pytest
+from benchmarks.engine_equivalence import SETUPS, _chi_square_survival, _compare_histograms, check_setup
+
+
+# Серии с фиксированным сидом воспроизводимы, поэтому проверка не мигает от запуска к запуску
+SEED = 0
+BATTLES = 2000
+Z = 4.0
+
+
+@pytest.mark.parametrize(
+    'unit_setups, field_size, max_turns', SETUPS,
+    ids=[f"{unit_setups}-{field_size}-{max_turns}" for unit_setups, field_size, max_turns in SETUPS]
+)
+def test_engines_match_each_other_and_exact_solution(unit_setups, field_size, max_turns):
+    comparisons = check_setup(unit_setups, field_size, max_turns, BATTLES, SEED, processes=1, z=Z)
+
+    mismatches = [comparison for comparison in comparisons if not comparison["ok"]]
+    assert not mismatches
+
+
+def test_chi_square_survival_matches_table():
+    # критические значения хи-квадрат для уровня 0.05
+    assert _chi_square_survival(3.841, 1) == pytest.approx(0.05, abs=1e-4)
+    assert _chi_square_survival(18.307, 10) == pytest.approx(0.05, abs=1e-4)
+    assert _chi_square_survival(0.0, 3) == 1.0
+
+
+def test_histogram_comparison_detects_shifted_distribution():
+    same = _compare_histograms('turns_histogram', {5: 500, 6: 500}, {5: 510, 6: 490}, Z)
+    shifted = _compare_histograms('turns_histogram', {5: 500, 6: 500}, {5: 700, 6: 300}, Z)
+
+    assert same["ok"]
+    assert not shifted["ok"]
@@ -0,0 +1,25 @@
+"""
+Общие разборщики аргументов командной строки инструментов баланса
+"""
+
+import argparse
+from typing import Dict
+
+
+def parse_composition(text: str) -> Dict[str, int]:
+    """
+    Разбирает состав армии юнит:количество,юнит:количество (количество по умолчанию - 1)
+
+    argparse.ArgumentTypeError: если количество не целое
+    :param text:
+    :return: {ключ юнита: количество}
+    """
+
+    composition = {}
+    for part in text.split(','):
+        unit_name, _, count = part.partition(':')
+        try:
+            composition[unit_name] = int(count) if count else 1
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'Количество юнитов должно быть целым: {part}')
+    return composition
@@ -0,0 +1,49 @@
+"""
+Подбор армии под бюджет очков (инструмент баланса): генетический алгоритм ищет состав и построение,
+которые чаще всего побеждают заданную армию противника (см. ArmyOptimizer). Цены юнитов - поле cost в units.json
+
+Запуск из корня проекта:
+    python -m tools.army_optimizer --opponent pikeman:4,archer:4 --budget 90 --time 120
+"""
+
+import argparse
+import json
+from game.manager.army_optimizer import ArmyOptimizer
+from tools.arguments import parse_composition
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--opponent', type=parse_composition, required=True, help='армия противника юнит:количество,...')
+    parser.add_argument('--budget', type=int, required=True, help='бюджет очков армии')
+    parser.add_argument('--units', nargs='+', default=None, help='из каких юнитов собирать армию (по умолчанию из всех)')
+    parser.add_argument('--width', type=int, default=30, help='ширина поля')
+    parser.add_argument('--height', type=int, default=10, help='высота поля')
+    parser.add_argument('--battles', type=int, default=20, help='боев на оценку армии')
+    parser.add_argument('--max-turns', type=int, default=100, help='ограничение ходов боя')
+    parser.add_argument('--population', type=int, default=16, help='размер популяции')
+    parser.add_argument('--time', type=float, default=60.0, help='бюджет времени поиска, секунды')
+    parser.add_argument('--generations', type=int, default=None, help='предел поколений')
+    parser.add_argument('--processes', type=int, default=None, help='число процессов')
+    parser.add_argument('--seed', type=int, default=0, help='сид поиска и боев')
+    arguments = parser.parse_args()
+
+    optimizer = ArmyOptimizer(
+        arguments.opponent,
+        arguments.budget,
+        units=arguments.units,
+        width=arguments.width,
+        height=arguments.height,
+        battles=arguments.battles,
+        max_turns=arguments.max_turns,
+        population=arguments.population,
+        time_budget=arguments.time,
+        generations=arguments.generations,
+        processes=arguments.processes,
+        seed=arguments.seed
+    )
+    print(json.dumps(optimizer.run(), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
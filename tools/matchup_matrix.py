@@ -0,0 +1,42 @@
+"""
+Матрица матчапов (инструмент баланса): вероятность победы и ожидаемая длина боя для каждой пары юнитов
+на наборе стартовых дистанций и размеров поля, с кэшем результатов (см. MatchupMatrix)
+
+Запуск из корня проекта:
+    python -m tools.matchup_matrix --distances 1 5 10 22 --field-sizes 23 --precision 0.03
+"""
+
+import argparse
+import json
+from game.manager.matchup_matrix import MatchupMatrix, MATCHUP_CACHE_FILE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--units', nargs='+', default=None, help='ключи юнитов в JSON (по умолчанию все)')
+    parser.add_argument('--distances', nargs='+', type=int, default=[1, 5, 10], help='стартовые дистанции')
+    parser.add_argument('--field-sizes', nargs='+', type=int, default=[23], help='размеры поля')
+    parser.add_argument('--processes', type=int, default=None, help='число процессов')
+    parser.add_argument('--precision', type=float, default=0.05, help='полуширина доверительного интервала')
+    parser.add_argument('--confidence', type=float, default=0.95, help='уровень доверия')
+    parser.add_argument('--max-battles', type=int, default=10000, help='предел боев на ячейку')
+    parser.add_argument('--seed', type=int, default=0, help='сид серии')
+    parser.add_argument('--no-cache', action='store_true', help='не читать и не писать кэш')
+    arguments = parser.parse_args()
+
+    matrix = MatchupMatrix(
+        units=arguments.units,
+        distances=arguments.distances,
+        field_sizes=arguments.field_sizes,
+        processes=arguments.processes,
+        precision=arguments.precision,
+        confidence=arguments.confidence,
+        max_battles=arguments.max_battles,
+        seed=arguments.seed,
+        cache_path=None if arguments.no_cache else MATCHUP_CACHE_FILE
+    )
+    print(json.dumps(matrix.run(), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Турнир армий (инструмент баланса): рейтинги Эло и Глико составов армий по круговой или швейцарской системе,
+с чекпоинтом для продолжения прерванного турнира (см. Tournament)
+
+Армии задаются строками имя=юнит:количество,юнит:количество или JSON-файлом {"имя": {"юнит": количество}}.
+
+Запуск из корня проекта:
+    python -m tools.tournament --army pikes=pikeman:6 bows=archer:6 mixed=pikeman:3,archer:3 --games 10
+    python -m tools.tournament --armies armies.json --pairing swiss --rounds 5 --processes 8
+"""
+
+import argparse
+import json
+from game.manager.tournament import Tournament, PAIRINGS, TOURNAMENT_CHECKPOINT_FILE
+from tools.arguments import parse_composition
+
+
+def _parse_army(text: str):
+    name, _, units = text.partition('=')
+    if not name or not units:
+        raise argparse.ArgumentTypeError(f'Армия задается как имя=юнит:количество,...: {text}')
+    return name, parse_composition(units)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--army', nargs='+', type=_parse_army, default=[], help='армии имя=юнит:количество,...')
+    parser.add_argument('--armies', default=None, help='JSON-файл с армиями')
+    parser.add_argument('--pairing', choices=PAIRINGS, default='round_robin', help='система турнира')
+    parser.add_argument('--rounds', type=int, default=None, help='раундов швейцарской системы')
+    parser.add_argument('--games', type=int, default=2, help='боев в матче')
+    parser.add_argument('--width', type=int, default=30, help='ширина поля')
+    parser.add_argument('--height', type=int, default=10, help='высота поля')
+    parser.add_argument('--max-turns', type=int, default=100, help='ограничение ходов боя')
+    parser.add_argument('--processes', type=int, default=None, help='число процессов')
+    parser.add_argument('--seed', type=int, default=0, help='сид турнира')
+    parser.add_argument('--checkpoint', default=str(TOURNAMENT_CHECKPOINT_FILE), help='файл чекпоинта')
+    parser.add_argument('--no-checkpoint', action='store_true', help='не читать и не писать чекпоинт')
+    arguments = parser.parse_args()
+
+    compositions = {}
+    if arguments.armies:
+        with open(arguments.armies, 'r', encoding='utf-8') as file:
+            compositions.update(json.load(file))
+    compositions.update(arguments.army)
+
+    tournament = Tournament(
+        compositions,
+        pairing=arguments.pairing,
+        rounds=arguments.rounds,
+        games_per_match=arguments.games,
+        width=arguments.width,
+        height=arguments.height,
+        max_turns=arguments.max_turns,
+        processes=arguments.processes,
+        seed=arguments.seed,
+        checkpoint_path=None if arguments.no_checkpoint else arguments.checkpoint
+    )
+    print(json.dumps(tournament.run(), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
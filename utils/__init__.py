@@ -1 +1,2 @@
-from .data_functions import *
\ No newline at end of file
+from .data_functions import *
+from .random_stream import RandomStream
\ No newline at end of file
@@ -1,25 +1,70 @@
+import os
 from json import load
+from functools import lru_cache
+from pathlib import Path
+from typing import Union
+
+
+# Папки с данными считаются от корня проекта, а не от текущей рабочей директории
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+GAME_DATA_DIR = PROJECT_ROOT / 'data' / 'game_data'
+CACHE_DIR = PROJECT_ROOT / 'data' / 'cache'
+
 
 def load_unit_data(unit_name: str) -> dict:
     """
     Загружает все данные юнита по ключу в JSON, возвращает словарь с этими данными
+
+    Для создания юнитов используется скомпилированный каталог (см. UnitCatalog), функция нужна для разовых чтений
     :param unit_name:
     :return:
     """
 
-    with open('data/game_data/units.json', 'r', encoding='utf-8') as file:
+    with open(GAME_DATA_DIR / 'units.json', 'r', encoding='utf-8') as file:
         return load(file)[unit_name]
 
 
+@lru_cache(maxsize=None)
 def load_field_data(key: str) -> str:
     """
     Загружает из JSON данные поля
     Пока что функция довольно глупая, потому что у поля особо нет данных
 
+    Результат кэшируется, чтобы не открывать файл при создании каждого поля (важно для пакетных симуляций)
+
     :param key:
     :return:
     """
 
-    with open('data/game_data/field.json', 'r', encoding='utf-8') as file:
+    with open(GAME_DATA_DIR / 'field.json', 'r', encoding='utf-8') as file:
         return load(file)[key]
 
+
+
+def write_file_atomically(path: Union[str, Path], content: Union[bytes, str]):
+    """
+    Пишет файл атомарно: через временный файл рядом и os.replace, чтобы убитый посреди записи процесс не оставил
+    битый файл, а читатели видели либо старое, либо новое содержимое.
+    Недостающие папки создаются, при ошибке временный файл удаляется, а OSError пробрасывается
+    :param path:
+    :param content: bytes пишутся как есть, str - в UTF-8
+    :return:
+    """
+
+    path = Path(path)
+    temporary_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(content, bytes):
+            with open(temporary_path, 'wb') as file:
+                file.write(content)
+        else:
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                file.write(content)
+        os.replace(temporary_path, path)
+    except OSError:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        raise
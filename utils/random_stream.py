@@ -0,0 +1,115 @@
+import random
+from typing import List, Optional
+import numpy as np
+
+
+class RandomStream:
+    """
+    Класс потока случайных чисел боя
+
+    Каждый BattleManager владеет своим потоком, поэтому бой с тем же сидом воспроизводится бит в бит
+    независимо от того, что происходит в других боях и процессах.
+
+    Числа берутся из numpy.random.Generator (PCG64) не по одному, а пачками по buffer_size
+    в заранее заполненный буфер, и randint только достает из него очередное значение.
+    Последовательность чисел от размера буфера не зависит.
+
+    Дочерние потоки (spawn, derive_seed) выводятся из сида через numpy.random.SeedSequence, поэтому потоки
+    разных процессов пула не пересекаются и не повторяются, а их сиды определяются только сидом родителя
+    """
+
+    def __init__(self, seed: Optional[int] = None, buffer_size: int = 1024):
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(63)
+        self.buffer_size = buffer_size
+        self._seed_sequence = np.random.SeedSequence(self.seed)
+        self.generator = np.random.Generator(np.random.PCG64(self._seed_sequence))
+        self._buffer: List[float] = []
+        self._position = 0
+        # состояние генератора после последнего пополнения буфера (для снимков боя)
+        self._generator_state = self.generator.bit_generator.state
+
+
+    def random(self) -> float:
+        """
+        Очередное число из [0, 1)
+        :return:
+        """
+
+        position = self._position
+        if position == len(self._buffer):
+            self._refill()
+            position = 0
+        self._position = position + 1
+        return self._buffer[position]
+
+
+    def randint(self, low: int, high: int) -> int:
+        """
+        Целое число из [low, high], включая обе границы (как random.randint)
+        :param low:
+        :param high:
+        :return:
+        """
+
+        position = self._position
+        if position == len(self._buffer):
+            self._refill()
+            position = 0
+        self._position = position + 1
+        return low + int(self._buffer[position] * (high - low + 1))
+
+
+    def _refill(self):
+        self._buffer = self.generator.random(self.buffer_size).tolist()
+        self._generator_state = self.generator.bit_generator.state
+
+
+    def get_state(self) -> tuple:
+        """
+        Состояние потока для снимка боя, снимается за O(1). Буфер не копируется: при пополнении он заменяется
+        новым списком, а не меняется на месте, поэтому снимок может ссылаться на тот же список.
+        Состояние генератора запоминается при каждом пополнении буфера, а не читается здесь
+        :return:
+        """
+
+        return self._buffer, self._position, self._generator_state
+
+
+    def set_state(self, state: tuple):
+        """
+        Возвращает поток в состояние, снятое get_state
+        :param state:
+        :return:
+        """
+
+        self._buffer, self._position, generator_state = state
+        if generator_state is not self._generator_state:
+            self.generator.bit_generator.state = generator_state
+            self._generator_state = generator_state
+
+
+    def spawn(self, count: int) -> List['RandomStream']:
+        """
+        Создает независимые дочерние потоки (например, по одному на процесс пула).
+        Повторный вызов дает новые потоки, а не те же самые
+        :param count:
+        :return:
+        """
+
+        return [
+            RandomStream(int(child.generate_state(1, np.uint64)[0]) >> 1, self.buffer_size)
+            for child in self._seed_sequence.spawn(count)
+        ]
+
+
+    @staticmethod
+    def derive_seed(seed: int, index: int) -> int:
+        """
+        Сид index-го потока серии с общим сидом. Не зависит от того, в каком процессе и в каком порядке
+        считаются бои серии, поэтому параллельные прогоны воспроизводимы
+        :param seed:
+        :param index:
+        :return:
+        """
+
+        return int(np.random.SeedSequence([seed, index]).generate_state(1, np.uint64)[0]) >> 1